@@ -112,7 +112,7 @@ def registerRepresentation(reprClass):
 def getRepresentationClass(mimeType):
     cls = representationRegistry.get(mimeType)
     if cls is None:
-        raise UnsupportedRepresentationError(mimeType)
+        raise UnsupportedRepresentationError()
     return cls
 
 
@@ -194,6 +194,21 @@ class XMLRepresentation(_Representation):
         return cls(xml.parse(string))
     fromString = classmethod(fromString)
 
+    def newParser(cls):
+        """
+        Return a parser to feed the content to as it arrives.
+        """
+        return xml.IncrementalParser()
+    newParser = classmethod(newParser)
+
+    def fromParser(cls, parser):
+        """
+        Return a C{XMLRepresentation} with the content fed to a parser
+        returned by L{newParser}.
+        """
+        return cls(parser.close())
+    fromParser = classmethod(fromParser)
+
 registerRepresentation(XMLRepresentation)
 
 
@@ -367,7 +382,16 @@ class Router(Resource, components.Componentized):
             except UnsupportedRepresentationError, e:
                 request.setResponseCode(e.responseCode)
                 return ''
-            input.append(reprClass.fromString(request.content.read()))
+            parser = getattr(request, 'contentParser', None)
+            try:
+                if parser is not None:
+                    input.append(reprClass.fromParser(parser))
+                else:
+                    input.append(reprClass.fromString(request.content.read()))
+            except SyntaxError:
+                # The content is malformed.
+                request.setResponseCode(http.BAD_REQUEST)
+                return ''
 
         doneDeferred = defer.maybeDeferred(method, *input)
         doneDeferred.addCallback(self.cbControl, request)
@@ -376,6 +400,49 @@ class Router(Resource, components.Componentized):
         return server.NOT_DONE_YET
 
 
+class Request(server.Request):
+    """
+    Request that parses its content while it is being received.
+
+    If the representation class for the content type has a
+    C{newParser} method, the content is fed to the parser it returns
+    a chunk at a time, and L{Router} makes the representation with
+    C{fromParser} instead of parsing all of the content at once.  The
+    method of the request is not known until all of the content has
+    been received, so the parser is dropped then unless the request
+    is a POST or PUT.  Install it with C{site.requestFactory =
+    Request}.
+
+    @ivar contentParser: the parser, or C{None}.
+    """
+    contentParser = None
+
+    def gotLength(self, length):
+        server.Request.gotLength(self, length)
+        try:
+            reprClass = getRepresentationClass(self.getHeader('content-type'))
+        except UnsupportedRepresentationError:
+            # Router reports it when the request is rendered.
+            return
+        if hasattr(reprClass, 'newParser'):
+            self.contentParser = reprClass.newParser()
+
+    def handleContentChunk(self, data):
+        server.Request.handleContentChunk(self, data)
+        if self.contentParser is not None:
+            try:
+                self.contentParser.feed(data)
+            except SyntaxError:
+                # Leave it to fromString() to report the error, as
+                # without a parser.
+                self.contentParser = None
+
+    def requestReceived(self, command, path, version):
+        if command not in ('POST', 'PUT'):
+            self.contentParser = None
+        server.Request.requestReceived(self, command, path, version)
+
+
 def _clientRequest(url, postdata, method, headers, timeout):
     """
     Integration function to the crappy client-interface of
@@ -0,0 +1,80 @@
+#
+# edgy.test.test_rest
+#
+# Copyright (C) 2008 Edgeware AB.
+#
+
+from twisted.test.proto_helpers import StringTransport
+from twisted.web import http, server
+
+from edgy.rest import Controller, Router, Request
+
+received = []
+
+class _RecordingController(Controller):
+    # Records how the content of each request reached it.
+
+    def get(self):
+        received.append(('GET', self._request.contentParser, None))
+        return http.OK, None
+
+    def post(self, input):
+        received.append(('POST', self._request.contentParser,
+                         input.element))
+        return http.OK, None
+
+router = Router()
+router.addController('record', _RecordingController)
+site = server.Site(router)
+site.requestFactory = Request
+
+def request(method, content):
+    """
+    Send a request with XML C{content} to the recording controller
+    through an HTTP channel, and return the status code of the
+    response.
+    """
+    transport = StringTransport()
+    channel = site.buildProtocol(None)
+    channel.makeConnection(transport)
+    channel.dataReceived(
+        "%s /record HTTP/1.0\r\n"
+        "Content-Type: text/xml\r\n"
+        "Content-Length: %d\r\n"
+        "\r\n" % (method, len(content)))
+    # Send the content in pieces, as it would arrive.
+    for i in range(0, len(content), 7):
+        channel.dataReceived(content[i:i + 7])
+    return int(transport.value().split()[1])
+
+def test_request():
+    """
+    The content of a POST is parsed as it arrives, and the controller
+    gets the document the parser built.
+
+    >>> request('POST', "<doc><a n='1'/><a n='2'/></doc>")
+    200
+    >>> method, parser, element = received.pop()
+    >>> method, parser is not None, [a.get('n') for a in element]
+    ('POST', True, ['1', '2'])
+
+    Other requests are given no parser.
+
+    >>> request('GET', "<doc/>"), received.pop()
+    (200, ('GET', None, None))
+
+    Malformed content is reported as a bad request, whether the
+    parser fails while the content arrives or when it is closed.
+
+    >>> request('POST', "<doc><a></b></doc>"), received
+    (400, [])
+    >>> request('POST', "<doc><a/>"), received
+    (400, [])
+    """
+
+def _test():
+    import doctest
+    doctest.testmod()
+
+if __name__ == "__main__":
+    _test()
@@ -3,7 +3,7 @@
 
 from edgy.xml.element import Element
 from edgy.xml.xmlbuilder import QName, Namespace, LocalNamespace
-from edgy.xml.parser import parse, simpleParse
+from edgy.xml.parser import parse, simpleParse, IncrementalParser
 from edgy.xml.pretty import tostring, pretty_print
 from edgy.xml.utils import (findtext, find, findall,
                             findAndRemove, splitTag,
@@ -0,0 +1,45 @@
+# Copyright (C) 2008 Edgeware AB.
+
+"""Benchmark comparing the parser backends on small and large
+documents.
+
+Run with "python -m edgy.xml.bench_parser".
+"""
+
+from timeit import Timer
+
+from edgy.xml import parser
+from edgy.xml.benchdoc import make_document
+
+
+documents = [
+    ("small", '<asset id="a1" type="movie"><title>Up</title>'
+     '<rating>4</rating><src href="http://example.com/up.mp4"/></asset>'),
+    ("medium", make_document(3, 8)),
+    ("large", make_document(5, 10)),
+    ]
+
+
+def bench(text, number):
+    result = []
+    for backend in ("python", "c"):
+        parser.backend = backend
+        timer = Timer(lambda: parser.parse(text))
+        result.append(min(timer.repeat(3, number)) / number)
+    return result
+
+
+def main():
+    saved = parser.backend
+    try:
+        for name, text in documents:
+            number = max(1, 100000 / len(text))
+            python, c = bench(text, number)
+            print "%-6s %9d bytes: %10.3f ms python, %10.3f ms c, %5.1fx" % (
+                name, len(text), python * 1e3, c * 1e3, python / c)
+    finally:
+        parser.backend = saved
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+#
+# edgy.xml.benchdoc
+#
+# Copyright (C) 2008 Edgeware AB.
+#
+
+"""
+Generated documents shared by the benchmarks of edgy.xml and
+edgy.xml.xpath
+"""
+
+def make_document(depth, fanout):
+    """
+    Return the text of a document whose document element has fanout
+    children, each of which has fanout children, and so on down to
+    depth levels.
+
+    The elements at each level are named after it ("l1", "l2" and so
+    on), alternate between the classes "odd" and "even", and are
+    numbered in document order by their n attribute.  The elements
+    above the bottom level start with a title element, and those at the
+    bottom level contain their number as text.
+    """
+    parts = []
+    counter = [0]
+    def make(level):
+        counter[0] += 1
+        n = counter[0]
+        tag = "l%d" % level
+        parts.append('<%s n="%d" class="%s">' % (
+            tag, n, ("even", "odd")[n % 2]))
+        if level == depth:
+            parts.append("%d" % n)
+        else:
+            parts.append("<title>title %d</title>" % n)
+            for i in range(fanout):
+                make(level + 1)
+        parts.append("</%s>" % tag)
+    parts.append("<doc>")
+    for i in range(fanout):
+        make(1)
+    parts.append("</doc>")
+    return "".join(parts)
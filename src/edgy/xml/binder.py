@@ -41,7 +41,13 @@ class Binder:
         self.aliases[modelAttribute] = tagName
 
     def consumeModelAttribute(self, mas, attribute_name):
-        attribute_name = self.aliases.get(mas, attribute_name)
+        # aliases map model attributes to tag names, so find the
+        # model attribute that the tag name is an alias for.
+        for model_attribute, tagName in self.aliases.iteritems():
+            if tagName == attribute_name \
+                    and mas.get(model_attribute.name) is model_attribute:
+                attribute_name = model_attribute.name
+                break
         model_attribute = mas.get(attribute_name, None)
         if model_attribute is None:
             raise SchemaMissmatch(attribute_name)
@@ -137,13 +143,16 @@ class Binder:
         raise MissingBinding(element.tag)
         
 
-    def _serializeObject(self, schema, element, obj):
+    def _attributeValues(self, schema, obj):
+        """
+        Generate (name, text) for the XML attributes of C{obj}, as
+        described by C{schema}.
+        """
         # build a map of model attributues, index by the attribute
         # name: as attributes are consumed they are removed from the
         # map.
         mas = self._gatherModelAttributes(obj)
 
-        # attributes:
         for attributeNode in schema.attributes:
             model_attribute = self.consumeModelAttribute(mas, 
                 stripTag(attributeNode.name))
@@ -155,10 +164,19 @@ class Binder:
             converter = self.getConverter(model_attribute)
             if converter:
                 attribute_value = converter.convertFrom(attribute_value)
-            element.set(attributeNode.name,
-                attributeNode.type.setTypedValue(attribute_value, None))
+            yield (attributeNode.name,
+                   attributeNode.type.setTypedValue(attribute_value, None))
+
+    def _elementValues(self, schema, obj):
+        """
+        Generate (elementNode, model_attribute, value) for the model
+        attributes of C{obj} that are XML elements according to
+        C{schema}.
+        """
+        mas = self._gatherModelAttributes(obj)
+        for attributeNode in schema.attributes:
+            self.consumeModelAttribute(mas, stripTag(attributeNode.name))
 
-        # elements:
         for elementNode in schema.elements:
             model_attribute = self.consumeModelAttribute(mas, 
                 stripTag(elementNode.name))
@@ -170,7 +188,16 @@ class Binder:
             converter = self.getConverter(model_attribute)
             if converter:
                 attribute_value = converter.convertFrom(attribute_value)
+            yield elementNode, model_attribute, attribute_value
+
+    def _serializeObject(self, schema, element, obj):
+        # attributes:
+        for name, text in self._attributeValues(schema, obj):
+            element.set(name, text)
 
+        # elements:
+        for elementNode, model_attribute, attribute_value in \
+                self._elementValues(schema, obj):
             if isinstance(elementNode, Leaf):
                 subelement = elementNode.name(
                     elementNode.type.setTypedValue(attribute_value, None))
@@ -216,6 +243,24 @@ class Binder:
                 return self._toElement(binding, modelObj)
         raise MissingBinding(modelClass)
 
+    def toNode(self, modelObj):
+        """
+        Present model object C{modelObj} as a read-only element that
+        XPath expressions can be evaluated against, without building
+        its XML element.
+
+        The attributes and children of the node are the same as those
+        of the element C{toElement} would return, but are computed
+        from the model object when they are first looked at.
+
+        @rtype: C{ModelNode}
+        """
+        modelClass = modelObj.__class__
+        for binding in self.bindings:
+            if binding.modelClass is modelClass:
+                return ModelNode(self, binding.documentElement, modelObj)
+        raise MissingBinding(modelClass)
+
     def bind(self, documentNode, modelClass):
         binding = Binding(documentNode, modelClass)
         self.bindings.append(binding)
@@ -226,6 +271,104 @@ class Binder:
 
 
 
+class ValueNode(object):
+    """
+    Element holding the text of a leaf in a C{ModelNode} tree.
+    """
+    tail = None
+
+    def __init__(self, tag, text, parent):
+        self.tag = tag
+        self.text = text
+        self.parent = parent
+
+    def get(self, key, default=None):
+        return default
+
+    def __len__(self):
+        return 0
+
+    def __iter__(self):
+        return iter(())
+
+    def __getitem__(self, index):
+        raise IndexError(index)
+
+
+class ModelNode(object):
+    """
+    Read-only element presenting a model object through the schema
+    node of its binding.
+
+    It has the parts of the element interface that XPath evaluation
+    uses (see the data_model module of C{edgy.xml.xpath}): C{tag},
+    C{text}, C{tail}, C{parent}, C{get}, C{index}, iteration,
+    C{len} and indexing of the children.  The attributes and
+    children are converted from the model object on first use.
+    Model objects referred to through C{Sequence} and C{Reference}
+    attributes become C{ModelNode} children in turn.
+    """
+    text = None
+    tail = None
+
+    def __init__(self, binder, schema, obj, parent=None):
+        self.tag = schema.name
+        self.parent = parent
+        self.obj = obj
+        self._binder = binder
+        self._schema = schema
+        self._attrib = None
+        self._children = None
+
+    def _getAttrib(self):
+        if self._attrib is None:
+            self._attrib = dict(
+                self._binder._attributeValues(self._schema, self.obj))
+        return self._attrib
+
+    attrib = property(_getAttrib)
+
+    def get(self, key, default=None):
+        return self.attrib.get(key, default)
+
+    def _getChildren(self):
+        if self._children is not None:
+            return self._children
+        children = []
+        for elementNode, model_attribute, value in \
+                self._binder._elementValues(self._schema, self.obj):
+            if isinstance(elementNode, Leaf):
+                children.append(ValueNode(elementNode.name,
+                    elementNode.type.setTypedValue(value, None), self))
+            elif isinstance(elementNode, LeafList):
+                for item in value:
+                    children.append(ValueNode(elementNode.name,
+                        elementNode.type.setTypedValue(item, None), self))
+            elif isinstance(elementNode, Container):
+                if isinstance(model_attribute, Reference):
+                    if not type(value) in (list, tuple):
+                        value = [value]
+                elif not isinstance(model_attribute, Sequence):
+                    continue
+                for item in value:
+                    children.append(ModelNode(self._binder, elementNode,
+                                              item, self))
+        self._children = children
+        return children
+
+    def __len__(self):
+        return len(self._getChildren())
+
+    def __iter__(self):
+        return iter(self._getChildren())
+
+    def __getitem__(self, index):
+        return self._getChildren()[index]
+
+    def index(self, element):
+        return self._getChildren().index(element)
+
+
 global_binder = Binder()
 
 # NS = Namespace("http://www.edgeware.tv/xmlns/cms/1.0", "cms")
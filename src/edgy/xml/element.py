@@ -10,10 +10,115 @@ except ImportError:
     from elementtree.ElementTree import (iselement, QName, _namespace_map, 
                                          _escape_cdata)
 
+# The distance between the ordinals of consecutive elements when a
+# whole tree is numbered in document order.
+_orderGap = 1 << 16
+
+
+class Attributes(dict):
+    """Attribute dictionary of an element, which notes that the
+    element has been modified whenever it is changed.
+    """
+
+    def __init__(self, element, attrib=()):
+        dict.__init__(self, attrib)
+        self._element = element
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        self._element.modified()
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self._element.modified()
+
+    def clear(self):
+        dict.clear(self)
+        self._element.modified()
+
+    def pop(self, *args):
+        value = dict.pop(self, *args)
+        self._element.modified()
+        return value
+
+    def popitem(self):
+        item = dict.popitem(self)
+        self._element.modified()
+        return item
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        dict.update(self, *args, **kwargs)
+        self._element.modified()
+
+
 class Element(ET._ElementInterface):
     """Element interface.
     """
 
+    _documentCache = None
+    parent = None
+
+    # The document order of a tree, kept on its root element, and the
+    # elements whose children changed since it was last brought up to
+    # date.  See getDocumentOrder().
+    _documentOrder = None
+    _orderPending = None
+
+    # Maps the id() of each child to its index, when asked for.
+    _childIndex = None
+
+    # The string value of the element and that value converted to a
+    # number, as computed by the XPath code, and cleared by modified()
+    # on the element and all its ancestors.
+    _stringValue = None
+    _numberValue = None
+
+    _tag = None
+    _attrib = None
+    _text = None
+    _tail = None
+
+    def _getTag(self):
+        return self._tag
+
+    def _setTag(self, tag):
+        self._tag = tag
+        self.modified()
+
+    tag = property(_getTag, _setTag)
+
+    def _getAttrib(self):
+        return self._attrib
+
+    def _setAttrib(self, attrib):
+        self._attrib = Attributes(self, attrib)
+        self.modified()
+
+    attrib = property(_getAttrib, _setAttrib)
+
+    def _getText(self):
+        return self._text
+
+    def _setText(self, text):
+        self._text = text
+        self.modified()
+
+    text = property(_getText, _setText)
+
+    def _getTail(self):
+        return self._tail
+
+    def _setTail(self, tail):
+        self._tail = tail
+        self.modified()
+
+    tail = property(_getTail, _setTail)
+
     def __init__(self, tag, attrib=None):
         if attrib is None:
             attrib = dict()
@@ -30,24 +135,270 @@ class Element(ET._ElementInterface):
         """
         ET._ElementInterface.append(self, element)
         self.adapt(element)
+        self._childrenModified()
+
+    def extend(self, elements):
+        """Append elements to this.
+        """
+        for element in elements:
+            ET._ElementInterface.append(self, element)
+            self.adapt(element)
+        self._childrenModified()
 
     def index(self, element):
-        return self._children.index(element)
+        # The positions of the children are looked up in a dictionary,
+        # made when first needed and dropped when the children change,
+        # so that the sibling axes do not search the children for
+        # every node.
+        positions = self._childIndex
+        if positions is None:
+            positions = self._childIndex = {}
+            children = self._children
+            for i in xrange(len(children) - 1, -1, -1):
+                positions[id(children[i])] = i
+        position = positions.get(id(element))
+        if position is None:
+            return self._children.index(element)
+        return position
 
     def insert(self, index, element):
         ET._ElementInterface.insert(self, index, element)
         self.adapt(element)
+        self._childrenModified()
+
+    def __setitem__(self, index, element):
+        if isinstance(index, slice):
+            removed = self._children[index]
+            added = element = list(element)
+        else:
+            removed = [self._children[index]]
+            added = [element]
+        for child in removed:
+            child.setParent(None)
+        self._children[index] = element
+        for child in added:
+            self.adapt(child)
+        self._childrenModified()
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            removed = self._children[index]
+        else:
+            removed = [self._children[index]]
+        for child in removed:
+            child.setParent(None)
+        del self._children[index]
+        self._childrenModified()
 
     def __setslice__(self, start, stop, elements):
-        ET._ElementInterface.__setslice__(self, start, stop, elements)
-        for element in elements:
-            self.adapt(element)
+        self.__setitem__(slice(start, stop), elements)
+
+    def __delslice__(self, start, stop):
+        self.__delitem__(slice(start, stop))
+
+    def clear(self):
+        for child in self._children:
+            child.setParent(None)
+        dict.clear(self._attrib)
+        self._children = []
+        self._text = self._tail = None
+        self._childrenModified()
 
     def remove(self, element):
         ET._ElementInterface.remove(self, element)
         element.setParent(None)
+        self._childrenModified()
 
     def setParent(self, element):
         """Set parent of this element.
         """
+        if self.parent is not None:
+            order = self.getRoot()._documentOrder
+            if order is not None:
+                _forgetOrder(self, order)
         self.parent = element
+        # Whatever was cached about the tree this element used to
+        # be the root of no longer applies.
+        self._documentCache = None
+        self._documentOrder = self._orderPending = None
+
+    def getRoot(self):
+        """Return the top-most element of the tree this element
+        belongs to.
+        """
+        element = self
+        while element.parent is not None:
+            element = element.parent
+        return element
+
+    def getDocumentCache(self):
+        """Return a dictionary for information derived from the whole
+        tree this element belongs to, such as indexes.
+
+        The dictionary is discarded as soon as the tree is modified
+        through the methods of this class, by changing the attrib
+        dictionary of an element, or by assigning to the tag, attrib,
+        text or tail of an element.
+        """
+        root = self.getRoot()
+        if root._documentCache is None:
+            root._documentCache = {}
+        return root._documentCache
+
+    def getDocumentOrder(self):
+        """Return a dictionary mapping the id() of every element in
+        the tree this element belongs to to its ordinal, a number
+        that is larger for elements later in document order.
+
+        The dictionary is kept on the root element and follows
+        changes to the tree instead of being discarded with the
+        document cache.  Only changes to the children of elements
+        affect it: removed elements are taken out of it at once, and
+        added elements are numbered, when it is next asked for, in the
+        gap between the ordinals of the elements before and after
+        them.  The whole tree is numbered again only when a gap is
+        too small.
+        """
+        root = self.getRoot()
+        if root._documentOrder is None:
+            root._numberTree()
+        elif root._orderPending:
+            root._numberPending()
+        return root._documentOrder
+
+    def _numberTree(self):
+        order = {}
+        ordinal = 0
+        stack = [self]
+        while stack:
+            element = stack.pop()
+            order[id(element)] = ordinal
+            ordinal += _orderGap
+            children = element._children
+            for i in xrange(len(children) - 1, -1, -1):
+                stack.append(children[i])
+        self._documentOrder = order
+        self._orderPending = {}
+
+    def _numberPending(self):
+        order = self._documentOrder
+        pending = self._orderPending.values()
+        self._orderPending = {}
+        for parent in pending:
+            # Parents that have left the tree are no longer numbered,
+            # nor are parents added with their children since.
+            if id(parent) not in order:
+                continue
+            children = parent._children
+            i = 0
+            while i < len(children):
+                if id(children[i]) in order:
+                    i += 1
+                    continue
+                j = i + 1
+                while j < len(children) and id(children[j]) not in order:
+                    j += 1
+                if not self._numberRun(parent, i, j):
+                    self._numberTree()
+                    return
+                i = j
+
+    def _numberRun(self, parent, start, stop):
+        # Number the children of parent from start to stop, which are
+        # not numbered, and their descendants, between the elements
+        # before and after them.  Return false if there is no room.
+        order = self._documentOrder
+        children = parent._children
+        lower = order[id(parent)]
+        for i in xrange(start - 1, -1, -1):
+            if id(children[i]) in order:
+                lower = _getLastOrdinal(children[i], order)
+                break
+
+        upper = None
+        element, siblings, i = parent, children, stop
+        while upper is None:
+            for i in xrange(i, len(siblings)):
+                if id(siblings[i]) in order:
+                    upper = order[id(siblings[i])]
+                    break
+            else:
+                if element is self:
+                    break
+                siblings = element.parent._children
+                i = element.parent.index(element) + 1
+                element = element.parent
+
+        elements = []
+        stack = []
+        for i in xrange(stop - 1, start - 1, -1):
+            stack.append(children[i])
+        while stack:
+            element = stack.pop()
+            elements.append(element)
+            descendants = element._children
+            for i in xrange(len(descendants) - 1, -1, -1):
+                stack.append(descendants[i])
+        if upper is None:
+            step = _orderGap
+        else:
+            step = (upper - lower) // (len(elements) + 1)
+            if step == 0:
+                return False
+        for element in elements:
+            lower += step
+            order[id(element)] = lower
+        return True
+
+    def modified(self):
+        """Note that the tree this element belongs to has been
+        modified.
+
+        This clears the cached string values of the element and its
+        ancestors, along with the document cache.
+        """
+        self._modified()
+
+    def _modified(self):
+        # Do what modified() does, and return the root element.
+        element = self
+        while True:
+            element._stringValue = None
+            element._numberValue = None
+            if element.parent is None:
+                break
+            element = element.parent
+        element._documentCache = None
+        return element
+
+    def _childrenModified(self):
+        # Note that children were added or removed.
+        self._childIndex = None
+        root = self._modified()
+        if root._documentOrder is not None:
+            root._orderPending[id(self)] = self
+
+
+def _getLastOrdinal(element, order):
+    # Return the ordinal of the last numbered element, in document
+    # order, of the numbered element and its descendants.
+    while True:
+        children = element._children
+        for i in xrange(len(children) - 1, -1, -1):
+            if id(children[i]) in order:
+                element = children[i]
+                break
+        else:
+            return order[id(element)]
+
+
+def _forgetOrder(element, order):
+    # Take an element that leaves the tree and its descendants out of
+    # the document order.  Elements that are not numbered have no
+    # numbered descendants.
+    stack = [element]
+    while stack:
+        element = stack.pop()
+        if id(element) in order:
+            del order[id(element)]
+            stack.extend(element._children)
@@ -2,16 +2,31 @@
 # Written by Johan Rydberg.
 
 """Custom parser that create Elements of our kind.
+
+Two backends are available, both of which build the tree with an
+ElementBuilder.  The "python" backend drives the pure-Python
+XMLTreeBuilder, and the "c" backend the XMLParser of cElementTree,
+which builds the same tree several times faster.  Set the module
+variable "backend" to choose one; it defaults to "c" when cElementTree
+is available.  Both raise the ParseError of ElementTree for malformed
+documents.
+
+IncrementalParser parses a document that arrives in pieces, such as
+the body of a request, as the pieces arrive.
 """
 
 try:
-    from xml.etree.ElementTree import (TreeBuilder, XMLTreeBuilder,
-                                       parse as elementTreeParse)
+    from xml.etree.ElementTree import TreeBuilder, XMLTreeBuilder
+except ImportError:
+    from elementtree.ElementTree import TreeBuilder, XMLTreeBuilder
+try:
+    # Versions of cElementTree before Python 2.7 lack ParseError.
+    from xml.etree import cElementTree
+    from xml.etree.ElementTree import ParseError
 except ImportError:
-    from elementtree.ElementTree import (TreeBuilder, XMLTreeBuilder,
-                                         parse as elementTreeParse)
-from edgy.xml.element import Element
-from cStringIO import StringIO
+    cElementTree = None
+from xml.parsers import expat
+from edgy.xml.element import Element, Attributes
 
 
 class CustomTreeBuilder(TreeBuilder):
@@ -23,13 +38,132 @@ class CustomTreeBuilder(TreeBuilder):
         TreeBuilder.__init__(self, Element)
 
 
+_new = object.__new__
+
+
+class ElementBuilder(object):
+    """Parser target that builds a tree of our Elements.
+
+    It does what CustomTreeBuilder does, but links the elements and
+    sets their text directly instead of through append() and the
+    text and tail properties, which would note every change all the
+    way up to the root, since nothing can have been cached about a
+    tree that is still being built.
+    """
+
+    def __init__(self):
+        self._root = None
+        self._stack = []
+        self._data = []
+        self._last = None
+        self._tail = False      # Whether data is the tail of _last.
+
+    def _flush(self):
+        if self._data:
+            text = "".join(self._data)
+            if self._tail:
+                self._last._tail = text
+            else:
+                self._last._text = text
+            self._data = []
+
+    def start(self, tag, attrib):
+        self._flush()
+        # Element.__init__ would copy the attributes, which are in a
+        # new dictionary already.
+        element = _new(Element)
+        element._tag = tag
+        element._attrib = Attributes(element, attrib)
+        element._children = []
+        if self._stack:
+            parent = self._stack[-1]
+            parent._children.append(element)
+            element.parent = parent
+        else:
+            self._root = element
+        self._stack.append(element)
+        self._last = element
+        self._tail = False
+        return element
+
+    def end(self, tag):
+        self._flush()
+        self._last = self._stack.pop()
+        self._tail = True
+        return self._last
+
+    def data(self, data):
+        self._data.append(data)
+
+    def close(self):
+        return self._root
+
+
+if cElementTree is not None:
+    backend = "c"
+else:
+    backend = "python"
+
+
 def parse(source):
     """Parse elements.
     """
-    parser = XMLTreeBuilder(target=CustomTreeBuilder())
-    return elementTreeParse(StringIO(source), parser).getroot()
+    parser = IncrementalParser()
+    parser.feed(source)
+    return parser.close()
 
 
-simpleParse = parse
+class IncrementalParser(object):
+    """Parser that is given a document a piece at a time.
+
+    Call feed() with each piece as it arrives, and close() after the
+    last one to get the document element.  The tree is built while
+    the pieces are fed, so little work is left for close().
+    """
+
+    def __init__(self):
+        if backend == "c":
+            self._parser = cElementTree.XMLParser(target=ElementBuilder())
+        else:
+            self._parser = XMLTreeBuilder(target=ElementBuilder())
 
+    def feed(self, data):
+        """Parse the next piece of the document.
+        """
+        _call(self._parser.feed, data)
 
+    def close(self):
+        """Finish parsing the document, and return its element.
+        """
+        return _call(self._parser.close)
+
+
+def _call(function, *args):
+    try:
+        return function(*args)
+    except SyntaxError, e:
+        if cElementTree is None or not isinstance(e, cElementTree.ParseError):
+            raise
+        # Raise the same exception as the python backend.
+        error = ParseError(str(e))
+        error.code = _getErrorCode(str(e))
+        error.position = e.position
+        raise error
+
+
+_errorCodes = None
+
+def _getErrorCode(message):
+    # The C parser does not give the expat error code, so find it
+    # from the error message.
+    global _errorCodes
+    if _errorCodes is None:
+        _errorCodes = {}
+        for code in range(1, 100):
+            text = expat.ErrorString(code)
+            if text:
+                _errorCodes[text] = code
+    return _errorCodes.get(message.split(":")[0])
+
+
+simpleParse = parse
@@ -0,0 +1,103 @@
+#
+# edgy.xml.test.test_binder
+#
+# Copyright (C) 2008 Edgeware AB.
+#
+
+from edgy.model import Model, String, Integer, Sequence, Reference
+from edgy.xml import schema
+from edgy.xml.binder import Binder
+from edgy.xml.xpath import XPath
+
+class _ClipNode(schema.Container):
+    attributes = (
+        schema.Attribute('src', schema.StrType()),
+        schema.Attribute('length', schema.IntType()),
+        )
+    elements = (
+        schema.Leaf('title', schema.StrType()),
+        )
+
+class _PlaylistNode(schema.Container):
+    attributes = (
+        schema.Attribute('id', schema.StrType()),
+        )
+    elements = (
+        schema.Leaf('name', schema.StrType()),
+        schema.LeafList('tag', schema.StrType()),
+        _ClipNode('clip'),
+        _ClipNode('intro'),
+        )
+
+class Clip(Model):
+    src = String()
+    length = Integer()
+    title = String(optional=True)
+
+class Playlist(Model):
+    id = String()
+    name = String()
+    tag = Sequence(String)
+    clip = Sequence(Clip)
+    intro = Reference(Clip)
+
+binder = Binder()
+binder.bind(_PlaylistNode('playlist'), Playlist)
+
+def describe(node):
+    if isinstance(node, basestring):
+        return node
+    return str(node.tag), node.text, node.get('src')
+
+def test_model_node():
+    """
+    Expressions select the same nodes and values from the node that
+    toNode() presents a model object as as from the element that
+    toElement() turns it into.
+
+    >>> playlist = Playlist(id='p', name='Mix', tag=['a', 'b'],
+    ...     clip=[Clip(src='x', length=10, title='X'),
+    ...           Clip(src='y', length=20)],
+    ...     intro=Clip(src='i', length=5, title='I'))
+    >>> node = binder.toNode(playlist)
+    >>> element = binder.toElement(playlist)
+    >>> def evaluate(path):
+    ...     xpath = XPath(path)
+    ...     result = xpath.evaluate(node)
+    ...     expected = xpath.evaluate(element)
+    ...     if isinstance(result, list):
+    ...         result = map(describe, result)
+    ...         expected = map(describe, expected)
+    ...     assert result == expected, (result, expected)
+    ...     return result
+
+    Attributes:
+
+    >>> evaluate("/playlist/@id"), evaluate("sum(//@length)")
+    (['p'], 35.0)
+    >>> evaluate("/playlist/clip[@length > 15]/@src")
+    ['y']
+
+    Leaves and leaf lists:
+
+    >>> evaluate("/playlist/name/text()"), evaluate("/playlist/tag")
+    (['Mix'], [('tag', 'a', None), ('tag', 'b', None)])
+    >>> evaluate("/playlist/tag[2] = 'b'"), evaluate("string(/playlist)")
+    (True, 'MixabXI')
+
+    Nested containers from sequences and references:
+
+    >>> evaluate("/playlist/clip[not(title)]/following-sibling::*")
+    [('intro', None, 'i')]
+    >>> evaluate("//title/../@src"), evaluate("count(/playlist/*)")
+    (['x', 'i'], 6.0)
+    >>> evaluate("/playlist/intro/title/text()")
+    ['I']
+    """
+
+def _test():
+    import doctest
+    doctest.testmod()
+
+if __name__ == "__main__":
+    _test()
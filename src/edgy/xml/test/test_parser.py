@@ -0,0 +1,82 @@
+#
+# edgy.xml.test.test_parser
+#
+# Copyright (C) 2008 Edgeware AB.
+#
+
+from edgy.xml import parser, parse, IncrementalParser
+
+catalog = """<catalog xmlns:x='urn:x'>
+<product id='1' status='active'><name>A</name><price>5</price></product>
+<group>
+ <product id='2' status='old'><name>B</name><price>15</price></product>
+ <product id='3' status='active'><name>C</name><price>25</price>
+  <product id='4' status='active'><name>D</name></product>
+ </product>
+</group>
+<x:product id='5'/>
+<product id='6'/>
+</catalog>"""
+
+def dump(element):
+    return (element.tag, sorted(element.items()), element.text,
+            element.tail, [dump(x) for x in element],
+            [x.parent is element for x in element])
+
+def test_backends():
+    """
+    Both parser backends build the same tree of linked elements, and
+    raise the same errors.
+
+    >>> trees = []
+    >>> errors = []
+    >>> saved = parser.backend
+    >>> try:
+    ...     for backend in ["python", "c"]:
+    ...         parser.backend = backend
+    ...         trees.append(dump(parse(catalog)))
+    ...         try:
+    ...             parse("<a><b></a>")
+    ...         except SyntaxError, e:
+    ...             errors.append((e.__class__, str(e), e.code, e.position))
+    ... finally:
+    ...     parser.backend = saved
+    >>> trees[0] == trees[1], errors[0] == errors[1]
+    (True, True)
+    >>> errors[1][1:]
+    ('mismatched tag: line 1, column 8', 7, (1, 8))
+    >>> parse("<a>x<b/>y</a>").find("b").parent.tag
+    'a'
+    """
+
+def test_incremental():
+    """
+    An IncrementalParser takes the document a piece at a time.
+
+    >>> expected = dump(parse(catalog))
+    >>> saved = parser.backend
+    >>> try:
+    ...     for backend in ["python", "c"]:
+    ...         parser.backend = backend
+    ...         incremental = IncrementalParser()
+    ...         for i in range(0, len(catalog), 7):
+    ...             incremental.feed(catalog[i:i + 7])
+    ...         print dump(incremental.close()) == expected
+    ... finally:
+    ...     parser.backend = saved
+    True
+    True
+    >>> incremental = IncrementalParser()
+    >>> incremental.feed("<a><b>")
+    >>> incremental.feed("</a>")
+    Traceback (most recent call last):
+    ...
+    ParseError: mismatched tag: line 1, column 8
+    """
+
+def _test():
+    import doctest
+    doctest.testmod()
+
+if __name__ == "__main__":
+    _test()
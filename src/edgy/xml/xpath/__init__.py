@@ -33,52 +33,180 @@ Most applications need only import this file with "import pdis.xpath"
 or "from pdis.xpath import ...".
 """
 
+from collections import OrderedDict
+
 from edgy.xml.xpath.parser import parse_xpath
+from edgy.xml.xpath.optimizer import optimize
+from edgy.xml.xpath.compiler import compile_expression
+from edgy.xml.xpath.sharing import PathTrie
+from edgy.xml.xpath.profiler import Profiler
+from edgy.xml.xpath.serialize import save_trees, load_trees
+from edgy.xml.xpath.stream import StreamingXPath, iterfind
+from edgy.xml.xpath.corpus import Corpus
+from edgy.xml.xpath.functions import register_function, unregister_function
 from edgy.xml.xpath.context import Context
-from edgy.xml.xpath.data_model import is_node_set
+from edgy.xml.xpath.data_model import is_node_set, NodeSet
+from edgy.xml.xpath.evaluate import make_variables
 from edgy.xml.xpath.xpath_exceptions import *
 
 from edgy.xml import parse
 
-def evaluate(xpath, document):
+def evaluate(xpath, document, variables = None):
     element = parse(document)
-    return compile(xpath).evaluate(element)
+    return compile(xpath).evaluate(element, variables = variables)
+
+class XPathCache:
+    """
+    Least recently used cache of compiled expressions
+
+    Expressions are keyed by their text together with their namespace
+    mapping.  The cache keeps counts of hits, misses and evictions,
+    which info() reports.
+
+    The syntax trees of the expressions can be saved to a file with
+    save() and loaded in another process with load(), which then only
+    has to compile them.  Loaded trees are kept until clear() is
+    called, whether or not they are used.
+    """
+    def __init__(self, size = 100):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._trees = {}                # Loaded syntax trees by text.
 
-_cache = {}
+    def get(self, xpath, namespace_mapping = None):
+        """
+        Return the compiled form of xpath, compiling it if necessary.
+        """
+        if namespace_mapping:
+            key = (xpath, frozenset(namespace_mapping.iteritems()))
+        else:
+            key = (xpath, None)
+
+        p = self._entries.pop(key, None)
+        if p is None:
+            self.misses += 1
+            if namespace_mapping:
+                # Take a copy, so that the cached expression does not
+                # change behind our back.
+                namespace_mapping = dict(namespace_mapping)
+            p = XPath(xpath, namespace_mapping, self._trees.get(xpath))
+        else:
+            self.hits += 1
+        self._entries[key] = p
+        self._evict()
+        return p
+
+    def resize(self, size):
+        """
+        Change the number of expressions the cache can hold.
+        """
+        self.size = size
+        self._evict()
+
+    def clear(self):
+        self._entries.clear()
+        self._trees.clear()
+
+    def save(self, file):
+        """
+        Write the syntax trees of the cached and loaded expressions to
+        a file, which can be a file name or a file object.
+        """
+        trees = dict(self._trees)
+        for p in self._entries.itervalues():
+            trees[p.xpath] = p.parsed_xpath
+        save_trees(file, trees)
+
+    def load(self, file):
+        """
+        Read syntax trees written by save(), so that the expressions
+        do not have to be parsed when they are first compiled.
+        """
+        self._trees.update(load_trees(file))
+
+    def info(self):
+        """
+        Return a dictionary with the statistics of the cache.
+        """
+        return dict(hits = self.hits, misses = self.misses,
+                    evictions = self.evictions,
+                    size = self.size, length = len(self._entries))
+
+    def _evict(self):
+        while len(self._entries) > self.size:
+            self._entries.popitem(last = False)
+            self.evictions += 1
+
+_cache = XPathCache()
 
 def compile(xpath, namespace_mapping = None):
-    # We only cache when there is no namespace mapping.  Hopefully
-    # that is the common case.
-    if namespace_mapping:
-        return XPath(xpath, namespace_mapping)
-
-    p = _cache.get(xpath)
-    if p is None:
-        p = XPath(xpath)
-        if len(_cache) >= 100:
-            _cache.popitem()
-        _cache[xpath] = p
-    return p
+    """
+    Return a compiled XPath, reusing a cached one when possible.
+
+    The returned object is shared with other callers, so it must not
+    be modified with addNamespace() or setDefaultNamespace().
+    """
+    return _cache.get(xpath, namespace_mapping)
+
+def set_cache_size(size):
+    _cache.resize(size)
+
+_result_cache_size = 100
+
+def set_result_cache_size(size):
+    """
+    Change the number of results that evaluate() with cached = True
+    keeps for each document.  Documents that already hold more drop
+    their least recently used results when the next one is added.
+    """
+    global _result_cache_size
+    _result_cache_size = size
+
+def cache_info():
+    return _cache.info()
+
+def save_cache(file):
+    """
+    Save the syntax trees of the expressions compiled with compile()
+    to a file, for load_cache() in another process.
+    """
+    _cache.save(file)
+
+def load_cache(file):
+    """
+    Load syntax trees saved with save_cache(), so that compile() does
+    not have to parse the expressions.
+    """
+    _cache.load(file)
 
 class XPath:
     """
     Preparsed xpath expression
     """
-    def __init__(self, xpath, namespace_mapping = None):
+    def __init__(self, xpath, namespace_mapping = None, parsed_xpath = None):
         """
         Initialize an XPath instance.
 
         As a special case, if the xpath expression is the empty string,
         the evaluate() method will always return a true value.
+
+        parsed_xpath -- the optimized syntax tree of the expression, if
+        it is already known, as from serialize.load_trees().
         """
         self.xpath = xpath
         if namespace_mapping is None:
             namespace_mapping = dict()
         self.namespace_mapping = namespace_mapping
-        if not xpath:
+        if parsed_xpath is not None:
+            self.parsed_xpath = parsed_xpath
+        elif not xpath:
             self.parsed_xpath = parse_xpath("1")
         else:
-            self.parsed_xpath = parse_xpath(xpath)
+            self.parsed_xpath = optimize(parse_xpath(xpath))
+        self.compiled_xpath = compile_expression(self.parsed_xpath)
 
     def addNamespace(self, prefix, uri):
         """Add namespace mapping between a prefix and an URI.
@@ -90,16 +218,168 @@ class XPath:
         """
         self.namespace_mapping[uri] = uri
 
-    def evaluate(self, element, document):
-        if document is None:
-            parent = element
-            while parent is not None:
-                document = parent
-                parent = document.parent
-        context = Context(document, element, self.namespace_mapping)
-        result = self.parsed_xpath.evaluate(context)
+    def evaluate(self, element, document=None, variables=None,
+                 profiler=None, cached=False):
+        """
+        Evaluate the expression with element as the context node.
+
+        variables -- dictionary binding variable names to values.
+        Names with a namespace prefix are given in Clark notation, as
+        in "{uri}name".  Values can be booleans, numbers, strings,
+        elements or lists of nodes.
+        profiler -- a Profiler to record the time spent in each part
+        of the expression in, and the number of nodes it handled.
+        cached -- if true, reuse the result of an earlier evaluation
+        with the same context node and variables, as long as the
+        document has not been modified since.  Each document keeps
+        the most recently used results, as many as
+        set_result_cache_size() allows (100 by default).
+        """
+        context = self._make_context(element, document, variables)
+        if profiler is not None:
+            return self._evaluate(profiler.compile(self.parsed_xpath),
+                                  context)
+        if cached:
+            results = _get_result_cache(context)
+            if results is not None:
+                key = _make_result_key(self, context, variables)
+                if key is not None:
+                    result = results.pop(key, None)
+                    if result is None:
+                        result = self._evaluate(self.compiled_xpath,
+                                                context)
+                    results[key] = result
+                    while len(results) > _result_cache_size:
+                        results.popitem(last = False)
+                    if isinstance(result, list):
+                        # The caller may modify the list.
+                        result = list(result)
+                    return result
+        return self._evaluate(self.compiled_xpath, context)
+
+    def _evaluate(self, function, context):
+        result = function(context)
         if is_node_set(result) and not isinstance(result, list):
             # Node sets can be all sorts of things internally, but
             # let's normalize them to lists at this point.
             result = list(result)
         return result
+
+    def iterate(self, element, document=None, variables=None):
+        """
+        Return an iterator over the nodes of the node set that the
+        expression evaluates to.
+
+        The nodes are found as they are asked for, so stopping early
+        saves the work of finding the rest.  The document should not
+        be modified until the iteration is done.
+        """
+        result = self.compiled_xpath(
+            self._make_context(element, document, variables))
+        if not is_node_set(result):
+            raise XPathEvaluationError, \
+                  "Expression does not evaluate to a node set."
+        return iter(result)
+
+    def _make_context(self, element, document, variables):
+        if document is None:
+            parent = element
+            while parent is not None:
+                document = parent
+                parent = document.parent
+        return Context(document, element, self.namespace_mapping,
+                       make_variables(variables))
+
+def _get_result_cache(context):
+    # Results are kept in the document cache of the tree, which is
+    # discarded when the tree is modified, least recently used first.
+    document = context.get_root()[0]
+    if not hasattr(document, "getDocumentCache"):
+        return None
+    cache = document.getDocumentCache()
+    results = cache.get("xpath-results")
+    if results is None:
+        results = cache["xpath-results"] = OrderedDict()
+    return results
+
+def _make_result_key(xpath, context, variables):
+    # Return the key of the result in the cache, or None if it
+    # cannot be cached because a variable is bound to a node set.
+    try:
+        if variables:
+            variables = frozenset(variables.iteritems())
+        else:
+            variables = None
+        key = (xpath, context.get_root()[0], context.node, variables)
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+class XPathSet:
+    """
+    Set of expressions evaluated together
+
+    Expressions that start with the same absolute location steps, like
+    /event/type and /event/source/@id, compute the value of those
+    steps only once, and child steps selecting from the same nodes
+    share one pass over the children.  Use this instead of separate
+    XPath.evaluate() calls when many expressions are evaluated against
+    each document.
+    """
+    def __init__(self, xpaths = ()):
+        self.xpaths = []
+        self._compiled = None
+        self._size = 0
+        for xpath in xpaths:
+            self.add(xpath)
+
+    def add(self, xpath, namespace_mapping = None):
+        """
+        Add an expression, given as an XPath instance or as a string,
+        and return its index in the results of evaluate().
+        """
+        if not isinstance(xpath, XPath):
+            xpath = compile(xpath, namespace_mapping)
+        self.xpaths.append(xpath)
+        self._compiled = None
+        return len(self.xpaths) - 1
+
+    def __len__(self):
+        return len(self.xpaths)
+
+    def _compile(self):
+        trie = PathTrie()
+        shared = [trie.share(xpath.parsed_xpath, xpath.namespace_mapping)
+                  for xpath in self.xpaths]
+        trie.group_siblings()
+        self._compiled = [compile_expression(node) for node in shared]
+        self._size = trie.size
+
+    def evaluate(self, element, document = None, variables = None):
+        """
+        Evaluate every expression, and return a list with the result
+        of each, in the order they were added.
+
+        The variables are bound for all the expressions, as for
+        XPath.evaluate().
+        """
+        if self._compiled is None:
+            self._compile()
+        if document is None:
+            parent = element
+            while parent is not None:
+                document = parent
+                parent = document.parent
+        variables = make_variables(variables)
+        slots = [None] * self._size
+        results = []
+        for xpath, function in zip(self.xpaths, self._compiled):
+            context = Context(document, element, xpath.namespace_mapping,
+                              variables)
+            context.slots = slots
+            result = function(context)
+            if is_node_set(result) and not isinstance(result, list):
+                result = list(result)
+            results.append(result)
+        return results
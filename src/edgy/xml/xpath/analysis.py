@@ -0,0 +1,186 @@
+#
+# edgy.xml.xpath.analysis
+#
+# Copyright (C) 2008 Edgeware AB.
+#
+
+"""
+Static analysis of XPath syntax trees
+
+These functions answer questions about an expression without
+evaluating it.  When the answer cannot be known in advance they err
+on the side of caution, so callers can rely on a "no" but must treat
+a "yes" as "maybe".
+"""
+
+from edgy.xml.xpath.atoms import *
+from edgy.xml.xpath.syntax import \
+     UnaryOp, BinaryOp, FunctionCall, Root, LocationStep
+from edgy.xml.xpath.functions import get_function
+
+_boolean_operators = ['or', 'and', '=', '!=', '<', '>', '<=', '>=']
+_number_operators = ['+', '-', '*', 'div', 'mod']
+
+def get_result_type(node):
+    """
+    Return the type of the value of node.
+
+    The result is "boolean", "number", "string", "node-set", or None
+    if the type cannot be known before evaluation.
+    """
+    if isinstance(node, Literal):
+        return "string"
+    elif isinstance(node, Number):
+        return "number"
+    elif isinstance(node, UnaryOp):
+        return "number"
+    elif isinstance(node, BinaryOp):
+        if node.op in _boolean_operators:
+            return "boolean"
+        elif node.op in _number_operators:
+            return "number"
+        else:
+            return "node-set"
+    elif isinstance(node, FunctionCall):
+        if node.function.prefix:
+            return None
+        function = get_function(node.function.local_part)
+        if function is None:
+            return None
+        return function.result_type
+    elif isinstance(node, (Root, LocationStep)):
+        return "node-set"
+    else:
+        return None
+
+def uses_position(node):
+    """
+    Return true if the value of node may depend on the context
+    position or size.
+
+    Predicates of location steps inside node do not count, because
+    they are evaluated with positions of their own.
+    """
+    return _uses_context(node, _looks_at_position)
+
+def uses_size(node):
+    """
+    Return true if the value of node may depend on the context size,
+    that is, if it may call last().
+
+    Predicates for which this is false can be evaluated before the
+    whole node set they filter is known.
+    """
+    return _uses_context(node, _looks_at_size)
+
+def _looks_at_position(function):
+    return function.uses_position
+
+def _looks_at_size(function):
+    # Functions only declare that they use the position or size, so
+    # assume that any such function but position() uses the size.
+    return function.uses_position and function.name != "position"
+
+def _uses_context(node, looks):
+    if isinstance(node, FunctionCall):
+        if node.function.prefix:
+            return True
+        function = get_function(node.function.local_part)
+        if function is None or looks(function):
+            return True
+        for arg in node.argument_list:
+            if _uses_context(arg, looks):
+                return True
+        return False
+    elif isinstance(node, UnaryOp):
+        return _uses_context(node.right, looks)
+    elif isinstance(node, BinaryOp):
+        return _uses_context(node.left, looks) \
+               or _uses_context(node.right, looks)
+    elif isinstance(node, LocationStep):
+        return node.prefix is not None and _uses_context(node.prefix, looks)
+    else:
+        return False
+
+def is_positional_predicate(node):
+    """
+    Return true if the predicate node may select nodes by position.
+
+    This is the case if its value may be a number, which is compared
+    with the proximity position, or if it looks at the position or
+    size itself.  Predicates for which this is false can be applied
+    to the nodes of a node set in any grouping or order.
+    """
+    result_type = get_result_type(node)
+    if result_type is None or result_type == "number":
+        return True
+    return uses_position(node)
+
+# Functions that convert their arguments to strings or booleans, which
+# never fails.
+_safe_functions = [
+    "string", "concat", "starts-with", "contains", "substring-before",
+    "substring-after", "string-length", "normalize-space", "translate",
+    "boolean", "not", "true", "false",
+    ]
+
+def may_fail(node):
+    """
+    Return true if evaluating node may raise an exception.
+
+    Variables may be unbound, namespace prefixes undeclared, and
+    strings not convertible to numbers, so expressions that refer to
+    variables or prefixes or convert anything but numbers and booleans
+    to numbers may fail.  Expressions for which this is false can be
+    evaluated or skipped without changing the outcome, so their
+    evaluation can be reordered.
+    """
+    if isinstance(node, (Literal, Number, Root)):
+        return False
+    elif isinstance(node, UnaryOp):
+        return not _is_numeric(node.right) or may_fail(node.right)
+    elif isinstance(node, BinaryOp):
+        if may_fail(node.left) or may_fail(node.right):
+            return True
+        if node.op in ['or', 'and']:
+            return False
+        types = [get_result_type(node.left), get_result_type(node.right)]
+        if node.op in ['=', '!=']:
+            if None in types:
+                return True
+            return "number" in types \
+                   and not (_is_numeric(node.left) and _is_numeric(node.right))
+        elif node.op == '|':
+            return types != ["node-set", "node-set"]
+        else:
+            return not (_is_numeric(node.left) and _is_numeric(node.right))
+    elif isinstance(node, FunctionCall):
+        if node.function.prefix:
+            return True
+        if node.function.local_part == "count":
+            # Fails for anything but a node set.
+            if get_result_type(node.argument_list[0]) != "node-set":
+                return True
+        elif node.function.local_part not in _safe_functions:
+            return True
+        for arg in node.argument_list:
+            if may_fail(arg):
+                return True
+        return False
+    elif isinstance(node, LocationStep):
+        if node.prefix is not None:
+            if get_result_type(node.prefix) != "node-set" \
+                   or may_fail(node.prefix):
+                return True
+        if isinstance(node.node_test, NameTest) \
+               and node.node_test.prefix is not None:
+            return True
+        for predicate in node.predicate_list:
+            if may_fail(predicate):
+                return True
+        return False
+    else:
+        return True
+
+def _is_numeric(node):
+    return get_result_type(node) in ("number", "boolean")
@@ -134,5 +134,18 @@ class VariableReference(QName):
     def __str__(self):
         return "$%s" % QName.__str__(self)
 
+    def get_name(self, context):
+        """
+        Return the name the variable is bound by: the local part, or
+        the expanded name in Clark notation if there is a prefix.
+        """
+        if self.prefix is None:
+            return self.local_part
+        uri = context.namespace_mapping.get(self.prefix, None)
+        if uri is None:
+            raise XPathEvaluationError, \
+                  'Unbound namespace prefix "%s".' % self.prefix
+        return "{%s}%s" % (uri, self.local_part)
+
     def evaluate(self, context):
-        raise XPathNotImplementedError, "Variable references not implemented."
+        return context.get_variable(self.get_name(context))
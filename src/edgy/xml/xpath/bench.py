@@ -1,63 +1,241 @@
 #
-# pdis.xpath.bench
+# edgy.xml.xpath.bench
 #
-# Copyright 2004 Helsinki Institute for Information Technology (HIIT)
-# and the authors.  All rights reserved.
+# Copyright (C) 2008 Edgeware AB.
 #
-# Authors: Ken Rimey <rimey@hiit.fi>
+
+"""
+Benchmark suite for the xpath package
+
+The suite generates a document of configurable depth and fan-out,
+and times parsing it, compiling each expression in the suite, and
+evaluating each of them against the document.  The expressions cover
+every supported axis, the different kinds of predicates and the
+function library.
+
+The results can be written as JSON and compared with the results of
+an earlier run, to catch regressions between releases:
+
+    python -m edgy.xml.xpath.bench --output before.json
+    (change things)
+    python -m edgy.xml.xpath.bench --compare before.json
+
+With --compare, the exit status is 1 if anything got slower by more
+than the threshold.  Use --help for the other options.
+"""
+
+import sys
+import platform
+from timeit import Timer
+from optparse import OptionParser
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from edgy.xml import parse
+from edgy.xml.benchdoc import make_document
+from edgy.xml.xpath import XPath
+
+#
+# Expressions
 #
+# Each entry is (kind, name, expression), where the kind is the
+# aspect of the implementation that the expression exercises.  Names
+# are only unique within a kind.  The expressions refer to the
+# elements of make_document() with depth at least 3, where every l1
+# and l2 element has a title.
+#
+
+expressions = [
+    # Axes.
+    ("axis", "child", "/doc/l1/l2"),
+    ("axis", "child-wildcard", "/doc/*/*/*"),
+    ("axis", "descendant", "/doc/l1/descendant::l3"),
+    ("axis", "descendant-abbreviated", "//l3"),
+    ("axis", "descendant-or-self", "/doc/l1/descendant-or-self::*"),
+    ("axis", "descendant-nodes", "/doc/l1[1]//node()"),
+    ("axis", "parent", "//l3/.."),
+    ("axis", "ancestor", "//l3/ancestor::l1"),
+    ("axis", "ancestor-or-self", "/doc/l1/l2/ancestor-or-self::*"),
+    ("axis", "following-sibling", "/doc/l1/l2[1]/following-sibling::l2"),
+    ("axis", "preceding-sibling", "/doc/l1/l2[last()]/preceding-sibling::*"),
+    ("axis", "self", "/doc/l1/l2/self::l2"),
+    ("axis", "attribute", "/doc/l1/l2/@n"),
+    ("axis", "text", "//l3/text()"),
+    # Predicates.
+    ("predicate", "position", "/doc/l1/l2[2]"),
+    ("predicate", "last", "/doc/l1/l2[last()]"),
+    ("predicate", "position-less-than", "/doc/l1/l2[position() < 3]"),
+    ("predicate", "position-expression", "/doc/l1/l2[position() mod 2 = 0]"),
+    ("predicate", "attribute-equals", "//l2[@class = 'odd']"),
+    ("predicate", "attribute-number", "//l3[@n > 100]"),
+    ("predicate", "string-value", "//l2[title = 'title 2']"),
+    ("predicate", "existence", "/doc/l1[l2/l3]"),
+    ("predicate", "boolean", "//l2[@class = 'odd' and @n < 50 or @n = 7]"),
+    ("predicate", "nested", "/doc/l1[l2[@class = 'even'][1]/@n > 3]"),
+    ("predicate", "chained", "//l3[@class = 'odd'][2]"),
+    ("predicate", "first-match", "(//l3[@n > 10])[1]"),
+    # Functions.
+    ("function", "count", "count(//l3)"),
+    ("function", "sum", "sum(//l3/@n)"),
+    ("function", "string", "string(/doc/l1)"),
+    ("function", "string-length", "string-length(/doc)"),
+    ("function", "concat", "concat(/doc/l1/@n, '-', /doc/l1/title)"),
+    ("function", "contains", "//title[contains(., '7')]"),
+    ("function", "starts-with", "//title[starts-with(., 'title 1')]"),
+    ("function", "substring", "//title[substring(., 7, 1) = '3']"),
+    ("function", "substring-before-after",
+     "//title[substring-after(., ' ') = substring-before('5 x', ' ')]"),
+    ("function", "normalize-space", "//title[normalize-space() = 'title 2']"),
+    ("function", "translate", "//title[translate(., 'title ', '') = '9']"),
+    ("function", "name", "//*[name() = 'l2']"),
+    ("function", "local-name", "//*[local-name() = 'title']"),
+    ("function", "not", "//l3[not(@class = 'odd')]"),
+    ("function", "number", "//l3[number(@n) = 20]"),
+    ("function", "rounding", "//l3[floor(@n div 2) = ceiling(@n div 2)]"),
+    ("function", "boolean", "boolean(//l3[@n = 0])"),
+    ("function", "last-position", "//l2[position() = last()]"),
+    # Operators.
+    ("operator", "arithmetic", "sum(//l2/@n) * 2 + count(//l3) div 3"),
+    ("operator", "union", "count(//l1 | //l2)"),
+    ("operator", "comparison", "//l3 = //l2/@n"),
+    ]
 
-# Permission is hereby granted, free of charge, to any person
-# obtaining a copy of this software and associated documentation files
-# (the "Software"), to deal in the Software without restriction,
-# including without limitation the rights to use, copy, modify, merge,
-# publish, distribute, sublicense, and/or sell copies of the Software,
-# and to permit persons to whom the Software is furnished to do so,
-# subject to the following conditions:
 #
-# The above copyright notice and this permission notice shall be
-# included in all copies or substantial portions of the Software.
+# Timing
 #
-# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
-# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
-# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
-# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
-# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
-# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
-# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-from time import time
+def time_function(function, number, repeat):
+    """
+    Return the time in seconds of one call to function, as the best
+    of repeat runs of number calls.
+    """
+    return min(Timer(function).repeat(repeat, number)) / number
 
-try:
-    from pdis.lib.element import XML
-except ImportError:
-    from elementtree.ElementTree import XML
+def run(options):
+    """
+    Run the benchmarks selected by the options, and return the
+    results as a dictionary that can be written as JSON.
+    """
+    text = make_document(options.depth, options.fanout)
+    document = parse(text)
+    results = []
+    def record(kind, name, seconds, expression = None):
+        result = dict(kind = kind, name = name, seconds = seconds)
+        if expression is not None:
+            result["expression"] = expression
+        results.append(result)
+        if options.verbose:
+            print >> sys.stderr, "%-10s %-28s %12.3f us" % (
+                kind, name, seconds * 1e6)
+
+    if _selected("parse", options):
+        record("parse", "document",
+               time_function(lambda: parse(text), 1, options.repeat))
+
+    for kind, name, expression in expressions:
+        if not _selected(name, options):
+            continue
+        # Compile results are named by kind as well, since the same
+        # name can be used for expressions of different kinds.
+        record("compile", "%s/%s" % (kind, name),
+               time_function(lambda: XPath(expression), options.number,
+                             options.repeat),
+               expression)
+        # Evaluate once first, so that the timings are of evaluation
+        # with the tag index and the string values already cached.
+        xpath = XPath(expression)
+        xpath.evaluate(document)
+        record(kind, name,
+               time_function(lambda: xpath.evaluate(document),
+                             options.number, options.repeat),
+               expression)
+
+    return dict(python = platform.python_version(),
+                depth = options.depth, fanout = options.fanout,
+                size = len(text), results = results)
+
+def _selected(name, options):
+    return options.only is None or options.only in name
+
+#
+# Comparison
+#
 
-from pdis.xpath import XPath
+def compare(old, new, threshold):
+    """
+    Compare two sets of results returned by run().
 
-N = 10000
+    Returns a list of (kind, name, ratio) for the benchmarks that are
+    slower in the new results by more than the threshold, a fraction
+    of the old time.  Only benchmarks present in both are compared.
+    """
+    old_times = {}
+    for result in old["results"]:
+        old_times[(result["kind"], result["name"])] = result["seconds"]
+    regressions = []
+    for result in new["results"]:
+        key = (result["kind"], result["name"])
+        if key not in old_times or old_times[key] <= 0:
+            continue
+        ratio = result["seconds"] / old_times[key]
+        if ratio > 1 + threshold:
+            regressions.append((result["kind"], result["name"], ratio))
+    return regressions
 
-def bench(path, document):
-    t0 = time()
-    for i in range(N):
-        element = XML(document)
-    t1 = time()
-    print t1 - t0, "(parse document)"
+def main(argv = None):
+    parser = OptionParser(usage = "python -m edgy.xml.xpath.bench [options]")
+    parser.add_option("--depth", type = "int", default = 4,
+                      help = "levels of elements below the document "
+                      "element [%default]")
+    parser.add_option("--fanout", type = "int", default = 8,
+                      help = "children of each element [%default]")
+    parser.add_option("--number", type = "int", default = 5,
+                      help = "calls per timing run [%default]")
+    parser.add_option("--repeat", type = "int", default = 3,
+                      help = "timing runs, of which the best is kept "
+                      "[%default]")
+    parser.add_option("--only", metavar = "TEXT",
+                      help = "only run the benchmarks whose name "
+                      "contains TEXT")
+    parser.add_option("--output", metavar = "FILE",
+                      help = "write the results to FILE as JSON, "
+                      "instead of to standard output")
+    parser.add_option("--compare", metavar = "FILE",
+                      help = "compare the results with those in FILE")
+    parser.add_option("--threshold", type = "float", default = 0.1,
+                      help = "slowdown reported as a regression by "
+                      "--compare, as a fraction [%default]")
+    parser.add_option("-v", "--verbose", action = "store_true",
+                      help = "report each result as it is measured")
+    options, args = parser.parse_args(argv)
+    if args:
+        parser.error("unexpected arguments")
+    if options.depth < 3:
+        parser.error("--depth must be at least 3")
 
-    t0 = time()
-    for i in range(N):
-        xpath = XPath(path)
-    t1 = time()
-    print t1 - t0, "(parse path)"
+    results = run(options)
 
-    t0 = time()
-    for i in range(N):
-        result = xpath.evaluate(element)
-    t1 = time()
-    print t1 - t0, "(evaluate)"
+    if options.output:
+        output = open(options.output, "w")
+        try:
+            json.dump(results, output, indent = 1, sort_keys = True)
+        finally:
+            output.close()
+    elif not options.compare:
+        json.dump(results, sys.stdout, indent = 1, sort_keys = True)
+        print
 
-    print 'result =', result
+    if options.compare:
+        old = json.load(open(options.compare))
+        regressions = compare(old, results, options.threshold)
+        for kind, name, ratio in regressions:
+            print "%-10s %-28s %6.2fx slower" % (kind, name, ratio)
+        if regressions:
+            return 1
+    return 0
 
-document = "<item><blah>blah</blah><color>orange</color><blah>blah</blah></item>"
-bench("/*/color = 'orange'", document)
-bench("/*/color = 'green'", document)
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,57 @@
+#
+# edgy.xml.xpath.bench_fanout
+#
+# Copyright (C) 2008 Edgeware AB.
+#
+
+"""
+Benchmark of location steps and predicates on documents with wide
+fan-out
+
+For each expression it reports the time per evaluation with the
+compiled expression and with the syntax tree's evaluate() methods.
+
+Run with "python -m edgy.xml.xpath.bench_fanout".
+"""
+
+from timeit import Timer
+
+from edgy.xml import parse
+from edgy.xml.xpath import XPath
+
+def make_document(width, depth):
+    # Every element below the document element has width children,
+    # down to depth levels.
+    def make(level):
+        if level == depth:
+            return "<leaf n='%d'>x</leaf>" % level
+        child = make(level + 1)
+        return "<node n='%d'>%s</node>" % (level, child * width)
+    return parse("<doc>%s</doc>" % (make(1) * width))
+
+expressions = [
+    "/doc/node/node/node",
+    "/doc/node/node[@n = 2]/node[1]",
+    "count(//leaf[. = 'x'])",
+    "/doc/node[node/node/leaf]/@n",
+    ]
+
+def bench(expression, document, number = 20):
+    xpath = XPath(expression)
+    evaluators = [
+        ("compiled", lambda: xpath.evaluate(document)),
+        ("tree", lambda: xpath.parsed_xpath.evaluate(
+            xpath._make_context(document, None, None))),
+        ]
+    for name, function in evaluators:
+        seconds = min(Timer(function).repeat(3, number)) / number
+        print "  %-8s %9.2f ms" % (name, seconds * 1e3)
+
+def main():
+    document = make_document(30, 3)
+    for expression in expressions:
+        print expression
+        bench(expression, document)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+#
+# edgy.xml.xpath.bench_lexer
+#
+# Copyright (C) 2008 Edgeware AB.
+#
+
+"""
+Micro-benchmark comparing the regular expression tokenizer with the
+portable character-by-character one
+
+Run with "python -m edgy.xml.xpath.bench_lexer".
+"""
+
+from timeit import Timer
+
+from edgy.xml.xpath.lexer import split_tokens, split_tokens_portable
+
+expressions = [
+    "/*/color = 'orange'",
+    "//asset[@id = 'abc' and contains(title, 'news')]/@src",
+    " or ".join(["/playlist/clip[%d][@start >= %d and @end <= %d]/media:src"
+                 % (i, i * 10, i * 10 + 5) for i in range(1, 20)]),
+    ]
+
+def bench(expression, number = 1000):
+    result = []
+    for split in (split_tokens_portable, split_tokens):
+        timer = Timer(lambda: split(expression))
+        result.append(min(timer.repeat(3, number)) / number)
+    return result
+
+def main():
+    for expression in expressions:
+        portable, regex = bench(expression)
+        print "%5d chars: %9.1f us portable, %9.1f us regex, %5.1fx" % (
+            len(expression), portable * 1e6, regex * 1e6, portable / regex)
+
+if __name__ == "__main__":
+    main()
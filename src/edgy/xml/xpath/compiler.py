@@ -0,0 +1,712 @@
+#
+# edgy.xml.xpath.compiler
+#
+# Copyright (C) 2008 Edgeware AB.
+#
+
+"""
+Compile XPath syntax trees into Python closures
+
+The nodes in syntax.py evaluate themselves by looking at their
+operator and axis names every time they are evaluated.  The compiler
+does that dispatching once, and turns the tree into nested functions
+that each take a Context and return the value of their subexpression.
+"""
+
+import operator
+from timeit import default_timer
+try:
+    from math import floor, ceil
+except ImportError:
+    from pdis.lib.compat import floor, ceil
+
+from edgy.xml.xpath.atoms import *
+from edgy.xml.xpath.syntax import \
+     UnaryOp, BinaryOp, FunctionCall, Root, LocationStep
+from edgy.xml.xpath.evaluate import to_number, to_boolean, \
+     compare_values, comparisons, filter_singleton_nodes, \
+     predicate_filter, position_filter, prefix_filter, last_filter, \
+     relational_transpose, \
+     axes, resolve_node_test, collect_axis
+from edgy.xml.xpath.functions import lookup_function
+from edgy.xml.xpath.analysis import \
+     is_positional_predicate, uses_size, may_fail
+from edgy.xml.xpath.index import \
+     get_tag_index, get_attribute_index, make_tag
+from edgy.xml.xpath.data_model import *
+from edgy.xml.xpath.xpath_exceptions import \
+     XPathNotImplementedError, XPathEvaluationError
+
+# Whether the operands of "and" and "or", and runs of predicates, are
+# evaluated in the order found to be fastest (see OperandOrder).  The
+# order is measured and changed by every evaluation of a compiled
+# expression, whoever makes it, so this is off unless asked for.
+reordering = False
+
+def compile_expression(node, profiler = None):
+    """
+    Return a function that evaluates the syntax tree node.
+
+    The returned function takes a Context and returns the value of
+    the expression in that context.  If a Profiler (see profiler.py)
+    is given, the compiled functions report to it as they are
+    evaluated.
+    """
+    try:
+        compiler = _compilers[node.__class__]
+    except KeyError:
+        raise XPathNotImplementedError, \
+              'Cannot compile %s.' % node.__class__.__name__
+    function = compiler(node, profiler)
+    if profiler is not None:
+        function = profiler.wrap_expression(node, function)
+    return function
+
+#
+# Atoms
+#
+
+def compile_constant(node, profiler):
+    value = node.value
+    def evaluate(context):
+        return value
+    return evaluate
+
+def compile_variable_reference(node, profiler):
+    if node.prefix is not None:
+        def evaluate(context):
+            return context.get_variable(node.get_name(context))
+        return evaluate
+
+    name = node.local_part
+    def evaluate(context):
+        try:
+            return context.variables[name]
+        except KeyError:
+            return context.get_variable(name)
+    return evaluate
+
+#
+# Expressions
+#
+
+def compile_unary_op(node, profiler):
+    assert node.op == '-'
+    right = compile_expression(node.right, profiler)
+    def evaluate(context):
+        return - to_number(right(context))
+    return evaluate
+
+def compile_binary_op(node, profiler):
+    if node.op in ('and', 'or') and reordering and profiler is None:
+        operands = []
+        _flatten(node, node.op, operands)
+        for operand in operands:
+            if may_fail(operand):
+                break
+        else:
+            return compile_reordered(
+                node.op, [compile_expression(x) for x in operands])
+    left = compile_expression(node.left, profiler)
+    right = compile_expression(node.right, profiler)
+    return _binary_op_compilers[node.op](node.op, left, right)
+
+def compile_or(op, left, right):
+    def evaluate(context):
+        return to_boolean(left(context)) or to_boolean(right(context))
+    return evaluate
+
+def compile_and(op, left, right):
+    def evaluate(context):
+        return to_boolean(left(context)) and to_boolean(right(context))
+    return evaluate
+
+def _flatten(node, op, operands):
+    # Collect the operands of a chain of the operator op.
+    if isinstance(node, BinaryOp) and node.op == op:
+        _flatten(node.left, op, operands)
+        _flatten(node.right, op, operands)
+    else:
+        operands.append(node)
+
+def compile_reordered(op, operands):
+    """
+    Return a function that evaluates the operands of a chain of "and"
+    or "or" operators, none of which may fail, in the order that an
+    OperandOrder finds to be fastest.
+    """
+    decisive = op == 'or'               # The value that ends the chain.
+    other = not decisive
+    order = OperandOrder(operands, decisive)
+    def evaluate(context):
+        if not order.countdown:
+            return order.measure(context)
+        order.countdown -= 1
+        for operand in order.operands:
+            value = operand(context)
+            # Most operands are comparisons, which return booleans.
+            if value is decisive or (value is not other
+                                     and to_boolean(value) == decisive):
+                return decisive
+        return other
+    return evaluate
+
+class OperandOrder:
+    """
+    Evaluation order of operands that can be evaluated in any order
+
+    The value of a chain of "and" operators is known as soon as an
+    operand is false, and that of a chain of "or" operators as soon
+    as one is true.  The operands are best evaluated in the order of
+    their cost divided by the chance that they end the evaluation, so
+    that cheap operands that often do so come first.
+
+    Both are measured for the first "sample_size" evaluations, by
+    timing each operand that is evaluated and noting which one ended
+    the evaluation.  The evaluation still stops at that operand, so
+    an operand's cost and chance are only known for the evaluations
+    that reach it, and the ratio of its total time to the number of
+    evaluations it ended estimates the cost per ending.  Operands
+    that were never reached come first in the next order, so they
+    get measured.  The operands are then put in order, and measured
+    again after every "interval" evaluations, in case the documents
+    change character.  Since none of the operands may fail,
+    evaluating them in another order does not change the result.
+    """
+    sample_size = 32
+    interval = 4096
+
+    def __init__(self, operands, decisive):
+        self.operands = operands        # In evaluation order.
+        self.decisive = decisive
+        self.countdown = 0              # Evaluations until measuring.
+        self._reset()
+
+    def _reset(self):
+        self.samples = 0
+        self.times = [0.0] * len(self.operands)
+        self.decisions = [0] * len(self.operands)
+
+    def measure(self, context):
+        """
+        Evaluate the operands until one ends the evaluation, record
+        the cost of those evaluated and which one ended it, and return
+        the value of the chain.
+        """
+        operands = self.operands
+        times = self.times
+        result = not self.decisive
+        for i in range(len(operands)):
+            start = default_timer()
+            value = to_boolean(operands[i](context))
+            times[i] += default_timer() - start
+            if value == self.decisive:
+                self.decisions[i] += 1
+                result = self.decisive
+                break
+        self.samples += 1
+        if self.samples >= self.sample_size:
+            ranks = [(times[i] / (self.decisions[i] + 1), i)
+                     for i in range(len(operands))]
+            ranks.sort()
+            self.operands = [operands[i] for rank, i in ranks]
+            self.countdown = self.interval
+            self._reset()
+        return result
+
+def compile_comparison(op, left, right):
+    test, transposed_test = comparisons[op]
+    def evaluate(context):
+        return compare_values(test, transposed_test,
+                              left(context), right(context))
+    return evaluate
+
+def _modulo(x, y):
+    z = abs(x) % abs(y)
+    if x >= 0:
+        return z
+    else:
+        return -z
+
+_arithmetic_operators = {
+    '+' : operator.add,
+    '-' : operator.sub,
+    '*' : operator.mul,
+    'div' : operator.truediv,
+    'mod' : _modulo,
+    }
+
+def compile_arithmetic(op, left, right):
+    function = _arithmetic_operators[op]
+    def evaluate(context):
+        return function(to_number(left(context)), to_number(right(context)))
+    return evaluate
+
+def compile_union(op, left, right):
+    def evaluate(context):
+        x = left(context)
+        y = right(context)
+        if is_node_set(x) and is_node_set(y):
+            return union_node_sets(x, y, context.get_root())
+        else:
+            raise XPathEvaluationError, "Operands of '|' must be node sets."
+    return evaluate
+
+_binary_op_compilers = {
+    'or' : compile_or,
+    'and' : compile_and,
+    '|' : compile_union,
+    }
+for op in comparisons:
+    _binary_op_compilers[op] = compile_comparison
+for op in _arithmetic_operators:
+    _binary_op_compilers[op] = compile_arithmetic
+del op
+
+def compile_function_call(node, profiler):
+    if node.function.prefix:
+        raise XPathNotImplementedError, \
+              "Namespace prefixes for function names not implemented."
+    arguments = [compile_expression(arg, profiler)
+                 for arg in node.argument_list]
+    function = lookup_function(node.function.local_part,
+                               len(arguments)).function
+
+    if not arguments:
+        def evaluate(context):
+            return function(context)
+    elif len(arguments) == 1:
+        argument = arguments[0]
+        def evaluate(context):
+            return function(context, argument(context))
+    else:
+        def evaluate(context):
+            return function(context, *[arg(context) for arg in arguments])
+    return evaluate
+
+#
+# Location paths
+#
+
+def compile_root(node, profiler):
+    def evaluate(context):
+        return [context.get_root()]
+    return evaluate
+
+def _context_node_set(context):
+    return [context.node]
+
+def compile_location_step(node, profiler):
+    generate = _compile_step_nodes(node, profiler)
+    def evaluate(context):
+        nodes = generate(context)
+        if isinstance(nodes, (list, tuple)):
+            return nodes
+        return NodeSet(nodes)
+    return evaluate
+
+def _compile_step_nodes(node, profiler):
+    # Return a function that generates the nodes selected by a
+    # location step, as an iterable that may only be good for one
+    # pass.  Steps that follow other steps consume them this way, so
+    # only the value of the last step of a path is kept in a NodeSet.
+    if node.prefix is None:
+        prefix = _context_node_set
+    elif isinstance(node.prefix, LocationStep):
+        prefix = _compile_step_nodes(node.prefix, profiler)
+    else:
+        prefix = _compile_node_set(node.prefix, profiler)
+    if profiler is not None:
+        prefix = profiler.wrap_input(node, prefix)
+
+    try:
+        compiler = _axis_compilers[node.axis]
+    except KeyError:
+        raise XPathNotImplementedError, '"%s" axis not supported.' % node.axis
+    step = compiler(node.node_test, node.predicate_list, profiler)
+
+    def generate(context):
+        return step(prefix(context), context)
+
+    if _is_indexable(node):
+        generate = _compile_indexed_step(node, generate, profiler)
+    if profiler is not None:
+        generate = profiler.wrap_step(node, generate)
+    return generate
+
+def _compile_node_set(node, profiler):
+    function = compile_expression(node, profiler)
+    def evaluate(context):
+        node_set = function(context)
+        if not is_node_set(node_set):
+            raise XPathEvaluationError, \
+                  "Location step applied to something other than a node set."
+        return node_set
+    return evaluate
+
+def _is_indexable(node):
+    # Return true for //name and /descendant::name, with predicates
+    # that the tag index can be used with.
+    node_test = node.node_test
+    if not isinstance(node_test, NameTest):
+        return False
+    if node_test.local_part == '*' \
+           and _get_attribute_equality(node.predicate_list) is None:
+        return False
+    prefix = _unshared(node.prefix)
+    if node.axis == "descendant":
+        # The index is in document order, which is the order of the
+        # descendant axis, so any predicates can be applied to it.
+        return isinstance(prefix, Root)
+    elif node.axis == "child":
+        # Positions on the child axis are relative to each parent,
+        # so only predicates that do not look at them can be applied
+        # to the index.
+        for predicate in node.predicate_list:
+            if is_positional_predicate(predicate):
+                return False
+        return isinstance(prefix, LocationStep) \
+               and isinstance(_unshared(prefix.prefix), Root) \
+               and prefix.axis == "descendant-or-self" \
+               and isinstance(prefix.node_test, NodeType) \
+               and prefix.node_test.name == "node" \
+               and not prefix.predicate_list
+    else:
+        return False
+
+def _compile_indexed_step(node, fallback, profiler):
+    node_test = node.node_test
+    filters = compile_filters(node.predicate_list, profiler)
+    equality = _get_attribute_equality(node.predicate_list)
+    if equality is not None:
+        attribute_test, value_node = equality
+        value_function = compile_expression(value_node, profiler)
+        other_filters = compile_filters(node.predicate_list[1:], profiler)
+
+    def evaluate(context):
+        document = context.get_root()[0]
+        if equality is not None:
+            node_set = _lookup_attribute(document, attribute_test,
+                                         value_function, node_test, context)
+            if node_set is not None:
+                for filter in other_filters:
+                    node_set = filter(node_set, context)
+                return node_set
+        index = get_tag_index(document)
+        if index is None or node_test.local_part == '*':
+            return fallback(context)
+        uri, name = node_test.expand(context)
+        node_set = index.get(make_tag(uri, name), ())
+        if not filters:
+            # Not the list itself, which belongs to the index.
+            return iter(node_set)
+        for filter in filters:
+            node_set = filter(node_set, context)
+        return node_set
+    return evaluate
+
+def _lookup_attribute(document, attribute_test, value_function, node_test,
+                      context):
+    # Return the elements passing the node test whose attribute has
+    # the value, or None if there is no index for the attribute or
+    # the value is not a string.
+    uri, name = attribute_test.expand(context)
+    index = get_attribute_index(document, make_tag(uri, name))
+    if index is None:
+        return None
+    value = value_function(context)
+    if not isinstance(value, (str, unicode)):
+        return None
+    uri, name = node_test.expand(context)
+    return [x for x in index.get(value, ()) if is_element_node(x, uri, name)]
+
+def _get_attribute_equality(predicate_list):
+    """
+    Return (attribute_test, value) if the first predicate compares an
+    attribute of the context node with a literal or a variable, as in
+    [@id = 'abc'], or None otherwise.
+    """
+    if not predicate_list:
+        return None
+    predicate = predicate_list[0]
+    if not isinstance(predicate, BinaryOp) or predicate.op != '=':
+        return None
+    for attribute, value in [(predicate.left, predicate.right),
+                             (predicate.right, predicate.left)]:
+        if isinstance(attribute, LocationStep) \
+               and attribute.prefix is None \
+               and attribute.axis == "attribute" \
+               and isinstance(attribute.node_test, NameTest) \
+               and attribute.node_test.local_part != '*' \
+               and not attribute.predicate_list \
+               and isinstance(value, (Literal, VariableReference)):
+            return attribute.node_test, value
+    return None
+
+class SharedStep:
+    """
+    Location step whose value is shared between expressions
+
+    XPathSet replaces the steps of absolute location paths with these
+    nodes, so that expressions starting with the same steps compute
+    their value only once per evaluation.  The value is kept in
+    context.slots.
+
+    step -- LocationStep.
+    slot -- index of the value in context.slots.
+    siblings -- None, or a list of SharedStep nodes selecting child
+    elements by name from the same node set.  The values of all of
+    them are then found in a single pass over the children.
+    """
+    def __init__(self, step, slot):
+        self.step = step
+        self.slot = slot
+        self.siblings = None
+
+    def __str__(self):
+        return str(self.step)
+
+def _unshared(node):
+    if isinstance(node, SharedStep):
+        return node.step
+    return node
+
+def compile_shared_step(node, profiler):
+    slot = node.slot
+    if node.siblings is None:
+        compute = compile_location_step(node.step, profiler)
+    else:
+        compute = _compile_sibling_steps(node, profiler)
+    def evaluate(context):
+        slots = context.slots
+        value = slots[slot]
+        if value is None:
+            value = slots[slot] = compute(context)
+        return value
+    return evaluate
+
+def _compile_sibling_steps(node, profiler):
+    parent = compile_expression(node.step.prefix, profiler)
+    siblings = [(sibling.slot, sibling.step.node_test)
+                for sibling in node.siblings]
+    slot = node.slot
+    def evaluate(context):
+        slots = context.slots
+        by_tag = {}
+        for sibling_slot, node_test in siblings:
+            uri, name = node_test.expand(context)
+            # Different prefixes can stand for the same namespace.
+            tag = make_tag(uri, name)
+            nodes = by_tag.get(tag)
+            if nodes is None:
+                nodes = by_tag[tag] = []
+            slots[sibling_slot] = nodes
+        for parent_node in parent(context):
+            if is_text_node(parent_node):
+                continue
+            for child in parent_node:
+                nodes = by_tag.get(child.tag)
+                if nodes is not None:
+                    nodes.append(child)
+        return slots[slot]
+    return evaluate
+
+def compile_filters(predicate_list, profiler = None):
+    """
+    Return filter functions for the predicates of a location step.
+
+    Constant numbers and last(), which the optimizer leaves as the
+    only form of purely positional predicates, pick their node
+    directly instead of evaluating the predicate for every node, and
+    [position() < n] just takes the first nodes.  Other predicates
+    are evaluated for each node as it is generated, unless they use
+    last(), which needs the whole node set.
+
+    Consecutive predicates that neither look at positions nor may fail
+    select the same nodes in any order, so they are evaluated together
+    with their order chosen as for the operands of "and".
+    """
+    filters = []
+    for group in _group_predicates(predicate_list, profiler):
+        if len(group) > 1:
+            function = compile_reordered(
+                'and', [compile_expression(x) for x in group])
+            filters.append(predicate_filter(function, False))
+            continue
+        predicate = group[0]
+        count = _get_prefix_count(predicate)
+        if isinstance(predicate, Number):
+            filters.append(position_filter(predicate.value))
+        elif _is_last_call(predicate):
+            filters.append(last_filter)
+        elif count is not None:
+            filters.append(prefix_filter(count))
+        else:
+            function = compile_expression(predicate, profiler)
+            filters.append(predicate_filter(function, uses_size(predicate)))
+    return filters
+
+def _group_predicates(predicate_list, profiler):
+    # Split the predicates into lists of consecutive predicates that
+    # can be evaluated in any order, and lists of single predicates.
+    groups = []
+    reorderable = False
+    for predicate in predicate_list:
+        previous = reorderable
+        reorderable = reordering and profiler is None \
+                      and not is_positional_predicate(predicate) \
+                      and not may_fail(predicate)
+        if reorderable and previous:
+            groups[-1].append(predicate)
+        else:
+            groups.append([predicate])
+    return groups
+
+def _is_last_call(node):
+    return isinstance(node, FunctionCall) \
+           and node.function.prefix is None \
+           and node.function.local_part == "last" \
+           and not node.argument_list
+
+def _is_position_call(node):
+    return isinstance(node, FunctionCall) \
+           and node.function.prefix is None \
+           and node.function.local_part == "position" \
+           and not node.argument_list
+
+def _get_prefix_count(predicate):
+    """
+    Return the number of leading nodes that pass a predicate like
+    position() < n, or None for any other predicate.
+    """
+    if not isinstance(predicate, BinaryOp):
+        return None
+    op, left, right = predicate.op, predicate.left, predicate.right
+    if op in ('>', '>=') and _is_position_call(right):
+        op, left, right = relational_transpose[op], right, left
+    if op not in ('<', '<=') or not _is_position_call(left) \
+           or not isinstance(right, Number):
+        return None
+    n = right.value
+    if n != n:
+        return 0                        # NaN
+    if n - n != 0:
+        return None                     # Infinite.
+    if op == '<':
+        return max(int(ceil(n)) - 1, 0)
+    else:
+        return max(int(floor(n)), 0)
+
+def compile_self_axis(node_test, predicate_list, profiler):
+    if isinstance(node_test, NameTest):
+        def select(input_node_set, context):
+            uri, name = node_test.expand(context)
+            return [x for x in input_node_set if is_element_node(x, uri, name)]
+    elif isinstance(node_test, NodeType) and node_test.name == "node":
+        def select(input_node_set, context):
+            return input_node_set
+    elif isinstance(node_test, NodeType) and node_test.name == "text":
+        def select(input_node_set, context):
+            # XXX Bug: This also selects attribute nodes.
+            return filter(is_text_node, input_node_set)
+    else:
+        def select(input_node_set, context):
+            return ()
+    return _singleton_filtered(select, predicate_list, profiler)
+
+def compile_attribute_axis(node_test, predicate_list, profiler):
+    if not isinstance(node_test, NameTest):
+        raise XPathNotImplementedError, \
+              'Only name tests supported for attribute references.'
+    if node_test.local_part == '*':
+        raise XPathNotImplementedError, \
+              'Wildcard attribute references not supported.'
+
+    def select(input_node_set, context):
+        uri, name = node_test.expand(context)
+        node_set = []
+        for node in input_node_set:
+            value = get_attribute_value(node, uri, name)
+            if value is not None:
+                node_set.append(value)
+        return node_set
+    return _singleton_filtered(select, predicate_list, profiler)
+
+def _singleton_filtered(select, predicate_list, profiler):
+    if not predicate_list:
+        return select
+    predicates = [compile_expression(p, profiler) for p in predicate_list]
+    def step(input_node_set, context):
+        node_set = select(input_node_set, context)
+        for predicate in predicates:
+            node_set = filter_singleton_nodes(node_set, predicate, context)
+        return node_set
+    return step
+
+def compile_child_axis(node_test, predicate_list, profiler):
+    filters = compile_filters(predicate_list, profiler)
+    if isinstance(node_test, NameTest):
+        def step(input_node_set, context):
+            uri, name = node_test.expand(context)
+            return _generate_children(input_node_set, iter_child_element_nodes,
+                                      (uri, name), filters, context)
+        return step
+
+    if isinstance(node_test, NodeType) and node_test.name == "node":
+        children = get_child_nodes
+    elif isinstance(node_test, NodeType) and node_test.name == "text":
+        children = get_child_text_nodes
+    else:
+        def step(input_node_set, context):
+            return []
+        return step
+
+    def step(input_node_set, context):
+        return _generate_children(input_node_set, children, (),
+                                  filters, context)
+    return step
+
+def _generate_children(input_node_set, children, args, filters, context):
+    for context_node in input_node_set:
+        node_set = children(context_node, *args)
+        for filter in filters:
+            node_set = filter(node_set, context)
+        for node in node_set:
+            yield node
+
+def compile_generated_axis(axis):
+    def compile_axis(node_test, predicate_list, profiler):
+        resolved = resolve_node_test(axis, node_test)
+        if resolved is None:
+            def step(input_node_set, context):
+                return []
+            return step
+
+        generator, make_test = resolved
+        filters = compile_filters(predicate_list, profiler)
+        def step(input_node_set, context):
+            return collect_axis(input_node_set, axis, generator,
+                                make_test(context), filters, context)
+        return step
+    return compile_axis
+
+_axis_compilers = {
+    "self" : compile_self_axis,
+    "attribute" : compile_attribute_axis,
+    "child" : compile_child_axis,
+    }
+for name in axes:
+    _axis_compilers[name] = compile_generated_axis(axes[name])
+del name
+
+_compilers = {
+    Literal : compile_constant,
+    Number : compile_constant,
+    VariableReference : compile_variable_reference,
+    UnaryOp : compile_unary_op,
+    BinaryOp : compile_binary_op,
+    FunctionCall : compile_function_call,
+    Root : compile_root,
+    LocationStep : compile_location_step,
+    SharedStep : compile_shared_step,
+    }
@@ -30,29 +30,49 @@
 XPath evaluation context
 """
 
-class Context:
-    def __init__(self, document, element, namespace_mapping = None):
+from edgy.xml.xpath.xpath_exceptions import XPathEvaluationError
+
+class Context(object):
+    __slots__ = ["root", "namespace_mapping", "variables", "node",
+                 "initial", "position", "size", "slots"]
+
+    def __init__(self, document, element, namespace_mapping = None,
+                 variables = None):
         self.root = (document,)
         if namespace_mapping is None:
             self.namespace_mapping = {}
         else:
             self.namespace_mapping = namespace_mapping
+        if variables is None:
+            self.variables = {}
+        else:
+            self.variables = variables
 
         self.node = element
         self.initial = self.node	# initial context node
         self.position = 1
         self.size = 1
+        self.slots = None               # shared values, see XPathSet
 
     def clone(self):
-        context = Context(None)
+        context = Context(None, None)
         context.root = self.root
         context.namespace_mapping = self.namespace_mapping
+        context.variables = self.variables
 
         context.node = self.node
+        context.initial = self.initial
         context.position = self.position
         context.size = self.size
+        context.slots = self.slots
 
         return context
 
     def get_root(self):
         return self.root
+
+    def get_variable(self, name):
+        try:
+            return self.variables[name]
+        except KeyError:
+            raise XPathEvaluationError, 'Unbound variable $%s.' % name
@@ -0,0 +1,437 @@
+#
+# edgy.xml.xpath.corpus
+#
+# Copyright (C) 2008 Edgeware AB.
+#
+
+"""
+Indexed XPath queries over many documents
+
+A Corpus holds a collection of documents and selects those for which
+an expression is true, as XPath.evaluate() with the document element
+as the context node would tell after conversion to a boolean:
+
+    corpus = Corpus()
+    for asset in assets:
+        corpus.add(asset)
+    for asset in corpus.select("/asset[@type = 'movie'] and rating > 3"):
+        ...
+
+Looping over the documents is slow when there are many of them, so
+the corpus keeps inverted indexes that map each of these to the
+documents it occurs in:
+
+ * the path of every element, the list of tags from the document
+   element down to it, as in ("asset", "meta", "title");
+ * the name of every attribute on the elements at each path;
+ * the value of every attribute on the elements at each path;
+ * the text of every element without child elements at each path,
+   unless it is longer than "max_text_length" characters.
+
+select() looks at the parts of the expression these indexes can
+answer: location paths made of child and descendant steps with name
+tests, used as booleans or compared with a string by "=", predicates
+of the same form, and "and" and "or" combinations of them.  It
+intersects and joins the documents listed for them to find the
+candidates, and only evaluates the rest of the expression against
+those.  When the indexes answer the whole expression, no document is
+evaluated at all.  explain() describes the candidates and what is
+left to evaluate for an expression.
+
+The indexes are made when a document is added, so a document that is
+modified afterwards must be passed to update() to be indexed again.
+"""
+
+from weakref import WeakKeyDictionary
+
+from edgy.xml.xpath.atoms import *
+from edgy.xml.xpath.syntax import BinaryOp, Root, LocationStep
+from edgy.xml.xpath.compiler import compile_expression
+from edgy.xml.xpath.analysis import is_positional_predicate
+from edgy.xml.xpath.context import Context
+from edgy.xml.xpath.data_model import get_string_value
+from edgy.xml.xpath.evaluate import make_variables, to_boolean
+
+# Stands for any number of elements in a path pattern, as between
+# the steps of a//b.
+_gap = object()
+
+class Corpus:
+    max_text_length = 256
+
+    def __init__(self, namespace_mapping = None):
+        if namespace_mapping is None:
+            namespace_mapping = {}
+        self.namespace_mapping = namespace_mapping
+        self._documents = {}            # Maps keys to documents.
+        self._entries = {}              # Maps keys to index entries.
+        self._postings = {}             # Maps index entries to key sets.
+        self._paths = {}                # Maps paths to key sets.
+        self._matches = {}              # Maps patterns to matching paths.
+        self._conjuncts = WeakKeyDictionary()   # See _get_conjuncts().
+        self._next_key = 0
+
+    def __len__(self):
+        return len(self._documents)
+
+    def __getitem__(self, key):
+        return self._documents[key]
+
+    def add(self, document):
+        """
+        Add a document element to the corpus, and return the key to
+        remove it or update it with.  Keys increase in the order the
+        documents are added.
+        """
+        key = self._next_key
+        self._next_key += 1
+        self._documents[key] = document
+        self._index(key, document)
+        return key
+
+    def remove(self, key):
+        self._unindex(key)
+        del self._documents[key]
+
+    def update(self, key):
+        """
+        Index the document with the key again, after it was modified.
+        """
+        self._unindex(key)
+        self._index(key, self._documents[key])
+
+    def _index(self, key, document):
+        entries = set()
+        stack = [(document, ())]
+        while stack:
+            element, path = stack.pop()
+            path = path + (element.tag,)
+            entries.add(("path", path))
+            for name in element.keys():
+                entries.add(("attribute", path, name))
+                entries.add(("value", path, name, element.get(name)))
+            children = [x for x in element if isinstance(x.tag, basestring)]
+            if children:
+                entries.add(("mixed", path))
+                for child in children:
+                    stack.append((child, path))
+            else:
+                text = get_string_value(element)
+                if len(text) <= self.max_text_length:
+                    entries.add(("text", path, text))
+
+        for entry in entries:
+            keys = self._postings.get(entry)
+            if keys is None:
+                keys = self._postings[entry] = set()
+                if entry[0] == "path":
+                    self._paths[entry[1]] = keys
+                    self._matches.clear()
+            keys.add(key)
+        self._entries[key] = entries
+
+    def _unindex(self, key):
+        for entry in self._entries.pop(key):
+            keys = self._postings[entry]
+            keys.discard(key)
+            if not keys:
+                del self._postings[entry]
+                if entry[0] == "path":
+                    del self._paths[entry[1]]
+                    self._matches.clear()
+
+    def select(self, xpath, variables = None):
+        """
+        Return the documents for which the expression is true, in the
+        order they were added.
+
+        xpath -- expression, as a string or an XPath instance.  Strings
+        are compiled with the namespace mapping of the corpus by
+        compile(), and share its cache.
+        variables -- dictionary binding variable names to values, as
+        for XPath.evaluate().
+        """
+        variables = make_variables(variables)
+        candidates, residual, namespace_mapping = \
+                    self._plan(xpath, variables)
+        if candidates is None:
+            candidates = self._documents.keys()
+        functions = [function for node, function in residual]
+        result = []
+        for key in sorted(candidates):
+            document = self._documents[key]
+            for function in functions:
+                context = Context(document, document, namespace_mapping,
+                                  variables)
+                if not to_boolean(function(context)):
+                    break
+            else:
+                result.append(document)
+        return result
+
+    def explain(self, xpath, variables = None):
+        """
+        Return a description of how select() would find the documents
+        for the expression: the number of candidates the indexes leave,
+        and the parts of the expression evaluated against each.
+        """
+        candidates, residual, namespace_mapping = \
+                    self._plan(xpath, make_variables(variables))
+        if candidates is None:
+            count = len(self._documents)
+        else:
+            count = len(candidates)
+        lines = ["%d of %d documents" % (count, len(self._documents))]
+        for node, function in residual:
+            lines.append("evaluate %s" % node)
+        return "\n".join(lines)
+
+    def _plan(self, xpath, variables):
+        # Return the keys of the candidate documents, or None for all
+        # of them, and the list of conjuncts of the expression that
+        # the candidates must be evaluated against, as (node, function)
+        # pairs, and the namespace mapping to evaluate them with.
+        if isinstance(xpath, basestring):
+            xpath = _compile(xpath, self.namespace_mapping)
+        namespace_mapping = xpath.namespace_mapping
+        context = Context(None, None, namespace_mapping, variables)
+        candidates = None
+        residual = []
+        for conjunct in self._get_conjuncts(xpath):
+            plan = self._plan_node(conjunct[0], (None,), True, context)
+            if plan is None:
+                residual.append(conjunct)
+                continue
+            keys, exact = plan
+            if candidates is None:
+                candidates = keys
+            else:
+                candidates = candidates & keys
+            if not exact:
+                residual.append(conjunct)
+        return candidates, residual, namespace_mapping
+
+    def _get_conjuncts(self, xpath):
+        # Return the operands of the "and" operators at the top of the
+        # expression of an XPath, as (node, function) pairs.  They are
+        # kept as long as the XPath is, so that selecting with the
+        # same expression again does not compile them again.  Which
+        # of them have to be evaluated depends on the indexes and the
+        # variables, so that is worked out every time.
+        conjuncts = self._conjuncts.get(xpath)
+        if conjuncts is None:
+            nodes = []
+            _split_and(xpath.parsed_xpath, nodes)
+            if len(nodes) == 1:
+                conjuncts = [(nodes[0], xpath.compiled_xpath)]
+            else:
+                conjuncts = [(node, compile_expression(node))
+                             for node in nodes]
+            self._conjuncts[xpath] = conjuncts
+        return conjuncts
+
+    def _plan_node(self, node, base, per_document, context):
+        # Return (keys, exact) where keys is a set containing the keys
+        # of the documents for which node may be true, and exact is
+        # true if node is true for all of them, or None if the indexes
+        # cannot tell.  Relative paths start at the elements matching
+        # the pattern base, of which each document has at most one if
+        # per_document is true.
+        if isinstance(node, LocationStep):
+            return self._plan_path(node, base, context)
+        elif not isinstance(node, BinaryOp):
+            return None
+        elif node.op == "=":
+            return self._plan_equality(node, base, context)
+        elif node.op not in ("and", "or"):
+            return None
+
+        left = self._plan_node(node.left, base, per_document, context)
+        right = self._plan_node(node.right, base, per_document, context)
+        if node.op == "or":
+            if left is None or right is None:
+                return None
+            return left[0] | right[0], left[1] and right[1]
+        else:
+            # Two predicates may be true of different elements in the
+            # same document, so only a document-wide "and" is exact.
+            if left is None:
+                return right and (right[0], False)
+            if right is None:
+                return left[0], False
+            return left[0] & right[0], \
+                   per_document and left[1] and right[1]
+
+    def _plan_path(self, node, base, context):
+        path = self._get_pattern(node, base, context)
+        if path is None:
+            return None
+        pattern, attribute, exact = path
+        if attribute is not None:
+            keys = self._lookup(pattern, "attribute", attribute)
+            return keys, exact and not node.predicate_list
+
+        # Each document has only one element at the path of length 1,
+        # its document element.
+        per_document = len(pattern) == 1
+        predicates = node.predicate_list
+        keys = self._lookup(pattern)
+        for predicate in predicates:
+            plan = None
+            if not is_positional_predicate(predicate):
+                plan = self._plan_node(predicate, pattern, per_document,
+                                       context)
+            if plan is None:
+                exact = False
+            else:
+                keys = keys & plan[0]
+                exact = exact and plan[1] \
+                        and (per_document or len(predicates) == 1)
+        return keys, exact
+
+    def _plan_equality(self, node, base, context):
+        for step, value in [(node.left, node.right),
+                            (node.right, node.left)]:
+            if isinstance(step, LocationStep):
+                value = self._get_string(value, context)
+                if value is not None:
+                    break
+        else:
+            return None
+        path = self._get_pattern(step, base, context)
+        if path is None:
+            return None
+        pattern, attribute, exact = path
+        # Predicates of the last step are left to evaluation.
+        exact = exact and not step.predicate_list
+
+        if attribute is not None:
+            return self._lookup(pattern, "value", attribute, value), exact
+        if len(value) > self.max_text_length:
+            return self._lookup(pattern), False
+        # Elements with child elements are not in the text index, so
+        # the documents with any at the path may match too.
+        mixed = self._lookup(pattern, "mixed")
+        return self._lookup(pattern, "text", value) | mixed, \
+               exact and not mixed
+
+    def _get_string(self, node, context):
+        # Return the value of a literal or of a variable bound to a
+        # string, or None for anything else.
+        if isinstance(node, Literal):
+            return node.value
+        elif isinstance(node, VariableReference):
+            value = context.variables.get(node.get_name(context))
+            if isinstance(value, basestring):
+                return value
+        return None
+
+    def _get_pattern(self, node, base, context):
+        # Return (pattern, attribute, exact) for a location path made
+        # of steps that the indexes know about, or None otherwise.
+        # The pattern matches the paths of the elements the path
+        # selects, or of their parents if it selects the attribute
+        # named by attribute.  Exact is false if the pattern matches
+        # more than the path selects, because of predicates before
+        # the last step or a namespace wildcard.
+        steps = []
+        while isinstance(node, LocationStep):
+            steps.append(node)
+            node = node.prefix
+        if node is None:
+            pattern = list(base)
+        elif isinstance(node, Root):
+            pattern = []
+        else:
+            return None
+        steps.reverse()
+
+        attribute = None
+        exact = True
+        for step in steps:
+            if attribute is not None:
+                return None
+            if step is not steps[-1] and step.predicate_list:
+                exact = False
+            axis = step.axis
+            node_test = step.node_test
+            if isinstance(node_test, NodeType):
+                if node_test.name != "node":
+                    return None
+                elif axis == "self":
+                    continue
+                elif axis == "descendant-or-self" and step is not steps[-1]:
+                    pattern.append(_gap)
+                    continue
+                else:
+                    return None
+            elif not isinstance(node_test, NameTest):
+                return None
+            uri, name = node_test.expand(context)
+            if name is None:
+                tag = None
+                if uri is not None:
+                    exact = False
+            elif uri:
+                tag = "{%s}%s" % (uri, name)
+            else:
+                tag = name
+            if axis == "child":
+                pattern.append(tag)
+            elif axis == "descendant":
+                pattern.append(_gap)
+                pattern.append(tag)
+            elif axis == "attribute" and tag is not None:
+                attribute = tag
+            else:
+                return None
+        if attribute is None and (not pattern or pattern[-1] is _gap):
+            # The path selects the root node.
+            return None
+        return tuple(pattern), attribute, exact
+
+    def _lookup(self, pattern, kind = "path", *args):
+        # Return the set of keys of the documents with the entry of
+        # the kind for the paths matching the pattern.
+        paths = self._matches.get(pattern)
+        if paths is None:
+            paths = self._matches[pattern] = \
+                    [x for x in self._paths if _match(pattern, x)]
+        keys = set()
+        for path in paths:
+            if kind == "path":
+                entry = self._paths[path]
+            else:
+                entry = self._postings.get((kind, path) + args, ())
+            keys.update(entry)
+        return keys
+
+def _compile(xpath, namespace_mapping):
+    # The package imports this module, so compile() is imported when
+    # it is first needed.
+    from edgy.xml.xpath import compile
+    return compile(xpath, namespace_mapping)
+
+def _split_and(node, conjuncts):
+    if isinstance(node, BinaryOp) and node.op == "and":
+        _split_and(node.left, conjuncts)
+        _split_and(node.right, conjuncts)
+    else:
+        conjuncts.append(node)
+
+def _match(pattern, path, i = 0, j = 0):
+    # Return true if the path, a tuple of tags, matches the pattern
+    # from its ith item and from the jth tag on.  None in a pattern
+    # matches any tag.
+    while i < len(pattern):
+        item = pattern[i]
+        if item is _gap:
+            for k in range(j, len(path) + 1):
+                if _match(pattern, path, i + 1, k):
+                    return True
+            return False
+        if j == len(path) or (item is not None and item != path[j]):
+            return False
+        i += 1
+        j += 1
+    return j == len(path)
@@ -36,16 +36,101 @@ of the XPath data model node types:
  * element node -- Element.
  * text or attribute node -- string.
 
+Elements need not be edgy.xml.element.Element objects.  Any object
+with a "tag" attribute is taken to be an element, and is accessed
+only through this part of the element interface:
+
+ * tag -- the name of the element, in Clark notation.
+ * text, tail -- text before the first child and after the end tag.
+ * parent -- the parent element, or None for the document element.
+ * get(name) -- the value of an attribute, or None.
+ * len(), iteration and indexing -- the child elements.
+ * index(child) -- the position of a child element.
+
+So other kinds of objects can be queried by presenting them through
+this interface, as edgy.xml.binder.ModelNode does for model objects.
+Edgy elements also cache string values and support the tag, attribute
+and document order indexes, which other elements go without.
+
 We represent node sets as sequences.  They can be lists, but we also
 take advantage of the fact that a root or element node is effectively
-a sequence containing its element children.
+a sequence containing its element children.  Location steps return
+a NodeSet, which generates its nodes only as they are asked for.
 """
 
+from itertools import chain
+
 from edgy.xml.element import iselement
 
 
+class NodeSet:
+    """
+    Lazily evaluated node set
+
+    The nodes come from an iterator and are kept as they are
+    generated, so the node set can be iterated over any number of
+    times.  Iterating, indexing and testing for emptiness only
+    generate as many nodes as needed; len() generates all of them.
+    """
+    def __init__(self, nodes):
+        self._nodes = []
+        self._source = iter(nodes)
+
+    def _fill(self, count = None):
+        # Generate nodes until there are count of them, or all of
+        # them if count is None.
+        nodes = self._nodes
+        source = self._source
+        if source is None:
+            return
+        try:
+            if count is None:
+                nodes.extend(source)
+                self._source = None
+            else:
+                while len(nodes) < count:
+                    nodes.append(source.next())
+        except StopIteration:
+            self._source = None
+
+    def __iter__(self):
+        if self._source is None:
+            return iter(self._nodes)
+        return self._generate()
+
+    def _generate(self):
+        nodes = self._nodes
+        i = 0
+        while True:
+            if i == len(nodes):
+                self._fill(i + 1)
+                if i == len(nodes):
+                    return
+            yield nodes[i]
+            i += 1
+
+    def __len__(self):
+        self._fill()
+        return len(self._nodes)
+
+    def __nonzero__(self):
+        self._fill(1)
+        return len(self._nodes) > 0
+
+    def __getitem__(self, index):
+        if isinstance(index, slice) or index < 0:
+            self._fill()
+        else:
+            self._fill(index + 1)
+        return self._nodes[index]
+
+    def __repr__(self):
+        if self._source is None:
+            return "NodeSet(%r)" % self._nodes
+        return "NodeSet(%r + ...)" % self._nodes
+
 def is_node_set(x):
-    return isinstance(x, (list, tuple)) or iselement(x)
+    return isinstance(x, (list, tuple, NodeSet)) or iselement(x)
 
 def join_node_sets(x, y):
     if len(x) == 0:
@@ -59,6 +144,67 @@ def join_node_sets(x, y):
             y = list(y)
         return x + y
 
+def union_node_sets(x, y, root):
+    """
+    Return the union of two node sets.
+
+    The result is in document order, without duplicates, if the
+    document keeps track of its order (see get_document_order).  For
+    other documents, and for node sets with text or attribute nodes,
+    which cannot be ordered, it is the nodes of x followed by those of
+    y, with duplicate element nodes removed.
+    """
+    if not isinstance(x, list):
+        x = list(x)
+    if not isinstance(y, list):
+        y = list(y)
+    if len(x) == 0:
+        return y
+    elif len(y) == 0:
+        return x
+
+    order = get_document_order(root)
+    if order is not None:
+        ordinals = []
+        nodes = {}
+        for node in chain(x, y):
+            if is_root_node(node):
+                ordinal = -1
+            else:
+                ordinal = order.get(id(node))
+                if ordinal is None:
+                    break
+            if ordinal not in nodes:
+                nodes[ordinal] = node
+                ordinals.append(ordinal)
+        else:
+            # Node sets are usually in document order already, and
+            # sorting two runs that are already sorted is a merge.
+            ordinals.sort()
+            return [nodes[ordinal] for ordinal in ordinals]
+
+    result = []
+    seen = set()
+    for node in chain(x, y):
+        if not is_text_node(node):
+            if id(node) in seen:
+                continue
+            seen.add(id(node))
+        result.append(node)
+    return result
+
+def get_document_order(root):
+    """
+    Return a dictionary mapping the id() of every element in the
+    document of the root node to its ordinal in document order, as
+    returned by Element.getDocumentOrder(), or None if the document
+    does not keep one.
+    """
+    document = root[0]
+    if hasattr(document, "getDocumentOrder"):
+        return document.getDocumentOrder()
+    return None
+
 def is_root_node(node):
     return isinstance(node, tuple)
 
@@ -77,7 +223,24 @@ def is_text_node(node):
     return isinstance(node, (str, unicode))
 
 def get_string_value(node):
-    return "".join(get_text_nodes(node))
+    """
+    Return the string value of a node.
+
+    The string value of an edgy.xml.element.Element is cached on the
+    element until the element or one of its descendants is modified.
+    """
+    if is_text_node(node):
+        return node
+    if is_root_node(node):
+        node = node[0]
+    try:
+        value = node._stringValue
+    except AttributeError:
+        # Elements of other kinds have nowhere to cache the value.
+        return "".join(get_text_nodes(node))
+    if value is None:
+        value = node._stringValue = "".join(get_text_nodes(node))
+    return value
 
 def get_expanded_name(element):
     tag = element.tag
@@ -114,6 +277,27 @@ def get_child_element_nodes(node, uri = None, name = None):
         else:
             return node                 # Container with child elements.
 
+def iter_child_element_nodes(node, uri = None, name = None):
+    """
+    Generate the same nodes as get_child_element_nodes(), without
+    looking at any more children than are consumed.
+    """
+    if is_element_node(node) and (name or uri):
+        if name:
+            if uri:
+                name = "{%s}%s" % (uri, name)
+            for child in node:
+                if child.tag == name:
+                    yield child
+        else:
+            prefix = "{%s}" % uri
+            for child in node:
+                if child.tag.startswith(prefix):
+                    yield child
+    else:
+        for child in get_child_element_nodes(node, uri, name):
+            yield child
+
 def get_child_text_nodes(node):
     result = []
     if is_element_node(node):
@@ -171,3 +355,166 @@ def push_text_nodes(buffer, element):
         push_text_nodes(buffer, child)
         if child.tail:
             buffer.append(child.tail)
+
+#
+# Axis traversal
+#
+# The following generators yield the nodes on an axis lazily, in axis
+# order: document order for forward axes and reverse document order
+# for reverse axes.  They all take the node and the root node of the
+# document, which is needed to step from the document element to the
+# root node.  The *_elements variants skip text nodes.
+#
+
+def get_parent_node(node, root):
+    if not is_element_node(node):
+        return None
+    elif node is root[0]:
+        return root
+    else:
+        return node.parent
+
+def iter_parent_node(node, root):
+    parent = get_parent_node(node, root)
+    if parent is not None:
+        yield parent
+
+def iter_parent_element(node, root):
+    parent = get_parent_node(node, root)
+    if parent is not None and not is_root_node(parent):
+        yield parent
+
+def iter_descendant_elements(node, root = None):
+    if is_root_node(node):
+        yield node[0]
+        node = node[0]
+    elif not is_element_node(node):
+        return
+
+    stack = [iter(node)]
+    while stack:
+        for child in stack[-1]:
+            yield child
+            stack.append(iter(child))
+            break
+        else:
+            stack.pop()
+
+def iter_descendant_nodes(node, root = None):
+    if is_root_node(node):
+        element = node[0]
+        yield element
+    elif is_element_node(node):
+        element = node
+    else:
+        return
+
+    if element.text:
+        yield element.text
+    stack = [(iter(element), None)]
+    while stack:
+        children, parent = stack[-1]
+        for child in children:
+            yield child
+            if child.text:
+                yield child.text
+            stack.append((iter(child), child))
+            break
+        else:
+            stack.pop()
+            if parent is not None and parent.tail:
+                yield parent.tail
+
+def iter_descendant_or_self_elements(node, root = None):
+    if is_element_node(node):
+        yield node
+    for x in iter_descendant_elements(node):
+        yield x
+
+def iter_descendant_or_self_nodes(node, root = None):
+    yield node
+    for x in iter_descendant_nodes(node):
+        yield x
+
+def iter_ancestor_nodes(node, root):
+    node = get_parent_node(node, root)
+    while node is not None:
+        yield node
+        node = get_parent_node(node, root)
+
+def iter_ancestor_elements(node, root):
+    for x in iter_ancestor_nodes(node, root):
+        if not is_root_node(x):
+            yield x
+
+def iter_ancestor_or_self_nodes(node, root):
+    yield node
+    for x in iter_ancestor_nodes(node, root):
+        yield x
+
+def iter_ancestor_or_self_elements(node, root):
+    for x in iter_ancestor_or_self_nodes(node, root):
+        if is_element_node(x):
+            yield x
+
+def _get_sibling_position(node, root):
+    # Return (parent, index) for an element with siblings, or None.
+    if not is_element_node(node) or node is root[0]:
+        return None
+    parent = node.parent
+    if parent is None:
+        return None
+    return parent, parent.index(node)
+
+def iter_following_sibling_elements(node, root):
+    position = _get_sibling_position(node, root)
+    if position is not None:
+        parent, index = position
+        for i in xrange(index + 1, len(parent)):
+            yield parent[i]
+
+def iter_following_sibling_nodes(node, root):
+    position = _get_sibling_position(node, root)
+    if position is not None:
+        parent, index = position
+        if node.tail:
+            yield node.tail
+        for i in xrange(index + 1, len(parent)):
+            sibling = parent[i]
+            yield sibling
+            if sibling.tail:
+                yield sibling.tail
+
+def iter_preceding_sibling_elements(node, root):
+    position = _get_sibling_position(node, root)
+    if position is not None:
+        parent, index = position
+        for i in xrange(index - 1, -1, -1):
+            yield parent[i]
+
+def iter_preceding_sibling_nodes(node, root):
+    position = _get_sibling_position(node, root)
+    if position is not None:
+        parent, index = position
+        for i in xrange(index - 1, -1, -1):
+            sibling = parent[i]
+            if sibling.tail:
+                yield sibling.tail
+            yield sibling
+        if parent.text:
+            yield parent.text
+
+def is_descendant(node, ancestor):
+    """
+    Return true if node is a proper descendant of ancestor.
+    """
+    if is_root_node(ancestor):
+        return not is_root_node(node)
+    if not is_element_node(node):
+        return False
+    node = node.parent
+    while node is not None:
+        if node is ancestor:
+            return True
+        node = node.parent
+    return False
@@ -30,10 +30,8 @@
 Subroutines used by evaluate() methods in syntax.py
 """
 
-try:
-    from math import floor, ceil
-except ImportError:
-    from pdis.lib.compat import floor, ceil
+import operator
+from itertools import ifilter, islice, imap, chain
 
 from edgy.xml.xpath.xpath_exceptions import \
      XPathNotImplementedError, XPathEvaluationError
@@ -50,14 +48,43 @@ def is_boolean(x):
     # Booleans are int in Python 2.2 and bool in Python 2.3.
     return isinstance(x, type(True))
 
+def make_value(x):
+    """
+    Return the XPath value of a Python object bound to a variable.
+
+    Booleans, numbers and strings become the corresponding XPath
+    values, and an element or a sequence of nodes becomes a node set.
+    """
+    if is_boolean(x) or is_number(x) or is_string(x):
+        return x
+    elif isinstance(x, (int, long)):
+        return float(x)
+    elif iselement(x):
+        return [x]
+    elif is_node_set(x):
+        return x
+    else:
+        raise XPathEvaluationError, \
+              "Cannot convert %r to an XPath value." % (x,)
+
+def make_variables(variables):
+    """
+    Return a dictionary of variable bindings, with the values
+    converted by make_value().
+    """
+    result = {}
+    if variables:
+        for name, value in variables.iteritems():
+            result[name] = make_value(value)
+    return result
+
 def to_string(x):
     if is_string(x):
         return x
     elif is_node_set(x):
-        if len(x) > 0:
-            return get_string_value(x[0])
-        else:
-            return ""
+        for node in x:
+            return get_string_value(node)
+        return ""
     elif is_number(x):
         if int(x) == x:
             x = int(x)
@@ -71,13 +98,47 @@ def to_string(x):
         assert False
 
 def to_number(x):
-    if is_node_set(x):
-        x = to_string(x)
-    try:
+    if is_string(x):
+        return _string_to_number(x)
+    elif is_node_set(x):
+        for node in x:
+            return get_number_value(node)
+        return _string_to_number("")
+    else:
         return float(x)
+
+def to_numbers(node_set):
+    """
+    Return a list with the number value of every node in node_set.
+    """
+    return map(get_number_value, node_set)
+
+def get_number_value(node):
+    """
+    Return the string value of a node converted to a number.
+
+    Like the string value, the number is cached on elements that
+    support it (see get_string_value).
+    """
+    if is_text_node(node):
+        return _string_to_number(node)
+    if is_root_node(node):
+        node = node[0]
+    try:
+        value = node._numberValue
+    except AttributeError:
+        return _string_to_number(get_string_value(node))
+    if value is None:
+        value = node._numberValue = \
+                _string_to_number(get_string_value(node))
+    return value
+
+def _string_to_number(s):
+    try:
+        return float(s)
     except ValueError:
         raise XPathEvaluationError, \
-              'Could not convert "%s" to number.' % x
+              'Could not convert "%s" to number.' % s
 
 def to_boolean(x):
     if is_boolean(x):
@@ -85,7 +146,9 @@ def to_boolean(x):
     elif is_number(x):
         return x != 0
     elif is_node_set(x):
-        return len(x) > 0
+        for node in x:
+            return True
+        return False
     elif is_string(x):
         return len(x) > 0
     else:
@@ -101,68 +164,90 @@ relational_transpose = {
     }
 
 def compare(op, x, y):
+    test, transposed_test = comparisons[op]
+    return compare_values(test, transposed_test, x, y)
+
+def compare_values(test, transposed_test, x, y):
+    """
+    Compare two XPath values using the given comparison functions.
+
+    test -- function comparing two non-node-set values.
+    transposed_test -- the same comparison with the operands swapped.
+
+    Node sets are only looked at until a pair of values that passes
+    the test is found.
+    """
     x_is_node_set = is_node_set(x)
     y_is_node_set = is_node_set(y)
     if x_is_node_set and y_is_node_set:
-        x = map(get_string_value, x)
-        y = map(get_string_value, y)
-        for xx in x:
-            for yy in y:
-                if compare2(op, xx, yy):
-                    return True
+        y_values = None
+        for xx in imap(get_string_value, x):
+            if y_values is None:
+                # Convert y while comparing it with the first node of x.
+                y_values = []
+                for yy in imap(get_string_value, y):
+                    if test(xx, yy):
+                        return True
+                    y_values.append(yy)
+            else:
+                for yy in y_values:
+                    if test(xx, yy):
+                        return True
         return False
     elif x_is_node_set or y_is_node_set:
         if y_is_node_set:
-            op = relational_transpose[op]
+            test = transposed_test
             x, y = y, x
         if is_number(y):
-            x = map(get_string_value, x)
-            x = map(to_number, x)
-            for xx in x:
-                if compare2(op, xx, y):
+            for xx in imap(get_number_value, x):
+                if test(xx, y):
                     return True
             return False
         elif is_string(y):
-            x = map(get_string_value, x)
             for xx in x:
-                if compare2(op, xx, y):
+                if test(get_string_value(xx), y):
                     return True
             return False
         elif is_boolean(y):
-            return compare2(op, to_boolean(x), y)
+            return test(to_boolean(x), y)
     else:
-        return compare2(op, x, y)
+        return test(x, y)
 
 def compare2(op, x, y):
-    if op in ['=', '!=']:
-        if is_boolean(x) or is_boolean(y):
-            x = to_boolean(x)
-            y = to_boolean(y)
-        elif is_number(x) or is_number(y):
-            x = to_number(x)
-            y = to_number(y)
-        else:
-            x = to_string(x)
-            y = to_string(y)
-        if op == '=':
-            return x == y
-        else:
-            return x != y
-    elif op in ['<', '>', '<=', '>=']:
-        x = to_number(x)
-        y = to_number(y)
-        if op == '<':
-            return x < y
-        elif op == '>':
-            return x > y
-        elif op == '<=':
-            return x <= y
-        elif op == '>=':
-            return x >= y
-        else:
-            assert False
+    return comparisons[op][0](x, y)
+
+def equal(x, y):
+    if is_boolean(x) or is_boolean(y):
+        return to_boolean(x) == to_boolean(y)
+    elif is_number(x) or is_number(y):
+        return to_number(x) == to_number(y)
     else:
-        assert False
+        return to_string(x) == to_string(y)
+
+def not_equal(x, y):
+    return not equal(x, y)
+
+def _relational(test):
+    def compare(x, y):
+        return test(to_number(x), to_number(y))
+    return compare
+
+less_than = _relational(operator.lt)
+greater_than = _relational(operator.gt)
+less_than_or_equal = _relational(operator.le)
+greater_than_or_equal = _relational(operator.ge)
+
+# Maps each relational operator to a pair of functions: one that
+# compares two values, and one that does the same comparison with
+# the operands swapped.
+comparisons = {
+    '=' : (equal, equal),
+    '!=' : (not_equal, not_equal),
+    '<' : (less_than, greater_than),
+    '>' : (greater_than, less_than),
+    '<=' : (less_than_or_equal, greater_than_or_equal),
+    '>=' : (greater_than_or_equal, less_than_or_equal),
+    }
 
 def do_step(input_node_set, axis, node_test, predicate_list, context):
     if axis == "self":
@@ -181,7 +266,7 @@ def do_step(input_node_set, axis, node_test, predicate_list, context):
             node_set = ()
 
         for predicate in predicate_list:
-            node_set = filter_singleton_nodes(node_set, predicate, context)
+            node_set = filter_singleton_nodes(node_set, predicate.evaluate, context)
         return node_set
     elif axis == "attribute":
         if isinstance(node_test, atoms.NameTest):
@@ -199,7 +284,7 @@ def do_step(input_node_set, axis, node_test, predicate_list, context):
                   'Only name tests supported for attribute references.'
 
         for predicate in predicate_list:
-            node_set = filter_singleton_nodes(node_set, predicate, context)
+            node_set = filter_singleton_nodes(node_set, predicate.evaluate, context)
         return node_set
     elif axis == "child":
         result = []
@@ -218,218 +303,296 @@ def do_step(input_node_set, axis, node_test, predicate_list, context):
                 node_set = ()
 
             for predicate in predicate_list:
-                node_set = filter_node_set(node_set, predicate, context)
-            result = join_node_sets(result, node_set)
-        return result
-    elif axis == "parent":
-        result = []
-        if input_node_set:
-            for context_node in input_node_set:
-                if context_node.parent is not None:
-                    result.append(context_node.parent)
+                node_set = filter_node_set(node_set, predicate.evaluate, context)
+            result.extend(node_set)
         return result
+    elif axis in axes:
+        axis = axes[axis]
+        resolved = resolve_node_test(axis, node_test)
+        if resolved is None:
+            return []
+        generator, make_test = resolved
+        filters = [predicate_filter(predicate.evaluate)
+                   for predicate in predicate_list]
+        return list(collect_axis(input_node_set, axis, generator,
+                                 make_test(context), filters, context))
     else:
         raise XPathNotImplementedError, '"%s" axis not supported.' % axis
 
-def filter_singleton_nodes(node_set, predicate, context_context):
+class Axis:
+    """
+    Axis traversed by the generators in data_model
+
+    nodes -- generator yielding all the nodes on the axis.
+    elements -- generator yielding only the elements on the axis.
+    reverse -- true for reverse axes.
+    nested -- true if the axis of a node includes the axes of its
+    descendants, which means that nested context nodes can be skipped.
+    """
+    def __init__(self, nodes, elements, reverse = False, nested = False):
+        self.nodes = nodes
+        self.elements = elements
+        self.reverse = reverse
+        self.nested = nested
+
+axes = {
+    "parent" :
+        Axis(iter_parent_node, iter_parent_element, reverse = True),
+    "ancestor" :
+        Axis(iter_ancestor_nodes, iter_ancestor_elements, reverse = True),
+    "ancestor-or-self" :
+        Axis(iter_ancestor_or_self_nodes, iter_ancestor_or_self_elements,
+             reverse = True),
+    "descendant" :
+        Axis(iter_descendant_nodes, iter_descendant_elements, nested = True),
+    "descendant-or-self" :
+        Axis(iter_descendant_or_self_nodes, iter_descendant_or_self_elements,
+             nested = True),
+    "following-sibling" :
+        Axis(iter_following_sibling_nodes, iter_following_sibling_elements),
+    "preceding-sibling" :
+        Axis(iter_preceding_sibling_nodes, iter_preceding_sibling_elements,
+             reverse = True),
+    }
+
+def resolve_node_test(axis, node_test):
+    """
+    Choose the generator to use for node_test on axis.
+
+    The return value is None if no node can pass the test, and
+    otherwise (generator, make_test), where make_test(context)
+    returns either a function that tests a node or None if every
+    node generated passes.
+    """
+    if isinstance(node_test, atoms.NameTest):
+        def make_test(context):
+            uri, name = node_test.expand(context)
+            if uri is None and name is None:
+                return None
+            return lambda node: is_element_node(node, uri, name)
+        return axis.elements, make_test
+    elif isinstance(node_test, atoms.NodeType):
+        if node_test.name == "node":
+            return axis.nodes, lambda context: None
+        elif node_test.name == "text":
+            return axis.nodes, lambda context: is_text_node
+    return None
+
+def collect_axis(input_node_set, axis, generator, test, filters, context):
+    """
+    Generate the nodes on an axis from every node in input_node_set.
+
+    The filters, functions taking a node set and a context and
+    returning a filtered node set, apply the predicates of the step.
+    They are applied separately for each context node, in axis order,
+    and are handed the axis as an iterator, so that a filter that can
+    stop early keeps the rest of the axis from being generated.  The
+    nodes found from each context node are generated in document
+    order, without duplicates.
+    """
+    root = context.get_root()
+    nodes = iter(input_node_set)
+    for first in nodes:
+        break
+    else:
+        return
+    # Look ahead to find out if nodes can be reached twice.
+    for second in nodes:
+        several = True
+        nodes = chain((first, second), nodes)
+        break
+    else:
+        several = False
+        nodes = (first,)
+    seen = set()
+    last = None
+    for context_node in nodes:
+        if axis.nested and not filters:
+            if last is not None and is_descendant(context_node, last):
+                continue
+            last = context_node
+
+        node_set = generator(context_node, root)
+        if test is not None:
+            node_set = ifilter(test, node_set)
+        for filter in filters:
+            node_set = filter(node_set, context)
+        if axis.reverse:
+            node_set = list(node_set)
+            node_set.reverse()
+
+        if several:
+            for node in node_set:
+                if not is_text_node(node):
+                    if id(node) in seen:
+                        continue
+                    seen.add(id(node))
+                yield node
+        else:
+            for node in node_set:
+                yield node
+
+# The filters below evaluate predicates with the context they are
+# given, setting its node, position and size and restoring them
+# before they return or yield, instead of working on a copy.
+
+def filter_singleton_nodes(node_set, predicate, context):
+    """
+    Filter node_set, treating each node as a singleton node set.
+
+    predicate -- function taking a Context and returning the value
+    of the predicate expression.
+    """
     result = []
-    context = context_context.clone()
+    saved_node = context.node
+    saved_position = context.position
+    saved_size = context.size
     context.size = 1
     context.position = 1
-    for node in node_set:
-        context.node = node
-        if evaluate_predicate(predicate, context):
-            result.append(node)
+    try:
+        for node in node_set:
+            context.node = node
+            if evaluate_predicate(predicate, context):
+                result.append(node)
+    finally:
+        context.node = saved_node
+        context.position = saved_position
+        context.size = saved_size
     return result
 
-def filter_node_set(node_set, predicate, context_context):
+def filter_node_set(node_set, predicate, context):
+    """
+    Filter node_set, giving each node its proximity position.
+
+    predicate -- function taking a Context and returning the value
+    of the predicate expression.
+    """
     result = []
-    context = context_context.clone()
+    saved_node = context.node
+    saved_position = context.position
+    saved_size = context.size
     context.size = len(node_set)
-    context.position = 0
-    for node in node_set:
-        context.position += 1
-        context.node = node
-        if evaluate_predicate(predicate, context):
-            result.append(node)
+    position = 0
+    try:
+        for node in node_set:
+            position += 1
+            context.position = position
+            context.node = node
+            if evaluate_predicate(predicate, context):
+                result.append(node)
+    finally:
+        context.node = saved_node
+        context.position = saved_position
+        context.size = saved_size
     return result
 
-def evaluate_predicate(predicate, context):
-    value = predicate.evaluate(context)
-    if is_number(value):
-        return value == context.position
-    else:
-        return to_boolean(value)
+def stream_node_set(nodes, predicate, context):
+    """
+    Filter the nodes of an iterable lazily, giving each node its
+    proximity position.
 
-def do_function_call(name, args, context):
-    if name == "last":
-        check(name, not args)
-        return float(context.size)
-    elif name == "position":
-        check(name, not args)
-        return float(context.position)
-    elif name == "count":
-        check(name, len(args) == 1 and is_node_set(args[0]))
-        # XXX We should make sure the node set doesn't contain any
-        # duplicates.  However, that won't be possible when it
-        # contains text or attribute nodes.
-        return float(len(args[0]))
-    elif name == "id":
-        check(name, len(args) == 1)
-        raise XPathNotImplementedError, 'id() not supported.'
-    elif name in ["local-name", "namespace-uri", "name"]:
-        check(name, len(args) <= 1)
-        if args:
-            node_set = args[0]
-            check(name, is_node_set(node_set))
-            if len(node_set) == 0:
-                return ""
-            node = node_set[0]
-        else:
-            node = context.node
+    This is filter_node_set() for predicates that never look at the
+    context size, which is not known until all nodes have been seen.
+    Returns an iterator.
+    """
+    position = 0
+    for node in nodes:
+        position += 1
+        saved_node = context.node
+        saved_position = context.position
+        saved_size = context.size
+        context.node = node
+        context.position = position
+        context.size = None
+        try:
+            passed = evaluate_predicate(predicate, context)
+        finally:
+            context.node = saved_node
+            context.position = saved_position
+            context.size = saved_size
+        if passed:
+            yield node
 
-        if is_root_node(node):
-            uri, local_part = "", ""
-        elif is_element_node(node):
-            uri, local_part = get_expanded_name(node)
-        else:
-            # Text or attribute node.
-            raise XPathNotImplementedError, \
-                  '%s() not supported for this node type.' % name
+def predicate_filter(predicate, uses_size = True):
+    """
+    Return a filter function for a predicate.
 
-        if name == "local-name":
-            return local_part
-        elif name == "namespace-uri":
-            return uri
-        else:
-            assert name == "name"
-            if uri:
-                raise XPathNotImplementedError, \
-                      'name() not supported for qualified names.'
-            else:
-                return local_part
-    elif name == "string":
-        check(name, len(args) <= 1)
-        if args:
-            return to_string(args[0])
-        else:
-            return get_string_value(context.node)
-    elif name == "concat":
-        check(name, len(args) >= 2)
-        args = map(to_string, args)
-        return "".join(args)
-    elif name == "starts-with":
-        check(name, len(args) == 2)
-        args = map(to_string, args)
-        return args[0].startswith(args[1])
-    elif name == "contains":
-        check(name, len(args) == 2)
-        args = map(to_string, args)
-        return args[0].find(args[1]) >= 0
-    elif name == "substring-before":
-        check(name, len(args) == 2)
-        args = map(to_string, args)
-        k = args[0].find(args[1])
-        if k == -1:
-            return ""
-        else:
-            return args[0][:k]
-    elif name == "substring-after":
-        check(name, len(args) == 2)
-        args = map(to_string, args)
-        k = args[0].find(args[1])
-        if k == -1:
-            return ""
-        else:
-            k += len(args[1])
-            return args[0][k:]
-    elif name == "substring":
-        check(name, len(args) == 2 or len(args) == 3)
-        s = to_string(args[0])
-        i = int(round(to_number(args[1]))) - 1
-        if len(args) == 2:
-            i = max(i, 0)
-            return s[i:]
-        else:
-            k = int(round(to_number(args[2])))
-            j = i + k
-            i = max(i, 0)
-            return s[i:j]
-    elif name == "string-length":
-        check(name, len(args) <= 1)
-        if args:
-            s = to_string(args[0])
-        else:
-            s = get_string_value(context.node)
-        return float(len(s))
-    elif name == "normalize-space":
-        check(name, len(args) <= 1)
-        if args:
-            s = to_string(args[0])
-        else:
-            s = get_string_value(context.node)
-        s = s.strip()
-        return " ".join(s.split())
-    elif name == "translate":
-        check(name, len(args) == 3)
-        args = map(to_string, args)
-        args = map(unicode, args)
-        s, a, b = args
-        n = len(b)
-        d = a[n:]
-        a = a[:n]
-        table = {}
-        for c in d:
-            table[ord(c)] = None
-        for i in range(n):
-            c = a[i]
-            if ord(c) not in table:
-                table[ord(c)] = ord(b[i])
-        return s.translate(table)
-    elif name == "boolean":
-        check(name, len(args) == 1)
-        return to_boolean(args[0])
-    elif name == "not":
-        check(name, len(args) == 1)
-        return not to_boolean(args[0])
-    elif name == "true":
-        check(name, not args)
-        return True
-    elif name == "false":
-        check(name, not args)
-        return False
-    elif name == "lang":
-        check(name, len(args) == 1)
-        raise XPathNotImplementedError, 'lang() not supported.'
-    elif name == "number":
-        check(name, len(args) == 1)
-        if args:
-            s = args[0]
-        else:
-            s = get_string_value(context.node)
-        return to_number(s)
-    elif name == "sum":
-        check(name, len(args) == 1 and is_node_set(args[0]))
-        result = 0.0
-        for value in args[0]:
-            result += to_number(get_string_value(value))
-        return result
-    elif name == "floor":
-        check(name, len(args) == 1)
-        return floor(to_number(args[0]))
-    elif name == "ceil":
-        check(name, len(args) == 1)
-        return ceil(to_number(args[0]))
-    elif name == "round":
-        check(name, len(args) == 1)
-        return round(to_number(args[0]))
-    elif name == "current":
-        check(name, not args)
-        return [context.initial]
+    predicate -- function taking a Context and returning the value
+    of the predicate expression.
+    uses_size -- false if the predicate never looks at the context
+    size, in which case the nodes are filtered as they are generated.
+
+    The filter takes a node set, or any iterable of nodes, and a
+    Context, and returns the nodes that pass the predicate.
+    """
+    if uses_size:
+        def filter(nodes, context):
+            return filter_node_set(_as_sequence(nodes), predicate, context)
     else:
-        raise XPathEvaluationError, 'Unknown function %s().' % name
+        def filter(nodes, context):
+            return stream_node_set(nodes, predicate, context)
+    return filter
 
-def check(name, test):
-    if not test:
-        raise XPathEvaluationError, \
-              'Illegal argument list for %s().' % name
+def position_filter(position):
+    """
+    Return a filter function for a predicate that is the constant
+    number position.
+
+    No more nodes than position are taken from the input.
+    """
+    index = int(position) - 1
+    if index != position - 1 or index < 0:
+        def filter(nodes, context):
+            return []
+    else:
+        def filter(nodes, context):
+            if _is_sequence(nodes):
+                if index < len(nodes):
+                    return [nodes[index]]
+                return []
+            for node in islice(nodes, index, None):
+                return [node]
+            return []
+    return filter
+
+def prefix_filter(count):
+    """
+    Return a filter function that passes the first count nodes, for
+    predicates like [position() < 3].
+    """
+    count = max(int(count), 0)
+    def filter(nodes, context):
+        return islice(nodes, count)
+    return filter
+
+def last_filter(nodes, context):
+    """
+    Filter function for the predicate [last()].
+    """
+    if _is_sequence(nodes):
+        if len(nodes) > 0:
+            return [nodes[len(nodes) - 1]]
+        return []
+    last = None
+    for last in nodes:
+        pass
+    if last is None:
+        return []
+    return [last]
+
+def _is_sequence(nodes):
+    # True for node sets that know their length without generating
+    # their nodes.
+    return hasattr(nodes, "__len__") and not isinstance(nodes, NodeSet)
+
+def _as_sequence(nodes):
+    if _is_sequence(nodes):
+        return nodes
+    return list(nodes)
+
+def evaluate_predicate(predicate, context):
+    value = predicate(context)
+    if is_number(value):
+        return value == context.position
+    else:
+        return to_boolean(value)
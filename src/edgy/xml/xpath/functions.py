@@ -0,0 +1,387 @@
+#
+# edgy.xml.xpath.functions
+#
+# Copyright (C) 2008 Edgeware AB.
+#
+
+"""
+XPath function library
+
+Functions are looked up by name in a registry when an expression is
+compiled, so evaluation calls the implementation directly.  The
+registry holds the XPath 1.0 core functions, and applications can
+add extension functions of their own with register_function():
+
+    def date_before(context, x, y):
+        return iso8601.parse(to_string(x)) < iso8601.parse(to_string(y))
+
+    register_function("date-before", date_before, 2, 2,
+                      result_type = "boolean")
+
+An implementation is called with the evaluation Context followed by
+the values of the arguments.  Node sets may be passed as lazy NodeSet
+objects rather than lists, so test for them with is_node_set().
+
+Declaring the result type, and whether the function looks at the
+context position or size, tells the compiler more about expressions
+that call it (see analysis.py).
+
+Expressions that have already been compiled keep using the
+implementation that was registered at the time they were compiled.
+"""
+
+try:
+    from math import floor, ceil
+except ImportError:
+    from pdis.lib.compat import floor, ceil
+
+from edgy.xml.xpath.xpath_exceptions import \
+     XPathNotImplementedError, XPathEvaluationError, XPathParseError
+from edgy.xml.xpath.evaluate import \
+     to_string, to_number, to_numbers, to_boolean, get_number_value
+from edgy.xml.xpath.data_model import *
+from edgy.xml.xpath import index
+
+class Function:
+    """
+    Entry in the function library
+
+    name -- function name (a string).
+    function -- implementation, called as function(context, *args).
+    min_args -- minimum number of arguments.
+    max_args -- maximum number of arguments, or None for no limit.
+    result_type -- "boolean", "number", "string", "node-set", or None
+    if the type of the result is not known in advance.
+    uses_position -- true if the function looks at the context
+    position or size.
+    pure -- true if the result depends on nothing but the values of
+    the arguments, so that calls with constant arguments can be
+    evaluated at compile time.
+    """
+    def __init__(self, name, function, min_args=0, max_args=None,
+                 result_type=None, uses_position=False, pure=False):
+        self.name = name
+        self.function = function
+        self.min_args = min_args
+        self.max_args = max_args
+        self.result_type = result_type
+        self.uses_position = uses_position
+        self.pure = pure
+
+    def accepts(self, count):
+        """
+        Return true if the function can be called with count arguments.
+        """
+        if count < self.min_args:
+            return False
+        return self.max_args is None or count <= self.max_args
+
+_functions = {}
+
+def register_function(name, function, min_args=0, max_args=None,
+                      result_type=None, uses_position=False, pure=False):
+    """
+    Add a function to the library, replacing any previous function
+    with the same name.
+    """
+    _functions[name] = Function(name, function, min_args, max_args,
+                                result_type, uses_position, pure)
+
+def unregister_function(name):
+    """
+    Remove a function from the library.
+    """
+    del _functions[name]
+
+def get_function(name):
+    """
+    Return the library entry for name, or None.
+    """
+    return _functions.get(name)
+
+def lookup_function(name, count):
+    """
+    Resolve a function call with count arguments at compile time.
+
+    Raises XPathParseError if there is no such function or if it
+    cannot take that many arguments.
+    """
+    function = _functions.get(name)
+    if function is None:
+        raise XPathParseError, 'Unknown function %s().' % name
+    if not function.accepts(count):
+        raise XPathParseError, 'Illegal argument list for %s().' % name
+    return function
+
+def do_function_call(name, args, context):
+    """
+    Look up and call a function at evaluation time.
+    """
+    function = _functions.get(name)
+    if function is None:
+        raise XPathEvaluationError, 'Unknown function %s().' % name
+    check(name, function.accepts(len(args)))
+    return function.function(context, *args)
+
+def check(name, test):
+    if not test:
+        raise XPathEvaluationError, \
+              'Illegal argument list for %s().' % name
+
+#
+# Node set functions
+#
+
+def function_last(context):
+    return float(context.size)
+
+def function_position(context):
+    return float(context.position)
+
+def function_count(context, node_set):
+    check("count", is_node_set(node_set))
+    # XXX We should make sure the node set doesn't contain any
+    # duplicates.  However, that won't be possible when it
+    # contains text or attribute nodes.
+    return float(len(node_set))
+
+def function_id(context, object):
+    # IDs are the values of the attribute named by index.id_attribute,
+    # looked up in the attribute index if the document has one.
+    if is_node_set(object):
+        ids = set()
+        for node in object:
+            ids.update(get_string_value(node).split())
+    else:
+        ids = set(to_string(object).split())
+    root = context.get_root()
+    document = root[0]
+    name = index.id_attribute
+    attribute_index = index.get_attribute_index(document, name)
+    if attribute_index is None:
+        result = []
+        for element in iter_descendant_or_self_elements(document):
+            value = element.get(name)
+            if value in ids:
+                ids.remove(value)
+                result.append(element)
+        return result
+
+    result = []
+    for value in ids:
+        elements = attribute_index.get(value)
+        if elements:
+            result.append(elements[0])
+    order = get_document_order(root)
+    result.sort(key = lambda element: order[id(element)])
+    return result
+
+def _get_expanded_name(name, context, args):
+    if args:
+        node_set = args[0]
+        check(name, is_node_set(node_set))
+        if len(node_set) == 0:
+            return None
+        node = node_set[0]
+    else:
+        node = context.node
+
+    if is_root_node(node):
+        return "", ""
+    elif is_element_node(node):
+        return get_expanded_name(node)
+    else:
+        # Text or attribute node.
+        raise XPathNotImplementedError, \
+              '%s() not supported for this node type.' % name
+
+def function_local_name(context, *args):
+    expanded_name = _get_expanded_name("local-name", context, args)
+    if expanded_name is None:
+        return ""
+    return expanded_name[1]
+
+def function_namespace_uri(context, *args):
+    expanded_name = _get_expanded_name("namespace-uri", context, args)
+    if expanded_name is None:
+        return ""
+    return expanded_name[0]
+
+def function_name(context, *args):
+    expanded_name = _get_expanded_name("name", context, args)
+    if expanded_name is None:
+        return ""
+    uri, local_part = expanded_name
+    if uri:
+        raise XPathNotImplementedError, \
+              'name() not supported for qualified names.'
+    return local_part
+
+def function_current(context):
+    return [context.initial]
+
+#
+# String functions
+#
+
+def function_string(context, *args):
+    if args:
+        return to_string(args[0])
+    else:
+        return get_string_value(context.node)
+
+def function_concat(context, *args):
+    return "".join(map(to_string, args))
+
+def function_starts_with(context, x, y):
+    return to_string(x).startswith(to_string(y))
+
+def function_contains(context, x, y):
+    return to_string(x).find(to_string(y)) >= 0
+
+def function_substring_before(context, x, y):
+    s = to_string(x)
+    t = to_string(y)
+    k = s.find(t)
+    if k == -1:
+        return ""
+    else:
+        return s[:k]
+
+def function_substring_after(context, x, y):
+    s = to_string(x)
+    t = to_string(y)
+    k = s.find(t)
+    if k == -1:
+        return ""
+    else:
+        k += len(t)
+        return s[k:]
+
+def function_substring(context, x, start, length=None):
+    s = to_string(x)
+    i = int(round(to_number(start))) - 1
+    if length is None:
+        i = max(i, 0)
+        return s[i:]
+    else:
+        k = int(round(to_number(length)))
+        j = i + k
+        i = max(i, 0)
+        return s[i:j]
+
+def function_string_length(context, *args):
+    if args:
+        s = to_string(args[0])
+    else:
+        s = get_string_value(context.node)
+    return float(len(s))
+
+def function_normalize_space(context, *args):
+    if args:
+        s = to_string(args[0])
+    else:
+        s = get_string_value(context.node)
+    s = s.strip()
+    return " ".join(s.split())
+
+def function_translate(context, x, y, z):
+    s, a, b = [unicode(to_string(arg)) for arg in (x, y, z)]
+    n = len(b)
+    d = a[n:]
+    a = a[:n]
+    table = {}
+    for c in d:
+        table[ord(c)] = None
+    for i in range(n):
+        c = a[i]
+        if ord(c) not in table:
+            table[ord(c)] = ord(b[i])
+    return s.translate(table)
+
+#
+# Boolean functions
+#
+
+def function_boolean(context, x):
+    return to_boolean(x)
+
+def function_not(context, x):
+    return not to_boolean(x)
+
+def function_true(context):
+    return True
+
+def function_false(context):
+    return False
+
+def function_lang(context, x):
+    raise XPathNotImplementedError, 'lang() not supported.'
+
+#
+# Number functions
+#
+
+def function_number(context, *args):
+    if args:
+        return to_number(args[0])
+    else:
+        return get_number_value(context.node)
+
+def function_sum(context, node_set):
+    check("sum", is_node_set(node_set))
+    return sum(to_numbers(node_set), 0.0)
+
+def function_floor(context, x):
+    return floor(to_number(x))
+
+def function_ceiling(context, x):
+    return ceil(to_number(x))
+
+def function_round(context, x):
+    return round(to_number(x))
+
+# Functions that never look at the context.  Some others, such as
+# string(), only do so when called without arguments, but are left
+# out for simplicity.
+_pure_functions = [
+    "concat", "starts-with", "contains", "substring-before",
+    "substring-after", "substring", "translate", "boolean", "not",
+    "true", "false", "floor", "ceiling", "ceil", "round",
+    ]
+
+for name, function, min_args, max_args, result_type in [
+    ("last", function_last, 0, 0, "number"),
+    ("position", function_position, 0, 0, "number"),
+    ("count", function_count, 1, 1, "number"),
+    ("id", function_id, 1, 1, "node-set"),
+    ("local-name", function_local_name, 0, 1, "string"),
+    ("namespace-uri", function_namespace_uri, 0, 1, "string"),
+    ("name", function_name, 0, 1, "string"),
+    ("current", function_current, 0, 0, "node-set"),
+    ("string", function_string, 0, 1, "string"),
+    ("concat", function_concat, 2, None, "string"),
+    ("starts-with", function_starts_with, 2, 2, "boolean"),
+    ("contains", function_contains, 2, 2, "boolean"),
+    ("substring-before", function_substring_before, 2, 2, "string"),
+    ("substring-after", function_substring_after, 2, 2, "string"),
+    ("substring", function_substring, 2, 3, "string"),
+    ("string-length", function_string_length, 0, 1, "number"),
+    ("normalize-space", function_normalize_space, 0, 1, "string"),
+    ("translate", function_translate, 3, 3, "string"),
+    ("boolean", function_boolean, 1, 1, "boolean"),
+    ("not", function_not, 1, 1, "boolean"),
+    ("true", function_true, 0, 0, "boolean"),
+    ("false", function_false, 0, 0, "boolean"),
+    ("lang", function_lang, 1, 1, "boolean"),
+    ("number", function_number, 0, 1, "number"),
+    ("sum", function_sum, 1, 1, "number"),
+    ("floor", function_floor, 1, 1, "number"),
+    ("ceiling", function_ceiling, 1, 1, "number"),
+    ("ceil", function_ceiling, 1, 1, "number"),
+    ("round", function_round, 1, 1, "number"),
+    ]:
+    register_function(name, function, min_args, max_args, result_type,
+                      uses_position = name in ("last", "position"),
+                      pure = name in _pure_functions)
+del name, function, min_args, max_args, result_type
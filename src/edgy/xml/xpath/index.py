@@ -0,0 +1,113 @@
+#
+# edgy.xml.xpath.index
+#
+# Copyright (C) 2008 Edgeware AB.
+#
+
+"""
+Per-document tag and attribute value indexes
+
+The tag index maps the tag of every element in a document, in Clark
+notation, to the list of elements with that tag in document order.
+It lets expressions like //name, //name[...] and /descendant::name
+find their nodes without walking the whole tree.
+
+Attribute value indexes are only kept for the attributes declared
+with add_attribute_index().  Each maps the values of one attribute
+to the list of elements with that value, in document order, so that
+steps like //name[@id = 'abc'] and /descendant::*[@src = $src] are
+answered with a lookup, and the id() function with one lookup per
+ID.  The attribute named by "id_attribute" holds the IDs of elements.
+
+The indexes are built the first time they are needed for a document,
+and are kept in the document cache of the root element (see
+Element.getDocumentCache), which is discarded whenever the tree is
+modified.  Only trees made of edgy.xml.element.Element objects can be
+indexed, and only a document that is the root of its tree.  Set
+"enabled" to False to turn the indexes off.
+"""
+
+from edgy.xml.xpath.data_model import iter_descendant_or_self_elements
+
+enabled = True
+
+id_attribute = "id"
+
+def get_tag_index(document):
+    """
+    Return the tag index for the document element, or None if the
+    document cannot be indexed.
+    """
+    if not enabled or not hasattr(document, "getDocumentCache") \
+           or document.parent is not None:
+        return None
+    cache = document.getDocumentCache()
+    index = cache.get("tag-index")
+    if index is None:
+        index = cache["tag-index"] = build_tag_index(document)
+    return index
+
+def build_tag_index(document):
+    index = {}
+    for element in iter_descendant_or_self_elements(document):
+        elements = index.get(element.tag)
+        if elements is None:
+            index[element.tag] = [element]
+        else:
+            elements.append(element)
+    return index
+
+def make_tag(uri, name):
+    """
+    Return the tag, in Clark notation, of an element with the given
+    namespace URI and local name.
+    """
+    if uri:
+        return "{%s}%s" % (uri, name)
+    else:
+        return name
+
+def add_attribute_index(document, name):
+    """
+    Declare that the values of the attribute name, given in Clark
+    notation, are to be indexed for the document element.
+    """
+    names = getattr(document, "_attributeIndexes", None)
+    if names is None:
+        names = document._attributeIndexes = set()
+    names.add(name)
+
+def remove_attribute_index(document, name):
+    names = getattr(document, "_attributeIndexes", None)
+    if names is not None:
+        names.discard(name)
+        document.getDocumentCache().pop(("attribute-index", name), None)
+
+def get_attribute_index(document, name):
+    """
+    Return the index of the values of the attribute name for the
+    document element, or None if there is no such index.
+    """
+    if not enabled or not hasattr(document, "getDocumentCache") \
+           or document.parent is not None \
+           or name not in getattr(document, "_attributeIndexes", ()):
+        return None
+    cache = document.getDocumentCache()
+    key = ("attribute-index", name)
+    index = cache.get(key)
+    if index is None:
+        index = cache[key] = build_attribute_index(document, name)
+    return index
+
+def build_attribute_index(document, name):
+    index = {}
+    for element in iter_descendant_or_self_elements(document):
+        value = element.get(name)
+        if value is None:
+            continue
+        elements = index.get(value)
+        if elements is None:
+            index[value] = [element]
+        else:
+            elements.append(element)
+    return index
@@ -27,11 +27,16 @@
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 """
-Slow but portable XPath tokenizer
+XPath tokenizer
 
-This intentionally does not use the "re" module.
+split_tokens() scans the whole expression with a single regular
+expression and classifies the raw tokens from tables.  The original
+character-by-character scanner, scan_token(), is kept as a portable
+reference implementation.
 """
 
+import re
+
 from edgy.xml.xpath.xpath_exceptions import XPathParseError
 from edgy.xml.xpath.atoms import *
 
@@ -98,10 +103,131 @@ class TokenStream:
         self.position -= 1
         assert self.tokens[self.position] == token
 
+_tokens_that_never_precede_an_operator = operators + ['@', '::', '(', '[', ',', None]
+
+#
+# Regular expression scanner
+#
+
+_ncname = r"[^\W\d][\w.\-]*"
+
+def _build_token_re():
+    tokens = punctuation + operator_syntax
+    # Longer tokens must be tried before their prefixes.
+    tokens.sort(key = len, reverse = True)
+    return re.compile(r"""
+        \s*
+        (?:
+            (?P<number> \d+ (?:\.\d*)? | \.\d+ )
+          | (?P<punctuation> %s )
+          | " (?P<double_quoted> [^"]* ) "
+          | ' (?P<single_quoted> [^']* ) '
+          | \$ (?P<variable> (%s) (?: : (%s) )? )
+          | (?P<qname> (%s) (?: : (%s|\*) )? )
+        )
+        """ % ("|".join(map(re.escape, tokens)),
+               _ncname, _ncname, _ncname, _ncname),
+                      re.VERBOSE | re.UNICODE)
+
+_token_re = _build_token_re()
+_following_re = re.compile(r"\s*(\(|::)")
+_trailing_space_re = re.compile(r"\s*$", re.UNICODE)
+
+_never_precede_an_operator = frozenset(
+    [t for t in _tokens_that_never_precede_an_operator if t is not None])
+_operator_names = frozenset(operator_names)
+_node_types = frozenset(node_types)
+_axis_names = frozenset(axis_names)
+
 def split_tokens(s):
     """
     Split an XPath expression into a list of tokens.
     """
+    result = []
+    append = result.append
+    match = _token_re.match
+    # True when the Section 3.7 rules say that the next token must be
+    # an operator, because there is a preceding token that is not one
+    # of @, ::, (, [, , or an operator.
+    expect_operator = False
+    i = 0
+    while True:
+        m = match(s, i)
+        if m is None:
+            if _trailing_space_re.match(s, i):
+                return result
+            rest = s[i:].lstrip()
+            if rest[:1] in ('"', "'"):
+                raise XPathParseError('Unmatched quote character.')
+            raise XPathParseError('No valid token here: "%s"' % rest)
+        i = m.end()
+
+        kind = m.lastgroup
+        if kind == "punctuation":
+            t = m.group(kind)
+            if t == '*' and not expect_operator:
+                t = NameTest('*')
+                expect_operator = True
+            else:
+                expect_operator = t not in _never_precede_an_operator
+        elif kind == "qname":
+            prefix, local_part = m.group(m.lastindex + 1, m.lastindex + 2)
+            if local_part is None:
+                prefix, local_part = None, prefix
+            t = _classify_qname(s, i, prefix, local_part, expect_operator)
+            expect_operator = t not in _never_precede_an_operator
+        elif kind == "number":
+            t = Number(m.group(kind))
+            expect_operator = True
+        elif kind == "variable":
+            prefix, local_part = m.group(m.lastindex + 1, m.lastindex + 2)
+            if local_part is None:
+                prefix, local_part = None, prefix
+            t = VariableReference(prefix, local_part)
+            expect_operator = True
+        else:
+            t = Literal(m.group(kind))
+            expect_operator = True
+        append(t)
+
+def _classify_qname(s, i, prefix, local_part, expect_operator):
+    # Apply the disambiguation rules of Section 3.7 to a name that
+    # ends at position i, exactly as scan_token() does.
+    if local_part == '*':
+        return NameTest(prefix, '*')
+    if expect_operator:
+        # "...an NCName must be recognized as an OperatorName"
+        if prefix is None and local_part in _operator_names:
+            return local_part
+        raise XPathParseError('Expected an operator name, not "%s".'
+                              % QName(prefix, local_part))
+
+    m = _following_re.match(s, i)
+    if m is None:
+        # "Otherwise, the token must not be recognized as...an
+        # OperatorName, a NodeType, a FunctionName, or an AxisName."
+        return NameTest(prefix, local_part)
+    elif m.group(1) == '(':
+        # "...the token must be recognized as a NodeType or a FunctionName"
+        if prefix is None and local_part in _node_types:
+            return NodeType(local_part)
+        return FunctionName(prefix, local_part)
+    else:
+        # "...the token must be recognized as an AxisName"
+        if prefix is None and local_part in _axis_names:
+            return AxisName(local_part)
+        raise XPathParseError('Expected an axis name, not "%s".'
+                              % QName(prefix, local_part))
+
+#
+# Portable character-by-character scanner
+#
+
+def split_tokens_portable(s):
+    """
+    Split an XPath expression into a list of tokens without using
+    regular expressions.
+    """
     i = 0
     t = None
     result = []
@@ -111,8 +237,6 @@ def split_tokens(s):
             return result
         result.append(t)
 
-_tokens_that_never_precede_an_operator = operators + ['@', '::', '(', '[', ',', None]
-
 def scan_token(s, i, preceding_token = None):
     """
     Get the next token starting at position i in the string s.
@@ -0,0 +1,246 @@
+#
+# edgy.xml.xpath.optimizer
+#
+# Copyright (C) 2008 Edgeware AB.
+#
+
+"""
+Static optimization of XPath syntax trees
+
+optimize() rewrites a parsed expression into an equivalent one that
+is cheaper to evaluate.  It builds a new tree of syntax nodes and
+leaves its input alone, so the result can be evaluated with either
+the syntax tree's own evaluate() methods or the compiler.
+
+The rewrites are:
+
+ * Subexpressions without any context dependency, like 1 + 2 or
+   not(true()), are evaluated once and replaced by their value.
+   Boolean values are represented by calls to true() and false().
+
+ * not(not(x)) becomes boolean(x), boolean(x) becomes x when x is
+   already boolean, and comparisons with true() or false() become
+   boolean() or not().
+
+ * "and" and "or" with a constant operand are simplified, as long as
+   that does not skip evaluating an operand that was evaluated before.
+
+ * Predicates that only select by position are put in canonical form:
+   [position() = 3] becomes [3] and [position() = last()] becomes
+   [last()], which the compiler recognizes.  [true()] is dropped, and
+   boolean() is stripped from predicates that are not numbers.
+"""
+
+from edgy.xml.xpath.atoms import *
+from edgy.xml.xpath.syntax import \
+     UnaryOp, BinaryOp, FunctionCall, Root, LocationStep
+from edgy.xml.xpath.context import Context
+from edgy.xml.xpath.functions import get_function
+from edgy.xml.xpath.analysis import get_result_type
+from edgy.xml.xpath.xpath_exceptions import XPathError
+
+def optimize(node):
+    """
+    Return an optimized copy of the syntax tree node.
+    """
+    return _optimizers.get(node.__class__, _unchanged)(node)
+
+def _unchanged(node):
+    return node
+
+#
+# Constants
+#
+
+def make_boolean(value):
+    if value:
+        return FunctionCall(FunctionName("true"), [])
+    else:
+        return FunctionCall(FunctionName("false"), [])
+
+def make_constant(value):
+    """
+    Return a syntax node for a boolean, number or string value.
+    """
+    if isinstance(value, bool):
+        return make_boolean(value)
+    elif isinstance(value, float):
+        return Number(value)
+    elif isinstance(value, basestring):
+        return Literal(value)
+    else:
+        return None
+
+def is_constant(node):
+    return isinstance(node, (Literal, Number)) \
+           or is_boolean_constant(node) is not None
+
+def is_boolean_constant(node):
+    """
+    Return True or False if node is a call to true() or false(), and
+    otherwise None.
+    """
+    if isinstance(node, FunctionCall) and not node.argument_list \
+           and _is_pure_call(node):
+        name = node.function.local_part
+        if name == "true":
+            return True
+        elif name == "false":
+            return False
+    return None
+
+def _is_pure_call(node):
+    if node.function.prefix:
+        return False
+    function = get_function(node.function.local_part)
+    return function is not None and function.pure
+
+def _is_call(node, name, count):
+    return isinstance(node, FunctionCall) \
+           and node.function.prefix is None \
+           and node.function.local_part == name \
+           and len(node.argument_list) == count
+
+def fold(node):
+    """
+    Replace node by its value if it has no context dependency.
+    """
+    if isinstance(node, UnaryOp):
+        operands = [node.right]
+    elif isinstance(node, BinaryOp):
+        if node.op == '|':
+            return node
+        operands = [node.left, node.right]
+    elif isinstance(node, FunctionCall):
+        if not _is_pure_call(node) or is_boolean_constant(node) is not None:
+            return node
+        operands = node.argument_list
+    else:
+        return node
+
+    for operand in operands:
+        if not is_constant(operand):
+            return node
+    try:
+        value = node.evaluate(Context(None, None))
+    except (XPathError, ArithmeticError):
+        # Leave it to evaluation to report the error, if the
+        # expression is ever evaluated.
+        return node
+    return make_constant(value) or node
+
+#
+# Expressions
+#
+
+def optimize_unary_op(node):
+    return fold(UnaryOp(node.op, optimize(node.right)))
+
+def optimize_binary_op(node):
+    left = optimize(node.left)
+    right = optimize(node.right)
+    if node.op in ('and', 'or'):
+        return _simplify_logical(node.op, left, right)
+    elif node.op in ('=', '!='):
+        simplified = _simplify_boolean_comparison(node.op, left, right)
+        if simplified is not None:
+            return simplified
+    return fold(BinaryOp(node.op, left, right))
+
+def _simplify_logical(op, left, right):
+    # The value of the operand that decides the result when it is
+    # constant: false for "and", true for "or".
+    decisive = op == 'or'
+    constant = is_boolean_constant(left)
+    if constant is not None:
+        if constant == decisive:
+            return make_boolean(decisive)
+        return make_boolean_of(right)
+    constant = is_boolean_constant(right)
+    if constant is not None and constant != decisive:
+        # The left operand is evaluated either way.
+        return make_boolean_of(left)
+    return BinaryOp(op, left, right)
+
+def _simplify_boolean_comparison(op, left, right):
+    constant = is_boolean_constant(right)
+    if constant is None:
+        constant = is_boolean_constant(left)
+        left, right = right, left
+    if constant is None or is_constant(left):
+        return None
+    # Comparing anything with a boolean converts it to a boolean.
+    if constant == (op == '='):
+        return make_boolean_of(left)
+    else:
+        return make_not(left)
+
+def make_boolean_of(node):
+    """
+    Return a node for boolean(node), without a redundant conversion.
+    """
+    if get_result_type(node) == "boolean":
+        return node
+    return fold(FunctionCall(FunctionName("boolean"), [node]))
+
+def make_not(node):
+    if _is_call(node, "not", 1) and _is_pure_call(node):
+        return make_boolean_of(node.argument_list[0])
+    return fold(FunctionCall(FunctionName("not"), [node]))
+
+def optimize_function_call(node):
+    args = [optimize(arg) for arg in node.argument_list]
+    if node.function.prefix is None and _is_pure_call(node):
+        name = node.function.local_part
+        if name == "boolean" and len(args) == 1:
+            return make_boolean_of(args[0])
+        elif name == "not" and len(args) == 1:
+            return make_not(args[0])
+    return fold(FunctionCall(node.function, args))
+
+#
+# Location paths
+#
+
+def optimize_location_step(node):
+    if node.prefix is None:
+        prefix = None
+    else:
+        prefix = optimize(node.prefix)
+    predicate_list = []
+    for predicate in node.predicate_list:
+        predicate = optimize_predicate(predicate)
+        if is_boolean_constant(predicate) is not True:
+            predicate_list.append(predicate)
+    return LocationStep(prefix, node.axis, node.node_test, predicate_list)
+
+def optimize_predicate(node):
+    """
+    Return an optimized copy of a predicate expression.
+    """
+    node = optimize(node)
+
+    # A predicate is converted to a boolean anyway, unless it is a number.
+    while _is_call(node, "boolean", 1) and _is_pure_call(node):
+        argument = node.argument_list[0]
+        if get_result_type(argument) in (None, "number"):
+            break
+        node = argument
+
+    if isinstance(node, BinaryOp) and node.op == '=':
+        if _is_call(node.left, "position", 0):
+            other = node.right
+        elif _is_call(node.right, "position", 0):
+            other = node.left
+        else:
+            return node
+        if isinstance(other, Number) or _is_call(other, "last", 0):
+            return other
+    return node
+
+_optimizers = {
+    UnaryOp : optimize_unary_op,
+    BinaryOp : optimize_binary_op,
+    FunctionCall : optimize_function_call,
+    LocationStep : optimize_location_step,
+    }
@@ -0,0 +1,210 @@
+#
+# edgy.xml.xpath.profiler
+#
+# Copyright (C) 2008 Edgeware AB.
+#
+
+"""
+Per-node profiling of compiled expressions
+
+A Profiler compiles expressions with every location step, function
+call and operator instrumented, and keeps statistics for each of
+these syntax tree nodes across the evaluations it is used for:
+
+ * calls -- number of times the node was evaluated.
+ * input -- number of nodes a location step was applied to.
+ * output -- number of nodes a location step selected.
+ * predicate evaluations -- number of times the predicates of a
+   location step were evaluated.
+ * time -- cumulative time spent evaluating the node, including the
+   time spent in its subexpressions.
+
+Location steps generate their nodes lazily, so their time is that
+spent generating the nodes, whenever that happens.  Steps answered
+from the tag index have no input nodes.
+
+Profiling slows evaluation down considerably, so only profile
+expressions while looking for the cause of a slow one:
+
+    profiler = Profiler()
+    xpath.evaluate(document, profiler = profiler)
+    print profiler.report()
+"""
+
+from timeit import default_timer
+
+from edgy.xml.xpath.syntax import \
+     UnaryOp, BinaryOp, FunctionCall, Root, LocationStep
+from edgy.xml.xpath.compiler import compile_expression
+
+class Profiler:
+    def __init__(self):
+        self.records = {}               # Maps id(node) to a Record.
+        self._compiled = []             # (node, function) pairs.
+
+    def compile(self, node):
+        """
+        Return a function that evaluates the syntax tree node, and
+        records statistics for it and its subexpressions.
+        """
+        for compiled_node, function in self._compiled:
+            if compiled_node is node:
+                return function
+        function = compile_expression(node, self)
+        self._compiled.append((node, function))
+        return function
+
+    def get_record(self, node):
+        """
+        Return the statistics of a syntax tree node, or None if none
+        have been recorded.
+        """
+        return self.records.get(id(node))
+
+    def _get_record(self, node):
+        record = self.records.get(id(node))
+        if record is None:
+            record = self.records[id(node)] = Record()
+        return record
+
+    def wrap_expression(self, node, function):
+        # Called by the compiler for every compiled node.  All of them
+        # have their calls counted, so that the predicate evaluations
+        # of a step can be added up, but only the nodes that are
+        # reported are timed.
+        record = self._get_record(node)
+        if isinstance(node, (UnaryOp, BinaryOp, FunctionCall)):
+            def evaluate(context):
+                record.calls += 1
+                start = default_timer()
+                try:
+                    return function(context)
+                finally:
+                    record.time += default_timer() - start
+        else:
+            def evaluate(context):
+                record.calls += 1
+                return function(context)
+        return evaluate
+
+    def wrap_input(self, node, prefix):
+        # Called by the compiler with the function generating the
+        # nodes that a location step is applied to.
+        record = self._get_record(node)
+        def evaluate(context):
+            return _count_input(prefix(context), record)
+        return evaluate
+
+    def wrap_step(self, node, generate):
+        # Called by the compiler with the function generating the
+        # nodes selected by a location step.
+        record = self._get_record(node)
+        def evaluate(context):
+            start = default_timer()
+            try:
+                nodes = generate(context)
+            finally:
+                record.time += default_timer() - start
+            return _time_output(nodes, record)
+        return evaluate
+
+    def report(self):
+        """
+        Return the statistics of every expression compiled by the
+        profiler as text, with one line per syntax tree node.
+        """
+        lines = []
+        for node, function in self._compiled:
+            self._report(node, 0, lines)
+        return "\n".join(lines)
+
+    def _report(self, node, depth, lines):
+        if isinstance(node, LocationStep):
+            # Show the steps of a path at the same depth, in order.
+            steps = []
+            while isinstance(node, LocationStep):
+                steps.append(node)
+                node = node.prefix
+            if node is not None:
+                self._report(node, depth, lines)
+            steps.reverse()
+            for step in steps:
+                self._report_step(step, depth, lines)
+            return
+
+        record = self.get_record(node)
+        if isinstance(node, (UnaryOp, BinaryOp, FunctionCall)):
+            lines.append("%s%s  %s" % ("  " * depth, node,
+                                       _format(record, ())))
+            depth += 1
+        if isinstance(node, UnaryOp):
+            self._report(node.right, depth, lines)
+        elif isinstance(node, BinaryOp):
+            self._report(node.left, depth, lines)
+            self._report(node.right, depth, lines)
+        elif isinstance(node, FunctionCall):
+            for argument in node.argument_list:
+                self._report(argument, depth, lines)
+
+    def _report_step(self, step, depth, lines):
+        record = self.get_record(step)
+        evaluations = 0
+        for predicate in step.predicate_list:
+            predicate_record = self.get_record(predicate)
+            if predicate_record is not None:
+                evaluations += predicate_record.calls
+        # The step without the steps before it.
+        if isinstance(step.prefix, Root):
+            prefix = step.prefix
+        else:
+            prefix = None
+        alone = LocationStep(prefix, step.axis, step.node_test,
+                             step.predicate_list)
+        fields = ["in %d" % _get(record, "input"),
+                  "out %d" % _get(record, "output")]
+        if step.predicate_list:
+            fields.append("predicates %d" % evaluations)
+        lines.append("%s%s  %s" % ("  " * depth, alone,
+                                   _format(record, fields)))
+        for predicate in step.predicate_list:
+            self._report(predicate, depth + 1, lines)
+
+class Record:
+    """
+    Statistics for one syntax tree node
+    """
+    def __init__(self):
+        self.calls = 0
+        self.input = 0
+        self.output = 0
+        self.time = 0.0
+
+def _get(record, name):
+    if record is None:
+        return 0
+    return getattr(record, name)
+
+def _format(record, fields):
+    fields = list(fields)
+    if not fields:
+        fields.append("calls %d" % _get(record, "calls"))
+    fields.append("%.3f ms" % (_get(record, "time") * 1e3))
+    return ", ".join(fields)
+
+def _count_input(nodes, record):
+    for node in nodes:
+        record.input += 1
+        yield node
+
+def _time_output(nodes, record):
+    nodes = iter(nodes)
+    while True:
+        start = default_timer()
+        try:
+            node = nodes.next()
+        except StopIteration:
+            record.time += default_timer() - start
+            return
+        record.time += default_timer() - start
+        record.output += 1
+        yield node
@@ -0,0 +1,165 @@
+#
+# edgy.xml.xpath.serialize
+#
+# Copyright (C) 2008 Edgeware AB.
+#
+
+"""
+Serialization of parsed expressions
+
+Parsing is most of the cost of preparing an expression, so a process
+that prepares thousands of them at startup can save the syntax trees
+to a file once and load them from there instead of parsing again.
+
+dump_tree() turns an optimized syntax tree into nested tuples of
+strings, numbers and None, which the marshal module can store, and
+load_tree() turns them back into a tree.  save_trees() and
+load_trees() store the trees of many expressions in a file, keyed by
+the text of the expressions.
+
+The file records FORMAT_VERSION, which must be increased whenever
+the syntax tree classes or the optimizer change in a way that makes
+stored trees unusable.  load_trees() ignores files with any other
+version, so that stale files just cost a parse.  The compiled
+functions cannot be stored; they are compiled again from the trees.
+"""
+
+import marshal
+
+from edgy.xml.xpath.atoms import *
+from edgy.xml.xpath.syntax import \
+     UnaryOp, BinaryOp, FunctionCall, Root, LocationStep
+from edgy.xml.xpath.xpath_exceptions import XPathError
+
+FORMAT_VERSION = 1
+
+def dump_tree(node):
+    """
+    Return a representation of the syntax tree node made of tuples
+    and values that the marshal module can store.
+    """
+    if isinstance(node, Literal):
+        return ("literal", node.value)
+    elif isinstance(node, Number):
+        return ("number", node.value)
+    elif isinstance(node, VariableReference):
+        return ("variable", node.prefix, node.local_part)
+    elif isinstance(node, UnaryOp):
+        return ("unary", node.op, dump_tree(node.right))
+    elif isinstance(node, BinaryOp):
+        return ("binary", node.op, dump_tree(node.left),
+                dump_tree(node.right))
+    elif isinstance(node, FunctionCall):
+        return ("call", node.function.prefix, node.function.local_part,
+                tuple(map(dump_tree, node.argument_list)))
+    elif isinstance(node, Root):
+        return ("root",)
+    elif isinstance(node, LocationStep):
+        if node.prefix is None:
+            prefix = None
+        else:
+            prefix = dump_tree(node.prefix)
+        return ("step", prefix, node.axis, _dump_node_test(node.node_test),
+                tuple(map(dump_tree, node.predicate_list)))
+    else:
+        raise XPathError, "Cannot serialize %s." % node.__class__.__name__
+
+def _dump_node_test(node_test):
+    if isinstance(node_test, NameTest):
+        return ("name", node_test.prefix, node_test.local_part)
+    elif isinstance(node_test, NodeType):
+        return ("type", node_test.name)
+    else:
+        return ("literal", node_test.value)
+
+def load_tree(data):
+    """
+    Return the syntax tree represented by the result of dump_tree().
+    """
+    kind = data[0]
+    if kind == "literal":
+        return Literal(data[1])
+    elif kind == "number":
+        return Number(data[1])
+    elif kind == "variable":
+        return _make_qname(VariableReference, data[1], data[2])
+    elif kind == "unary":
+        return UnaryOp(data[1], load_tree(data[2]))
+    elif kind == "binary":
+        return BinaryOp(data[1], load_tree(data[2]), load_tree(data[3]))
+    elif kind == "call":
+        return FunctionCall(_make_qname(FunctionName, data[1], data[2]),
+                            map(load_tree, data[3]))
+    elif kind == "root":
+        return Root()
+    elif kind == "step":
+        if data[1] is None:
+            prefix = None
+        else:
+            prefix = load_tree(data[1])
+        return LocationStep(prefix, data[2], _load_node_test(data[3]),
+                            map(load_tree, data[4]))
+    else:
+        raise XPathError, "Cannot deserialize %r." % (kind,)
+
+def _load_node_test(data):
+    kind = data[0]
+    if kind == "name":
+        return _make_qname(NameTest, data[1], data[2])
+    elif kind == "type":
+        return NodeType(data[1])
+    else:
+        return Literal(data[1])
+
+def _make_qname(cls, prefix, local_part):
+    if prefix is None:
+        return cls(local_part)
+    else:
+        return cls(prefix, local_part)
+
+def save_trees(file, trees):
+    """
+    Write syntax trees to a file.
+
+    file -- file name or file object open for writing in binary mode.
+    trees -- dictionary mapping the text of expressions to their
+    syntax trees.
+    """
+    data = {}
+    for xpath, node in trees.iteritems():
+        data[xpath] = dump_tree(node)
+    data = marshal.dumps((FORMAT_VERSION, data))
+    if isinstance(file, basestring):
+        file = open(file, "wb")
+        try:
+            file.write(data)
+        finally:
+            file.close()
+    else:
+        file.write(data)
+
+def load_trees(file):
+    """
+    Return a dictionary mapping the text of expressions to syntax
+    trees, as written by save_trees().
+
+    file -- file name or file object open for reading in binary mode.
+
+    A file written with another format version gives an empty
+    dictionary.
+    """
+    if isinstance(file, basestring):
+        file = open(file, "rb")
+        try:
+            data = file.read()
+        finally:
+            file.close()
+    else:
+        data = file.read()
+    version, data = marshal.loads(data)
+    if version != FORMAT_VERSION:
+        return {}
+    trees = {}
+    for xpath, tree in data.iteritems():
+        trees[xpath] = load_tree(tree)
+    return trees
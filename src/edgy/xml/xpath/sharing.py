@@ -0,0 +1,119 @@
+#
+# edgy.xml.xpath.sharing
+#
+# Copyright (C) 2008 Edgeware AB.
+#
+
+"""
+Sharing of location paths between expressions
+
+A PathTrie merges the absolute location paths of many expressions
+into a trie of steps, keyed by axis, node test and predicates.  Each
+step in the trie becomes a SharedStep node (see compiler.py), whose
+value is computed once per evaluation and then reused by every
+expression that starts with the same steps.
+
+Child steps that select elements by name from the same node set, as
+in /event/type and /event/source, are grouped so that a single pass
+over the children finds the nodes for all of them.
+"""
+
+from edgy.xml.xpath.atoms import *
+from edgy.xml.xpath.syntax import \
+     UnaryOp, BinaryOp, FunctionCall, Root, LocationStep
+from edgy.xml.xpath.compiler import SharedStep
+
+class PathTrie:
+    def __init__(self):
+        self.size = 0                   # number of slots
+        self._steps = {}
+        self._children = {}
+
+    def share(self, node, namespace_mapping):
+        """
+        Return a copy of the syntax tree node in which the steps of
+        absolute location paths are shared.
+
+        Steps are only shared between expressions with the same
+        namespace mapping.
+        """
+        namespaces = frozenset(namespace_mapping.iteritems())
+        return self._share(node, namespaces)
+
+    def _share(self, node, namespaces):
+        if isinstance(node, UnaryOp):
+            return UnaryOp(node.op, self._share(node.right, namespaces))
+        elif isinstance(node, BinaryOp):
+            return BinaryOp(node.op,
+                            self._share(node.left, namespaces),
+                            self._share(node.right, namespaces))
+        elif isinstance(node, FunctionCall):
+            return FunctionCall(node.function,
+                                [self._share(arg, namespaces)
+                                 for arg in node.argument_list])
+        elif isinstance(node, LocationStep):
+            if _is_absolute(node):
+                return self._get_step(node, namespaces)
+            if node.prefix is None:
+                prefix = None
+            else:
+                prefix = self._share(node.prefix, namespaces)
+            return LocationStep(prefix, node.axis, node.node_test,
+                                [self._share(predicate, namespaces)
+                                 for predicate in node.predicate_list])
+        else:
+            return node
+
+    def _get_step(self, node, namespaces):
+        if isinstance(node.prefix, Root):
+            prefix = node.prefix
+            parent_slot = None
+        else:
+            prefix = self._get_step(node.prefix, namespaces)
+            parent_slot = prefix.slot
+
+        key = (parent_slot, node.axis, str(node.node_test),
+               tuple(map(str, node.predicate_list)), namespaces)
+        shared = self._steps.get(key)
+        if shared is None:
+            step = LocationStep(prefix, node.axis, node.node_test,
+                                [self._share(predicate, namespaces)
+                                 for predicate in node.predicate_list])
+            shared = self._steps[key] = SharedStep(step, self.size)
+            self.size += 1
+            if _is_sibling_candidate(step):
+                # The node tests of siblings are expanded with the
+                # namespace mapping of whichever expression computes
+                # them first, so only steps of the same mapping are
+                # grouped.
+                self._children.setdefault((parent_slot, namespaces),
+                                          []).append(shared)
+        return shared
+
+    def group_siblings(self):
+        """
+        Mark the child steps that can be found in a single pass.
+
+        Call this after sharing all expressions, and before compiling
+        them.
+        """
+        for siblings in self._children.itervalues():
+            if len(siblings) > 1:
+                for shared in siblings:
+                    shared.siblings = siblings
+
+def _is_absolute(node):
+    while isinstance(node, LocationStep):
+        node = node.prefix
+    return isinstance(node, Root)
+
+def _is_sibling_candidate(step):
+    # Child steps selecting elements by name, without predicates, from
+    # the root node or the result of another such step.
+    if step.axis != "child" or step.predicate_list:
+        return False
+    node_test = step.node_test
+    if not isinstance(node_test, NameTest) or node_test.local_part == '*':
+        return False
+    prefix = step.prefix
+    return isinstance(prefix, Root) or prefix.step.axis == "child"
@@ -0,0 +1,424 @@
+#
+# edgy.xml.xpath.stream
+#
+# Copyright (C) 2008 Edgeware AB.
+#
+
+"""
+Streaming evaluation of location paths
+
+StreamingXPath evaluates a location path while a document is being
+parsed, and generates the selected nodes as soon as they are known,
+without holding the whole tree in memory:
+
+    for product in iterfind("/catalog//product[@status = 'active']",
+                            "catalog.xml"):
+        handle(product)
+
+Only a forward-only subset of XPath can be evaluated this way:
+
+ * The expression must be a single location path.  A relative path
+   is taken relative to the document element, as by XPath.evaluate().
+
+ * Steps can use the child and descendant axes, "." and "//", with
+   name tests.  The last step can also select attributes by name, or
+   text().
+
+ * Predicates can test attributes, as in [@id] or [@type = 'book'],
+   and predicates of child steps can select by position, as in [1] or
+   [position() < 3].  Predicates of the last element step can also
+   look at its content, as in [price > 10].  last(), current() and
+   axes leading out of the element cannot be used.
+
+Other expressions raise XPathNotImplementedError when compiled.
+
+Elements are generated when their end tag has been read, so that
+they are complete.  Nested matches are therefore generated before the
+element containing them.  Attribute values are generated as soon as
+the start tag has been read, unless the element has to be complete
+to check the predicates.
+
+Elements that cannot be part of a match are removed from the tree as
+soon as their end tag has been read, and a generated element is
+removed from its parent when the next node is asked for, so memory
+use is bounded by the depth of the document rather than its size.
+The tree is built without noting the changes to it (see
+Element.modified), so nothing should be cached about the ancestors of
+a generated element, which are not complete yet, until the parsing
+is done.
+"""
+
+try:
+    from xml.etree.ElementTree import XMLTreeBuilder, iterparse as _iterparse
+except ImportError:
+    from elementtree.ElementTree import XMLTreeBuilder, iterparse as _iterparse
+
+from edgy.xml.parser import ElementBuilder
+from edgy.xml.xpath.atoms import *
+from edgy.xml.xpath.syntax import \
+     UnaryOp, BinaryOp, FunctionCall, Root, LocationStep
+from edgy.xml.xpath.parser import parse_xpath
+from edgy.xml.xpath.optimizer import optimize
+from edgy.xml.xpath.compiler import compile_expression
+from edgy.xml.xpath.analysis import is_positional_predicate, uses_size
+from edgy.xml.xpath.context import Context
+from edgy.xml.xpath.evaluate import evaluate_predicate, make_variables
+from edgy.xml.xpath.data_model import \
+     get_attribute_value, get_child_text_nodes
+from edgy.xml.xpath.xpath_exceptions import XPathNotImplementedError
+
+def iterfind(xpath, source, namespace_mapping = None, variables = None):
+    """
+    Generate the nodes selected by xpath from the document in source,
+    a file name or file object, while it is being parsed.
+    """
+    return StreamingXPath(xpath, namespace_mapping).iterparse(source,
+                                                              variables)
+
+class StreamingXPath:
+    """
+    Location path compiled for streaming evaluation
+    """
+    def __init__(self, xpath, namespace_mapping = None):
+        self.xpath = xpath
+        if namespace_mapping is None:
+            namespace_mapping = {}
+        self.namespace_mapping = namespace_mapping
+
+        self.absolute, steps = _get_steps(optimize(parse_xpath(xpath)))
+        self.target = "element"
+        self.attribute = None
+        last = steps and steps[-1]
+        if last and last.axis == "attribute":
+            self.target = "attribute"
+            self.attribute = _AttributeStep(last, namespace_mapping)
+            steps.pop()
+        elif last and isinstance(last.node_test, NodeType) \
+                 and last.node_test.name == "text":
+            if last.axis != "child" or last.predicate_list:
+                raise XPathNotImplementedError, \
+                      "Only plain child::text() steps supported in streaming mode."
+            self.target = "text"
+            steps.pop()
+        if self.absolute and not steps:
+            raise XPathNotImplementedError, \
+                  "The root node cannot be selected in streaming mode."
+
+        self.steps = []
+        for i in range(len(steps)):
+            self.steps.append(_ElementStep(steps[i], namespace_mapping,
+                                           i == len(steps) - 1))
+
+    def iterparse(self, source, variables = None):
+        """
+        Parse the document in source, a file name or file object, and
+        generate the selected nodes.
+        """
+        parser = XMLTreeBuilder(target = ElementBuilder())
+        return self.match(_iterparse(source, ("start", "end"), parser),
+                          variables)
+
+    def match(self, events, variables = None):
+        """
+        Generate the selected nodes from parser events, given as
+        ("start", element) and ("end", element) pairs like those
+        returned by ElementTree.iterparse().
+
+        variables -- variable bindings for the predicates, as for
+        XPath.evaluate().
+        """
+        steps = self.steps
+        n = len(steps)
+        context = Context(None, None, self.namespace_mapping,
+                          make_variables(variables))
+        context.size = None
+
+        root = _Frame(None, None)
+        if self.absolute:
+            root.states = self._closure([0])
+        stack = [root]
+        for event, element in events:
+            if event == "start":
+                parent = stack[-1]
+                frame = _Frame(element, parent)
+                if parent is root and not self.absolute:
+                    frame.states = self._closure([0])
+                else:
+                    self._advance(parent, frame, context)
+                stack.append(frame)
+
+                matched = n in frame.states
+                if self.target == "attribute":
+                    frame.candidate = frame.pending
+                    if matched:
+                        for node in self.attribute.select(element, context):
+                            yield node
+                else:
+                    frame.candidate = matched or frame.pending
+
+            elif event == "end":
+                frame = stack.pop()
+                parent = stack[-1]
+                if frame.pending:
+                    context.node = element
+                    if steps[-1].check(element, parent, context, True):
+                        if self.target == "element":
+                            yield element
+                        elif self.target == "text":
+                            for node in get_child_text_nodes(element):
+                                yield node
+                        else:
+                            for node in self.attribute.select(element,
+                                                              context):
+                                yield node
+                elif frame.candidate:
+                    if self.target == "element":
+                        yield element
+                    else:
+                        for node in get_child_text_nodes(element):
+                            yield node
+
+                if not frame.held and parent.element is not None:
+                    _detach(parent.element, element)
+
+    def _advance(self, parent, frame, context):
+        # Find the steps matched by the element of frame, a child of
+        # the element of parent.
+        steps = self.steps
+        n = len(steps)
+        element = frame.element
+        carry = list(parent.carry)
+        candidates = []
+        for i in parent.states:
+            if i == n:
+                continue
+            if steps[i].axis == "child":
+                candidates.append(i)
+            elif steps[i].axis != "self" and i not in carry:
+                carry.append(i)
+        frame.carry = carry
+
+        states = []
+        for i in candidates + carry:
+            step = steps[i]
+            if step.axis == "descendant-or-self":
+                states.append(i + 1)
+            elif step.test(element.tag):
+                context.node = element
+                if step.check(element, parent, context, False):
+                    if step.end:
+                        frame.pending = True
+                    else:
+                        states.append(i + 1)
+        frame.states = self._closure(states)
+
+    def _closure(self, states):
+        # Add the states reached through "." and the self part of "//".
+        steps = self.steps
+        result = []
+        states = list(states)
+        while states:
+            i = states.pop()
+            if i in result:
+                continue
+            result.append(i)
+            if i < len(steps) and steps[i].axis in ("self",
+                                                    "descendant-or-self"):
+                states.append(i + 1)
+        return result
+
+class _Frame:
+    # State of an element whose end tag has not been read yet.
+    def __init__(self, element, parent):
+        self.element = element
+        self.states = []                # steps this element is context for
+        self.carry = []                 # descendant steps of ancestors
+        self.counters = {}              # positions of children, by predicate
+        self.pending = False            # matched, unless end predicates fail
+        self.candidate = False          # subtree must be kept
+        if parent is None:
+            self.held = False
+        else:
+            self.held = parent.held or parent.candidate
+
+class _ElementStep:
+    def __init__(self, node, namespace_mapping, is_last):
+        self.axis = node.axis
+        if node.axis in ("self", "descendant-or-self"):
+            if not isinstance(node.node_test, NodeType) \
+                   or node.node_test.name != "node" or node.predicate_list:
+                raise XPathNotImplementedError, \
+                      'Only "." and "//" supported for the %s axis ' \
+                      'in streaming mode.' % node.axis
+            return
+        if node.axis not in ("child", "descendant"):
+            raise XPathNotImplementedError, \
+                  '"%s" axis not supported in streaming mode.' % node.axis
+        if not isinstance(node.node_test, NameTest):
+            raise XPathNotImplementedError, \
+                  "Only name tests supported for elements in streaming mode."
+        self.test = _make_tag_test(node.node_test, namespace_mapping)
+
+        self.start = []
+        self.end = []
+        for predicate in node.predicate_list:
+            positional = is_positional_predicate(predicate)
+            if positional and node.axis != "child":
+                raise XPathNotImplementedError, \
+                      "Positional predicates only supported on the " \
+                      "child axis in streaming mode."
+            if needs_content(predicate) or self.end:
+                if not is_last:
+                    raise XPathNotImplementedError, \
+                          "Only the last step can look at element " \
+                          "content in streaming mode."
+                predicates = self.end
+            else:
+                predicates = self.start
+            predicates.append((compile_expression(predicate), positional))
+
+    def check(self, element, parent, context, at_end):
+        """
+        Apply the predicates that are evaluated at the start or at
+        the end of the element.
+        """
+        if at_end:
+            predicates = self.end
+            offset = len(self.start)
+        else:
+            predicates = self.start
+            offset = 0
+        counters = parent.counters
+        for k in range(len(predicates)):
+            predicate, positional = predicates[k]
+            if positional:
+                key = (id(self), offset + k)
+                context.position = counters[key] = counters.get(key, 0) + 1
+            else:
+                context.position = 1
+            if not evaluate_predicate(predicate, context):
+                return False
+        return True
+
+class _AttributeStep:
+    def __init__(self, node, namespace_mapping):
+        node_test = node.node_test
+        if not isinstance(node_test, NameTest) or node_test.local_part == '*':
+            raise XPathNotImplementedError, \
+                  "Only named attributes supported in streaming mode."
+        context = Context(None, None, namespace_mapping)
+        self.uri, self.name = node_test.expand(context)
+        self.predicates = []
+        for predicate in node.predicate_list:
+            _check_local(predicate)
+            self.predicates.append(compile_expression(predicate))
+
+    def select(self, element, context):
+        value = get_attribute_value(element, self.uri, self.name)
+        if value is None:
+            return []
+        context.node = value
+        context.position = 1
+        for predicate in self.predicates:
+            if not evaluate_predicate(predicate, context):
+                return []
+        return [value]
+
+def _get_steps(node):
+    steps = []
+    while isinstance(node, LocationStep):
+        steps.append(node)
+        node = node.prefix
+    if node is not None and not isinstance(node, Root):
+        raise XPathNotImplementedError, \
+              "Only location paths supported in streaming mode."
+    steps.reverse()
+    return node is not None, steps
+
+def _make_tag_test(node_test, namespace_mapping):
+    uri, name = node_test.expand(Context(None, None, namespace_mapping))
+    if name is not None:
+        if uri:
+            tag = "{%s}%s" % (uri, name)
+        else:
+            tag = name
+        return lambda x: x == tag
+    elif uri:
+        prefix = "{%s}" % uri
+        return lambda x: isinstance(x, basestring) and x.startswith(prefix)
+    else:
+        return lambda x: isinstance(x, basestring)
+
+# Functions that look at the string value of the context node when
+# called without arguments.
+_content_functions = ["string", "number", "string-length", "normalize-space"]
+
+def needs_content(predicate):
+    """
+    Return true if the predicate must see the complete element, and
+    false if it can be evaluated as soon as the start tag has been
+    read, when only the attributes are known.
+
+    Raises XPathNotImplementedError if the predicate cannot be
+    evaluated in streaming mode at all.
+    """
+    if uses_size(predicate):
+        raise XPathNotImplementedError, \
+              "last() not supported in streaming mode."
+    _check_local(predicate)
+    return _needs_content(predicate)
+
+def _needs_content(node):
+    if isinstance(node, UnaryOp):
+        return _needs_content(node.right)
+    elif isinstance(node, BinaryOp):
+        return _needs_content(node.left) or _needs_content(node.right)
+    elif isinstance(node, FunctionCall):
+        if node.function.prefix:
+            return True
+        name = node.function.local_part
+        if name in _content_functions and not node.argument_list:
+            return True
+        for arg in node.argument_list:
+            if _needs_content(arg):
+                return True
+        return False
+    elif isinstance(node, LocationStep):
+        # An attribute of the context node is known from the start
+        # tag, whatever its predicates are.
+        return node.axis != "attribute" or node.prefix is not None
+    else:
+        return False
+
+_local_axes = ["child", "descendant", "descendant-or-self", "self", "attribute"]
+
+def _check_local(node):
+    # Make sure node only looks at the context node and its subtree.
+    if isinstance(node, Root):
+        raise XPathNotImplementedError, \
+              "Absolute paths in predicates not supported in streaming mode."
+    elif isinstance(node, UnaryOp):
+        _check_local(node.right)
+    elif isinstance(node, BinaryOp):
+        _check_local(node.left)
+        _check_local(node.right)
+    elif isinstance(node, FunctionCall):
+        if node.function.prefix is None \
+               and node.function.local_part == "current":
+            raise XPathNotImplementedError, \
+                  "current() not supported in streaming mode."
+        for arg in node.argument_list:
+            _check_local(arg)
+    elif isinstance(node, LocationStep):
+        if node.axis not in _local_axes:
+            raise XPathNotImplementedError, \
+                  '"%s" axis not supported in streaming mode.' % node.axis
+        if node.prefix is not None:
+            _check_local(node.prefix)
+        for predicate in node.predicate_list:
+            _check_local(predicate)
+
+def _detach(parent, child):
+    # The parser may already have added some of the following
+    # siblings, so the child is not necessarily the last one.
+    parent.remove(child)
@@ -31,8 +31,9 @@ XPath syntax nodes
 """
 
 from edgy.xml.xpath.atoms import *
-from edgy.xml.xpath.evaluate import to_number, to_boolean, compare, do_step, do_function_call
-from edgy.xml.xpath.data_model import is_node_set, join_node_sets
+from edgy.xml.xpath.evaluate import to_number, to_boolean, compare, do_step
+from edgy.xml.xpath.functions import do_function_call
+from edgy.xml.xpath.data_model import is_node_set, union_node_sets
 from edgy.xml.xpath.xpath_exceptions import XPathNotImplementedError, XPathEvaluationError
 
 #
@@ -110,9 +111,7 @@ class BinaryOp:
             x = self.left.evaluate(context)
             y = self.right.evaluate(context)
             if is_node_set(x) and is_node_set(y):
-                # XXX This is incorrect, because it neither preserves
-                # document order nor removes duplicates.
-                return join_node_sets(x, y)
+                return union_node_sets(x, y, context.get_root())
             else:
                 raise XPathEvaluationError, "Operands of '|' must be node sets."
         else:
@@ -27,11 +27,12 @@
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 try:
-    from pdis.lib.element import tostring as element_to_string
+    from xml.etree.ElementTree import tostring as element_to_string
 except ImportError:
     from elementtree.ElementTree import tostring as element_to_string
 
-from pdis.xpath import evaluate
+from edgy.xml import parse
+from edgy.xml.xpath import evaluate, compile, Context, is_node_set
 
 def tostring(x):
     if isinstance(x, (str, unicode)):
@@ -41,6 +42,14 @@ def tostring(x):
     else:
         return element_to_string(x)
 
+# The context nodes of the calls to touch(), which tests register as
+# an extension function to see which predicates get evaluated.
+calls = []
+
+def touch(context):
+    calls.append(context.node)
+    return True
+
 def test_evaluate(path, document):
     """
     >>> test_evaluate("/", "<foo/>")
@@ -131,12 +140,670 @@ def test_evaluate(path, document):
     111.0
     >>> test_evaluate("concat(floor(3.5), ceil(3.5), round(3.5))", "<foo/>")
     344
+    >>> test_evaluate("//b", "<a><b>1</b><c><b>2</b></c></a>")
+    ['<b>1</b>', '<b>2</b>']
+    >>> test_evaluate("count(//c//text())", "<a><c>1<c>2</c>3</c></a>")
+    3.0
+    >>> test_evaluate("/descendant::*", "<a><b><c/></b><d/></a>")
+    ['<a><b><c /></b><d /></a>', '<b><c /></b>', '<c />', '<d />']
+    >>> test_evaluate("count(//node())", "<a>1<b>2</b>3</a>")
+    5.0
+    >>> test_evaluate("/a/b/c/ancestor::*[1]", "<a><b><c/></b><c/></a>")
+    ['<b><c /></b>']
+    >>> test_evaluate("/a/b/c/ancestor::*", "<a><b><c/></b><c/></a>")
+    ['<a><b><c /></b><c /></a>', '<b><c /></b>']
+    >>> test_evaluate("count(//c/ancestor-or-self::node())", "<a><b><c/></b></a>")
+    4.0
+    >>> test_evaluate("//b/following-sibling::*", "<a><b/><c/><b/><d/></a>")
+    ['<c />', '<b />', '<d />']
+    >>> test_evaluate("//d/preceding-sibling::*[1]", "<a><b/><c/><d/></a>")
+    ['<c />']
+    >>> test_evaluate("//d/preceding-sibling::node()", "<a>1<b/>2<c/>3<d/></a>")
+    ['1', '<b />2', '2', '<c />3', '3']
+    >>> test_evaluate("count(/*/..) + count(/..)", "<a/>")
+    1.0
+    >>> test_evaluate("//c/parent::b", "<a><b><c/></b><d><c/></d></a>")
+    ['<b><c /></b>']
     """
     result = evaluate(path, document)
     if isinstance(result, list):
         result = map(tostring, result)
     print result
 
+def test_tree_walker(path, document):
+    """
+    The compiled form of an expression must agree with the syntax
+    tree's own evaluate() methods.
+
+    >>> test_tree_walker("/*/*[@color='red']", "<foo><one>1</one><two color='red'>2</two><three color='blue'>3</three></foo>")
+    True
+    >>> test_tree_walker("/*/*[position() = last()]", "<foo><one>1</one><two>2</two><three>3</three></foo>")
+    True
+    >>> test_tree_walker("/*/node()", "<foo>1<a>2</a>3<b>4</b>5<c>6</c>7</foo>")
+    True
+    >>> test_tree_walker("(/*/one | /*/two)/@color", "<foo><one color='red'/><two color='green'/><three color='blue'/></foo>")
+    True
+    >>> test_tree_walker("-(1 + 2) * 3 mod 4 div 5", "<foo/>")
+    True
+    >>> test_tree_walker("/*/*[. > 1 and . <= 3 or . = 10]", "<foo><a>1</a><b>2</b><c>3</c><d>10</d></foo>")
+    True
+    >>> test_tree_walker("concat(/*/one, '-', /*/*[last()])", "<foo><one>1</one><two>2</two><three>3</three></foo>")
+    True
+    >>> test_tree_walker("//c/ancestor::*[2]/following-sibling::node()", "<a><b><c/></b>x<d><c/></d></a>")
+    True
+    >>> test_tree_walker("//*[descendant::c]", "<a><b><c/></b>x<d><c/></d></a>")
+    True
+    >>> test_tree_walker("//b[c[d][2] and @x = position()]/@x", "<a><b x='1'><c/><c><d/></c><c><d/></c></b><b x='1'><c><d/></c></b><b x='3'><c/><c><d/></c><c><d/></c></b></a>")
+    True
+    """
+    xpath = compile(path)
+    element = parse(document)
+    compiled = xpath.compiled_xpath(Context(element, element))
+    walked = xpath.parsed_xpath.evaluate(Context(element, element))
+    if is_node_set(compiled):
+        return list(compiled) == list(walked)
+    return compiled == walked
+
+def test_functions():
+    """
+    Function names and argument counts are checked when the
+    expression is compiled.
+
+    >>> compile("no-such-function()")
+    Traceback (most recent call last):
+    ...
+    XPathParseError: Unknown function no-such-function().
+    >>> compile("contains('abc')")
+    Traceback (most recent call last):
+    ...
+    XPathParseError: Illegal argument list for contains().
+    >>> test_evaluate("ceiling(3.2)", "<foo/>")
+    4.0
+
+    Extension functions are registered by name.
+
+    >>> from edgy import iso8601
+    >>> from edgy.xml.xpath import register_function, unregister_function
+    >>> from edgy.xml.xpath.evaluate import to_string
+    >>> def date_before(context, x, y):
+    ...     return iso8601.parse(to_string(x)) < iso8601.parse(to_string(y))
+    >>> register_function("date-before", date_before, 2, 2)
+    >>> test_evaluate("/*/clip[date-before(@start, '2008-06-01T00:00:00Z')]/@id", "<list><clip id='a' start='2008-05-01T10:00:00Z'/><clip id='b' start='2008-07-01T10:00:00Z'/></list>")
+    ['a']
+    >>> unregister_function("date-before")
+    """
+
+def test_tag_index():
+    """
+    //name and /descendant::name are answered from a per-document tag
+    index, which must give the same results as walking the tree and
+    must follow changes to the tree.
+
+    >>> from edgy.xml import Element
+    >>> from edgy.xml.xpath import index
+    >>> document = parse("<a><b x='1'/><c><b x='2'/><b/></c><b x='3'/></a>")
+    >>> def both(path):
+    ...     xpath = compile(path)
+    ...     indexed = xpath.evaluate(document)
+    ...     index.enabled = False
+    ...     walked = xpath.evaluate(document)
+    ...     index.enabled = True
+    ...     if not isinstance(indexed, list):
+    ...         assert indexed == walked
+    ...         return indexed
+    ...     # The index gives document order; the tree walk may not.
+    ...     assert sorted(map(id, indexed)) == sorted(map(id, walked))
+    ...     return [x.get("x") for x in indexed]
+    >>> both("//b")
+    ['1', '2', None, '3']
+    >>> both("//b[@x > 1]")
+    ['2', '3']
+    >>> both("//b[1]")
+    ['1', '2']
+    >>> both("/descendant::b[2]")
+    ['2']
+    >>> both("count(//b)")
+    4.0
+    >>> document.getDocumentCache().keys()
+    ['tag-index']
+    >>> document[1].append(Element("b", {"x": "4"}))
+    >>> document.getDocumentCache().keys()
+    []
+    >>> both("//b")
+    ['1', '2', None, '4', '3']
+    >>> document[0].tag = "z"
+    >>> both("//b"), both("count(//z)")
+    (['2', None, '4', '3'], 1.0)
+    """
+
+def test_attribute_index():
+    """
+    Declared attribute value indexes answer equality predicates on
+    the attribute and the id() function, and follow changes to the
+    tree.
+
+    >>> from edgy.xml.xpath import index
+    >>> document = parse("<a><b id='x' src='s'/><c id='y'><b id='z' src='s'/><b src='t'/></c><c id='x'/></a>")
+    >>> def ids(path, variables = None):
+    ...     nodes = compile(path).evaluate(document, variables = variables)
+    ...     walked = compile(path).parsed_xpath.evaluate(
+    ...         Context(document, document, {}, variables or {}))
+    ...     assert map(id, nodes) == map(id, walked)
+    ...     return [x.get("id") for x in nodes]
+    >>> ids("id('z x')"), ids("id(//b/@id)")
+    (['x', 'z'], ['x', 'z'])
+    >>> index.add_attribute_index(document, "id")
+    >>> index.add_attribute_index(document, "src")
+    >>> ids("id('z x')"), ids("id(//b/@id)")
+    (['x', 'z'], ['x', 'z'])
+    >>> ids("//b[@src = 's']")
+    ['x', 'z']
+    >>> ids("//*[@src = $src]", {"src": "s"})
+    ['x', 'z']
+    >>> ids("/descendant::*['x' = @id][2]")
+    ['x']
+    >>> sorted(key for key in document.getDocumentCache() if key[0] == "attribute-index")
+    [('attribute-index', 'id'), ('attribute-index', 'src')]
+    >>> document[1][1].set("src", "s")
+    >>> ids("//b[@src = 's'][not(@id)]")
+    [None]
+    >>> ids("//c[@id = $flag]", {"flag": True})
+    ['y', 'x']
+    >>> index.remove_attribute_index(document, "src")
+    >>> ids("//b[@src = 's']")
+    ['x', 'z', None]
+
+    Changing the attrib dictionary of an element directly is followed
+    as well.
+
+    >>> document[0].attrib["id"] = "w"
+    >>> ids("id('x w')"), ids("//*[@id = 'x']")
+    (['w', 'x'], ['x'])
+    >>> del document[2].attrib["id"]
+    >>> ids("id('x w')")
+    ['w']
+    >>> document[2].attrib.update(id = "v")
+    >>> document[1][0].attrib = {}
+    >>> ids("id('v z')"), ids("//*[@id]")
+    (['v'], ['w', 'y', 'v'])
+    """
+
+def test_other_elements():
+    """
+    Objects of other kinds can be queried through the part of the
+    element interface that the data model uses.
+
+    >>> class Node(object):
+    ...     text = tail = parent = None
+    ...     def __init__(self, tag, attrib, children = (), text = None):
+    ...         self.tag, self.attrib, self.text = tag, attrib, text
+    ...         self.children = list(children)
+    ...         for child in self.children:
+    ...             child.parent = self
+    ...     def get(self, name, default = None):
+    ...         return self.attrib.get(name, default)
+    ...     def __len__(self):
+    ...         return len(self.children)
+    ...     def __iter__(self):
+    ...         return iter(self.children)
+    ...     def __getitem__(self, i):
+    ...         return self.children[i]
+    ...     def index(self, child):
+    ...         return self.children.index(child)
+    >>> document = Node("playlist", {"id": "p"}, [
+    ...     Node("clip", {"src": "a", "length": "10"}, [Node("title", {}, text = "A")]),
+    ...     Node("clip", {"src": "b", "length": "20"}, [Node("title", {}, text = "B")]),
+    ...     Node("clip", {"src": "c", "length": "5"})])
+    >>> def evaluate(path):
+    ...     result = compile(path).evaluate(document)
+    ...     walked = compile(path).parsed_xpath.evaluate(
+    ...         Context(document, document, {}, {}))
+    ...     assert result == walked
+    ...     return result
+    >>> evaluate("/playlist/clip[@length > 6]/@src")
+    ['a', 'b']
+    >>> evaluate("sum(//clip/@length)"), evaluate("string(/playlist)")
+    (35.0, 'AB')
+    >>> [x.get("src") for x in evaluate("//title/../following-sibling::clip | id('p')")]
+    ['b', 'c', None]
+    >>> evaluate("//clip[title = 'B']/preceding-sibling::*/@src")
+    ['a']
+    """
+
+def test_streaming_predicates():
+    """
+    Predicates that do not use last() are evaluated as the nodes of a
+    step are generated, so a position picks its node without looking
+    at the rest.
+
+    >>> from edgy.xml.xpath import register_function, unregister_function
+    >>> del calls[:]
+    >>> register_function("touch", touch, 0, 0, result_type = "boolean")
+    >>> document = "<a>%s</a>" % ("<b/><c/>" * 100)
+    >>> test_evaluate("count(/a/b[touch()][2])", document)
+    1.0
+    >>> len(calls)
+    2
+    >>> del calls[:]
+    >>> test_evaluate("count(/a/b[touch()][position() < 4])", document)
+    3.0
+    >>> len(calls)
+    3
+    >>> del calls[:]
+    >>> test_evaluate("count(/a/node()[touch()][last()])", document)
+    1.0
+    >>> len(calls)
+    200
+    >>> del calls[:]
+    >>> test_evaluate("count(/a/*[touch() and position() = last() - 1])", document)
+    1.0
+    >>> len(calls)
+    200
+    >>> unregister_function("touch")
+    >>> test_evaluate("/a/b[position() <= 2.5]/text()", "<a><b>1</b><b>2</b><b>3</b></a>")
+    ['1', '2']
+    >>> test_evaluate("/a/b[3 > position()][last()]/text()", "<a><b>1</b><b>2</b><b>3</b></a>")
+    ['2']
+    >>> test_evaluate("name(//e/preceding-sibling::*[position() < 3][c])", "<a><b><c/></b><d/><e/></a>")
+    b
+    >>> test_tree_walker("//e/preceding-sibling::*[position() < 3][c]", "<a><b><c/></b><d/><e/></a>")
+    True
+    """
+
+def test_iterate():
+    """
+    Location steps generate their nodes lazily, so iterate() and
+    existence checks only find as many nodes as they need.
+
+    >>> from edgy.xml.xpath import register_function, unregister_function
+    >>> del calls[:]
+    >>> register_function("touch", touch, 0, 0, result_type = "boolean")
+    >>> document = parse("<a><b>1</b><b>2</b><b>3</b><b>4</b></a>")
+    >>> nodes = compile("/a/b[touch()]/text()").iterate(document)
+    >>> nodes.next(), nodes.next()
+    ('1', '2')
+    >>> len(calls)
+    2
+    >>> del calls[:]
+    >>> compile("/a/b[touch()] = 2").evaluate(document)
+    True
+    >>> len(calls)
+    2
+    >>> del calls[:]
+    >>> compile("/a/b[touch()] > 5 or //b[touch()]").evaluate(document)
+    True
+    >>> len(calls)
+    5
+    >>> del calls[:]
+    >>> compile("count(/a/b[touch()])").evaluate(document)
+    4.0
+    >>> len(calls)
+    4
+    >>> unregister_function("touch")
+    >>> list(compile("//b[. > 2]/text()").iterate(document))
+    ['3', '4']
+    >>> compile("count(//b)").iterate(document)
+    Traceback (most recent call last):
+    ...
+    XPathEvaluationError: Expression does not evaluate to a node set.
+
+    >>> from edgy.xml.xpath import NodeSet
+    >>> nodes = NodeSet(iter("abc"))
+    >>> bool(nodes), nodes[1], nodes
+    (True, 'b', NodeSet(['a', 'b'] + ...))
+    >>> list(nodes), len(nodes), nodes[-1]
+    (['a', 'b', 'c'], 3, 'c')
+    >>> bool(NodeSet([]))
+    False
+    """
+
+def test_xpath_set():
+    """
+    An XPathSet gives the same results as evaluating each expression
+    on its own, but computes common location steps only once.
+
+    >>> from edgy.xml.xpath import XPathSet, register_function, unregister_function
+    >>> document = parse("<event xmlns:x='urn:x'><type>alarm</type><source id='s1'><x:host>a</x:host><host>b</host></source><type>clear</type></event>")
+    >>> expressions = ["/event/type", "/event/type = 'clear'",
+    ...                "/event/source/@id", "/event/source/host/text()",
+    ...                "/event/source/x:host/text()", "/*/*[1]/text()",
+    ...                "count(//type)", "//type[. = /event/type[2]]/text()",
+    ...                "/event/nothing", "string(/event/source/host)"]
+    >>> xpaths = XPathSet()
+    >>> for expression in expressions:
+    ...     index = xpaths.add(expression, {"x": "urn:x"})
+    >>> results = xpaths.evaluate(document)
+    >>> [compile(expression, {"x": "urn:x"}).evaluate(document)
+    ...  for expression in expressions] == results
+    True
+    >>> results[1:]
+    [True, ['s1'], ['b'], ['a'], ['alarm'], 2.0, ['clear'], [], 'b']
+
+    >>> del calls[:]
+    >>> register_function("touch", touch, 0, 0, result_type = "boolean")
+    >>> xpaths = XPathSet(["/event/type[touch()]", "/event/type[touch()] = 'x'",
+    ...                    "count(/event/type[touch()])"])
+    >>> xpaths.evaluate(document)[1:]
+    [False, 2.0]
+    >>> len(calls)
+    2
+    >>> unregister_function("touch")
+
+    Sibling steps are only found together for expressions with the
+    same namespace mapping, and prefixes can be bound to any URI.
+
+    >>> def both(document, expressions):
+    ...     xpaths = XPathSet()
+    ...     for expression, mapping in expressions:
+    ...         index = xpaths.add(expression, mapping)
+    ...     return (xpaths.evaluate(document),
+    ...             [compile(expression, mapping).evaluate(document)
+    ...              for expression, mapping in expressions])
+    >>> document = parse("<doc xmlns='urn:1'><x/><y/></doc>")
+    >>> both(document, [("count(/a:doc/a:x)", {"a": "urn:1"}),
+    ...                 ("count(/b:doc/b:y)", {"b": "urn:1"})])
+    ([1.0, 1.0], [1.0, 1.0])
+    >>> both(document, [("count(/a:doc)", {"a": "urn:1"}),
+    ...                 ("count(/a:doc)", {"a": "urn:2"}),
+    ...                 ("count(/doc)", {})])
+    ([1.0, 0.0, 0.0], [1.0, 0.0, 0.0])
+    >>> mapping = {"a": "urn:1", "b": "urn:1"}
+    >>> both(document, [("count(/a:doc/a:x)", mapping),
+    ...                 ("count(/b:doc/b:x)", mapping),
+    ...                 ("count(/a:doc/b:y)", mapping)])
+    ([1.0, 1.0, 1.0], [1.0, 1.0, 1.0])
+    """
+
+def test_variables():
+    """
+    Values can be bound to variables, so that one compiled expression
+    serves them all.
+
+    >>> document = parse("<list><asset id='a' size='1'>A</asset><asset id='b' size='20'>B</asset></list>")
+    >>> xpath = compile("//asset[@id = $id]/text()")
+    >>> xpath.evaluate(document, variables = {"id": "b"})
+    ['B']
+    >>> compile("//asset[@id = $id]/text()") is xpath
+    True
+    >>> xpath.evaluate(document, variables = {"id": "a"})
+    ['A']
+    >>> compile("//asset[@size > $size]/@id").evaluate(document, variables = {"size": 5})
+    ['b']
+    >>> compile("/list/asset[$n]/@id").evaluate(document, variables = {"n": 2})
+    ['b']
+    >>> compile("$flag and count($assets) = 1").evaluate(document, variables = {"flag": True, "assets": document[0]})
+    True
+    >>> compile("$x:v", {"x": "urn:x"}).evaluate(document, variables = {"{urn:x}v": "prefixed"})
+    'prefixed'
+    >>> compile("//asset[. = $missing]").evaluate(document)
+    Traceback (most recent call last):
+    ...
+    XPathEvaluationError: Unbound variable $missing.
+    >>> compile("$x").evaluate(document, variables = {"x": object()}) # doctest: +ELLIPSIS
+    Traceback (most recent call last):
+    ...
+    XPathEvaluationError: Cannot convert <object object at ...> to an XPath value.
+    >>> context = Context(document, document, None, {"id": "a"})
+    >>> xpath.parsed_xpath.evaluate(context)
+    ['A']
+    """
+
+def test_string_values():
+    """
+    String values and their conversions to numbers are cached on the
+    elements, and cleared when an element or its descendants change.
+
+    >>> from edgy.xml import Element
+    >>> from edgy.xml.xpath.evaluate import to_numbers
+    >>> document = parse("<a><b>1<c>2</c></b><b>30</b></a>")
+    >>> compile("sum(/a/b)").evaluate(document)
+    42.0
+    >>> document[0]._stringValue, document[0]._numberValue
+    ('12', 12.0)
+    >>> document[0][0].text = "5"
+    >>> document[0]._stringValue, document._stringValue
+    (None, None)
+    >>> compile("sum(/a/b)").evaluate(document)
+    45.0
+    >>> document[0][0].tail = "0"
+    >>> compile("/a/b[. > 100]").evaluate(document)[0] is document[0]
+    True
+    >>> document[1].append(Element("c"))
+    >>> document[1][0].text = "1"
+    >>> compile("string(/a)").evaluate(document)
+    '150301'
+    >>> to_numbers(document)
+    [150.0, 301.0]
+    >>> to_numbers([document[0], "7"])
+    [150.0, 7.0]
+    """
+
+def test_document_order():
+    """
+    Unions are in document order without duplicates, and sibling axes
+    look up positions in the document order, which follows changes to
+    the tree.
+
+    >>> from edgy.xml import Element
+    >>> document = parse("<a><b n='1'/><c n='2'><b n='3'/></c><b n='4'/><c n='5'/></a>")
+    >>> def n(path):
+    ...     return [x.get("n") for x in compile(path).evaluate(document)]
+    >>> n("//c | //b")
+    ['1', '2', '3', '4', '5']
+    >>> n("/a/c | /a/*[2] | //b[1]")
+    ['1', '2', '3', '5']
+    >>> n("/a/b[2]/preceding-sibling::* | /a/c/following-sibling::c")
+    ['1', '2', '5']
+    >>> compile("count(/ | /a | / | //*)").evaluate(document)
+    7.0
+    >>> compile("/a/b/@n | /a/c/@n").evaluate(document)
+    ['1', '4', '2', '5']
+    >>> document.insert(0, Element("c", {"n": "0"}))
+    >>> n("/a/b[1]/preceding-sibling::c | //b")
+    ['0', '1', '3', '4']
+    >>> document.index(document[3])
+    3
+
+    Only adding elements changes the order, and only the added ones
+    are numbered.
+
+    >>> order = document.getDocumentOrder()
+    >>> before = dict(order)
+    >>> document[2].text = "changed"
+    >>> document[2].insert(0, Element("b", {"n": "2.5"}))
+    >>> document[2][1].append(Element("b", {"n": "3.5"}))
+    >>> n("//b | //c")
+    ['0', '1', '2', '2.5', '3', '3.5', '4', '5']
+    >>> document.getDocumentOrder() is order
+    True
+    >>> [x for x in before if before[x] != order[x]]
+    []
+    >>> del document[2]
+    >>> len(order), n("/a/*[1]/following-sibling::*")
+    (5, ['1', '4', '5'])
+    >>> document.index(Element("b")) # doctest: +ELLIPSIS
+    Traceback (most recent call last):
+    ...
+    ValueError: <Element 'b' at ...> is not in list
+    """
+
+def test_result_cache():
+    """
+    Results evaluated with cached = True are reused until the document
+    is modified.
+
+    >>> document = parse("<config><port name='a'>80</port><port name='b'>443</port></config>")
+    >>> xpath = compile("/config/port[@name = $name]")
+    >>> port = xpath.evaluate(document, variables = {"name": "b"}, cached = True)
+    >>> port[0].text
+    '443'
+    >>> port.append("x")
+    >>> len(xpath.evaluate(document, variables = {"name": "b"}, cached = True))
+    1
+    >>> len(document.getDocumentCache()["xpath-results"])
+    1
+    >>> compile("sum(port)").evaluate(document, cached = True)
+    523.0
+    >>> compile("number(.)").evaluate(document[1], cached = True)
+    443.0
+    >>> document[1].text = "8080"
+    >>> document.getDocumentCache().keys()
+    []
+    >>> compile("sum(port)").evaluate(document, cached = True)
+    8160.0
+    >>> compile("count($ports)").evaluate(document, variables = {"ports": [document[0]]}, cached = True)
+    1.0
+    >>> len(document.getDocumentCache()["xpath-results"])
+    1
+    >>> compile("number(.)").evaluate(document[1], cached = True)
+    8080.0
+
+    Only the most recently used results are kept.
+
+    >>> from edgy.xml.xpath import set_result_cache_size
+    >>> set_result_cache_size(2)
+    >>> compile("sum(port)").evaluate(document, cached = True)
+    8160.0
+    >>> compile("count(port)").evaluate(document, cached = True)
+    2.0
+    >>> results = document.getDocumentCache()["xpath-results"]
+    >>> [xpath.xpath for xpath, root, node, variables in results]
+    ['sum(port)', 'count(port)']
+    >>> set_result_cache_size(100)
+    """
+
+def test_corpus():
+    """
+    A corpus selects the documents an expression is true for, looking
+    up what it can in its indexes and evaluating the rest.
+
+    >>> from edgy.xml.xpath import Corpus
+    >>> corpus = Corpus()
+    >>> for text in ["<asset id='a' type='movie'><title>Up</title><rating>4</rating></asset>",
+    ...              "<asset id='b' type='clip'><title>Up</title><rating>2</rating></asset>",
+    ...              "<asset id='c' type='movie'><title>Cars</title><tags><tag>kids</tag></tags></asset>",
+    ...              "<series id='d'><asset type='movie'><title>Up</title></asset></series>"]:
+    ...     key = corpus.add(parse(text))
+    >>> def ids(xpath, variables = None):
+    ...     return [x.get("id") for x in corpus.select(xpath, variables)]
+    >>> ids("/asset[@type = 'movie']"), ids("//asset[title = 'Up']")
+    (['a', 'c'], ['a', 'b', 'd'])
+    >>> ids("title = $title or .//tag = 'kids'", {"title": "Up"})
+    ['a', 'b', 'c']
+    >>> ids("@type = 'movie' and rating > 3")
+    ['a']
+    >>> print corpus.explain("@type = 'movie' and rating > 3")
+    2 of 4 documents
+    evaluate (child::rating > 3.0)
+    >>> print corpus.explain("//asset[@type = 'movie' and title = 'Up']")
+    2 of 4 documents
+    evaluate /descendant-or-self::node()/child::asset[((attribute::type = "movie") and (child::title = "Up"))]
+    >>> print corpus.explain("/asset[@type = 'movie' and title = 'Up']")
+    1 of 4 documents
+    >>> ids("not(tags)")
+    ['a', 'b', 'd']
+    >>> corpus[0].find("title").text = "Cars"
+    >>> corpus.update(0)
+    >>> corpus.remove(2)
+    >>> ids("title = 'Cars'"), len(corpus)
+    (['a'], 3)
+    """
+
+def test_reordering():
+    """
+    When reordering is turned on, operands of "and" and "or", and
+    runs of predicates, are evaluated in the order measured to be
+    fastest, when none of them may fail.
+
+    >>> from edgy.xml.xpath import XPath, compiler
+    >>> from edgy.xml.xpath.analysis import may_fail
+    >>> [may_fail(compile(x).parsed_xpath) for x in
+    ...  ["contains(., 'x') and @type = 'a'", "count(b) > 1", "@n > 1", "$x or b", "p:b"]]
+    [False, False, True, True, True]
+    >>> document = parse("<a>%s</a>" % "".join(
+    ...     "<b n='%d'>%s</b>" % (i, "x" * (i % 7)) for i in range(200)))
+    >>> expressions = ["count(b[@n = '3' or string-length() > 3])",
+    ...                "count(b[contains(., 'xxxxx') and @n = '12'])",
+    ...                "count(b[normalize-space()][@n != '5'][. = 'xx'])",
+    ...                "count(b[@n > 100 and . = 'x'])"]
+    >>> [XPath(x).evaluate(document) for x in expressions]
+    [85.0, 1.0, 29.0, 14.0]
+    >>> compiler.reordering = True
+    >>> [XPath(x).evaluate(document) for x in expressions]
+    [85.0, 1.0, 29.0, 14.0]
+
+    Operands after the one that ends the evaluation are not evaluated
+    while the order is measured either.
+
+    >>> order = compiler.OperandOrder([lambda c: False, lambda c: 1 / 0], False)
+    >>> [order.measure(None) for i in range(order.sample_size - 1)][-1]
+    False
+    >>> order.decisions, order.times[1]
+    ([31, 0], 0.0)
+    >>> compiler.reordering = False
+    """
+
+def test_profiler():
+    """
+    A Profiler counts the nodes going in and out of each location
+    step and the evaluations of each part of the expression.
+
+    >>> from edgy.xml.xpath import XPath, Profiler
+    >>> document = parse("<a><b x='1'><c/></b><b x='2'/><b x='3'><c/></b></a>")
+    >>> xpath = XPath("count(/a/b[@x > 1][c])")
+    >>> profiler = Profiler()
+    >>> xpath.evaluate(document, profiler = profiler)
+    1.0
+    >>> xpath.evaluate(document, profiler = profiler)
+    1.0
+    >>> record = profiler.get_record(xpath.parsed_xpath.argument_list[0])
+    >>> record.input, record.output
+    (2, 2)
+    >>> print profiler.report() # doctest: +ELLIPSIS
+    count(/child::a/child::b[(attribute::x > 1.0)][child::c])  calls 2, ... ms
+      /child::a  in 2, out 2, ... ms
+      child::b[(attribute::x > 1.0)][child::c]  in 2, out 2, predicates 10, ... ms
+        (attribute::x > 1.0)  calls 6, ... ms
+          attribute::x  in 6, out 6, ... ms
+        child::c  in 4, out 2, ... ms
+    """
+
+def test_cache():
+    """
+    compile() keeps the most recently used expressions, including
+    those with a namespace mapping.
+
+    >>> from edgy.xml.xpath import XPathCache
+    >>> cache = XPathCache(2)
+    >>> a = cache.get("/a", {"x": "urn:x"})
+    >>> cache.get("/a", {"x": "urn:x"}) is a
+    True
+    >>> cache.get("/a", {"x": "urn:y"}) is a
+    False
+    >>> b = cache.get("/b")
+    >>> cache.get("/a", {"x": "urn:x"}) is a
+    False
+    >>> sorted(cache.info().items())
+    [('evictions', 2), ('hits', 1), ('length', 2), ('misses', 4), ('size', 2)]
+
+    The syntax trees of the cached expressions can be saved and loaded
+    by another cache, which then does not parse them again.
+
+    >>> from cStringIO import StringIO
+    >>> file = StringIO()
+    >>> cache.save(file)
+    >>> file.seek(0)
+    >>> other = XPathCache()
+    >>> other.load(file)
+    >>> sorted(other._trees)
+    ['/a', '/b']
+    >>> b = other.get("/b")
+    >>> b.parsed_xpath is other._trees["/b"]
+    True
+    >>> b.evaluate(parse("<b>x</b>"))[0].text
+    'x'
+    """
+
 def _test():
     import doctest
     doctest.testmod()
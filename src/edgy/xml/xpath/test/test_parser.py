@@ -28,7 +28,7 @@
 
 def test_parser():
     """
-    >>> from pdis.xpath.parser import parse_xpath as parse
+    >>> from edgy.xml.xpath.parser import parse_xpath as parse
     >>> print parse("/")
     /
     >>> print parse("foo")
@@ -114,6 +114,111 @@ def test_parser():
     (((- 1.0) * (- (2.0 | 3.0))) * (- ((2.0 | 3.0) | 4.0)))
     """
 
+def test_optimizer():
+    """
+    >>> from edgy.xml.xpath.parser import parse_xpath as parse
+    >>> from edgy.xml.xpath.optimizer import optimize
+    >>> def show(s):
+    ...     print optimize(parse(s))
+    >>> show("1 + 2 * 3")
+    7.0
+    >>> show("concat('a', 1 + 1)")
+    "a2"
+    >>> show("not(true())")
+    false()
+    >>> show("not(not(foo))")
+    boolean(child::foo)
+    >>> show("boolean(foo = 1)")
+    (child::foo = 1.0)
+    >>> show("foo = true()")
+    boolean(child::foo)
+    >>> show("false() = foo")
+    not(child::foo)
+    >>> show("true() and foo")
+    boolean(child::foo)
+    >>> show("foo and false()")
+    (child::foo and false())
+    >>> show("foo[position() = 2]")
+    child::foo[2.0]
+    >>> show("foo[position() = last()]")
+    child::foo[last()]
+    >>> show("foo[true()][boolean(bar)][boolean(1 + 1)]")
+    child::foo[child::bar]
+    >>> show("1 div 0")
+    (1.0 div 0.0)
+    >>> show("f(1 + 2)")
+    f(3.0)
+    """
+
+def test_lexer():
+    """
+    The regular expression tokenizer must agree with the portable one.
+
+    >>> from edgy.xml.xpath.lexer import split_tokens, split_tokens_portable
+    >>> def same(s):
+    ...     def describe(tokens):
+    ...         return [(t.__class__.__name__, str(t)) for t in tokens]
+    ...     return describe(split_tokens(s)) == describe(split_tokens_portable(s))
+    >>> same("//a/b[@c = 'x']/following-sibling::*[1]")
+    True
+    >>> same("1 * -2 * --3 * ---4 div .5 mod 3.")
+    True
+    >>> same("* * * | x:* | x:y/z | $v + $p:q")
+    True
+    >>> same(" count ( //x ) != processing-instruction('w') and a-b or a - b")
+    True
+    >>> for t in split_tokens("a:f(text(), ..)"): print repr(str(t)), t.__class__.__name__
+    'a:f' FunctionName
+    '(' str
+    'text' NodeType
+    '(' str
+    ')' str
+    ',' str
+    '..' str
+    ')' str
+    >>> split_tokens("a b")
+    Traceback (most recent call last):
+    ...
+    XPathParseError: Expected an operator name, not "b".
+    >>> split_tokens("foo::x")
+    Traceback (most recent call last):
+    ...
+    XPathParseError: Expected an axis name, not "foo".
+    >>> split_tokens("'abc")
+    Traceback (most recent call last):
+    ...
+    XPathParseError: Unmatched quote character.
+    """
+
+def test_serialize():
+    """
+    Syntax trees survive being saved and loaded.
+
+    >>> from cStringIO import StringIO
+    >>> from edgy.xml.xpath.parser import parse_xpath as parse
+    >>> from edgy.xml.xpath.serialize import \\
+    ...      dump_tree, load_tree, save_trees, load_trees, FORMAT_VERSION
+    >>> expressions = ["/a//b[@c = 'x'][2]/following-sibling::*[last()]",
+    ...                "-$p:v div 2 mod count(x:*) | ../text()",
+    ...                "processing-instruction('w') or f(1, \\"'\\")",
+    ...                u"concat(., '\\xe5')"]
+    >>> trees = dict((e, parse(e)) for e in expressions)
+    >>> for e in expressions:
+    ...     data = dump_tree(trees[e])
+    ...     assert dump_tree(load_tree(data)) == data
+    >>> file = StringIO()
+    >>> save_trees(file, trees)
+    >>> file.seek(0)
+    >>> loaded = load_trees(file)
+    >>> sorted(loaded) == sorted(expressions)
+    True
+    >>> print loaded["-$p:v div 2 mod count(x:*) | ../text()"]
+    (((- $p:v) div 2.0) mod (count(child::x:*) | parent::node()/child::text()))
+    >>> import marshal
+    >>> load_trees(StringIO(marshal.dumps((FORMAT_VERSION + 1, {}))))
+    {}
+    """
+
 def _test():
     import doctest
     doctest.testmod()
@@ -0,0 +1,105 @@
+#
+# edgy.xml.xpath.test.test_stream
+#
+# Copyright (C) 2008 Edgeware AB.
+#
+
+from cStringIO import StringIO
+
+from edgy.xml import parse
+from edgy.xml.xpath import compile
+from edgy.xml.xpath.stream import iterfind, StreamingXPath
+
+catalog = """<catalog xmlns:x='urn:x'>
+<product id='1' status='active'><name>A</name><price>5</price></product>
+<group>
+ <product id='2' status='old'><name>B</name><price>15</price></product>
+ <product id='3' status='active'><name>C</name><price>25</price>
+  <product id='4' status='active'><name>D</name></product>
+ </product>
+</group>
+<x:product id='5'/>
+<product id='6'/>
+</catalog>"""
+
+def describe(node):
+    if isinstance(node, basestring):
+        return node
+    return node.get("id")
+
+def test_stream(path, document = catalog):
+    """
+    Stream the document through path and compare with evaluating
+    path against the parsed document, which may find the nodes in
+    another order.
+
+    >>> test_stream("/catalog//product[@status = 'active']")
+    ['1', '4', '3']
+    >>> test_stream("//product/@id")
+    ['1', '2', '3', '4', '6']
+    >>> test_stream("/catalog/product[2]/@id")
+    ['6']
+    >>> test_stream("//product[price > 10]/@id")
+    ['2', '3']
+    >>> test_stream("/catalog/group//name/text()")
+    ['B', 'C', 'D']
+    >>> test_stream("product/@id")
+    ['1', '6']
+    >>> test_stream("//x:product/@id")
+    ['5']
+    >>> test_stream("/catalog/*[@id][position() < 3]")
+    ['1', '5']
+    >>> test_stream("//product[@status = 'active'][price < 20 or not(price)]")
+    ['1', '4']
+    >>> test_stream("//p[1]", "<c><p id='1'><p id='2'/><q/><p id='3'/></p><r><q/><p id='5'/></r></c>")
+    ['2', '1', '5']
+    """
+    mapping = {"x": "urn:x"}
+    streamed = map(describe, iterfind(path, StringIO(document), mapping))
+    evaluated = map(describe, compile(path, mapping).evaluate(parse(document)))
+    if sorted(streamed) != sorted(evaluated):
+        print "Mismatch:", evaluated
+    return streamed
+
+def test_memory():
+    """
+    Elements that cannot match are removed from the tree, and matched
+    elements once the next one is asked for.  Only the elements that
+    the parser has read ahead are left.
+
+    >>> document = "<a>%s</a>" % ("<b><c>1</c></b><b><c>2</c></b>" * 10000)
+    >>> sizes = []
+    >>> for c in iterfind("/a/b/c[. = 2]", StringIO(document)):
+    ...     sizes.append(len(c.getRoot()))
+    >>> len(sizes), max(sizes) < 2000
+    (10000, True)
+    >>> c.parent is None
+    True
+    """
+
+def test_unsupported():
+    """
+    >>> StreamingXPath("//product[last()]")
+    Traceback (most recent call last):
+    ...
+    XPathNotImplementedError: last() not supported in streaming mode.
+    >>> StreamingXPath("/catalog/product/..")
+    Traceback (most recent call last):
+    ...
+    XPathNotImplementedError: "parent" axis not supported in streaming mode.
+    >>> StreamingXPath("//product[name]/name")
+    Traceback (most recent call last):
+    ...
+    XPathNotImplementedError: Only the last step can look at element content in streaming mode.
+    >>> StreamingXPath("count(//product)")
+    Traceback (most recent call last):
+    ...
+    XPathNotImplementedError: Only location paths supported in streaming mode.
+    """
+
+def _test():
+    import doctest
+    doctest.testmod()
+
+if __name__ == "__main__":
+    _test()